@@ -0,0 +1,91 @@
+"""
+API 请求/响应模型
+网关与各兼容服务共用
+"""
+
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class ImageGenerationRequest(BaseModel):
+    """图片生成请求模型（Qwen Image）"""
+    prompt: str = Field(..., description="生成图片的提示词", min_length=1)
+    seed: Optional[int] = Field(None, description="随机种子，不指定则随机生成")
+    steps: int = Field(20, description="采样步数", ge=1, le=150)
+    cfg: float = Field(2.5, description="CFG 系数", ge=0.0, le=30.0)
+    width: int = Field(1328, description="图片宽度", ge=512, le=2048)
+    height: int = Field(1328, description="图片高度", ge=512, le=2048)
+    sampler_name: str = Field("euler", description="采样器名称")
+    scheduler: str = Field("simple", description="调度器")
+
+
+class ImageGenerationResponse(BaseModel):
+    """图片生成响应模型"""
+    prompt_id: str = Field(..., description="任务提示ID")
+    status: str = Field(..., description="任务状态")
+    message: str = Field(..., description="响应消息")
+
+
+class TaskStatusResponse(BaseModel):
+    """任务状态响应模型"""
+    prompt_id: str
+    status: str
+    progress: Optional[float] = None
+    images: Optional[list] = None
+    error: Optional[str] = None
+    eta_seconds: Optional[float] = None
+    previews: Optional[list] = None
+
+
+class BatchStatusRequest(BaseModel):
+    """批量状态查询请求模型"""
+    prompt_ids: List[str] = Field(..., description="任务ID列表", min_length=1, max_length=1000)
+
+
+class VideoGenerationRequest(BaseModel):
+    """视频生成请求模型（Image to Video KSampler Advanced）"""
+    image_filename: str = Field(..., description="上传到 ComfyUI 的图片文件名")
+    prompt: str = Field(..., description="正向提示词", min_length=1)
+    width: int = Field(768, description="视频宽度", ge=512, le=1920)
+    height: int = Field(768, description="视频高度", ge=512, le=1920)
+    length: int = Field(81, description="视频帧数", ge=16, le=240)
+    steps: int = Field(15, description="采样步数", ge=10, le=50)
+    cfg: float = Field(3.5, description="CFG 系数", ge=1.0, le=20.0)
+    noise_seed: Optional[int] = Field(None, description="随机种子")
+    fps: int = Field(16, description="帧率", ge=8, le=60)
+
+
+class Wan22VideoGenerationRequest(BaseModel):
+    """视频生成请求模型（Wan2.2 I2V 14B 4-steps）"""
+    image_filename: str = Field(..., description="上传到 ComfyUI 的图片文件名")
+    prompt: str = Field(..., description="正向提示词", min_length=1)
+    width: int = Field(1280, description="视频宽度", ge=512, le=1920)
+    height: int = Field(720, description="视频高度", ge=512, le=1920)
+    length: int = Field(81, description="视频帧数", ge=16, le=240)
+    steps: int = Field(4, description="采样步数（推荐4步）", ge=1, le=20)
+    cfg: float = Field(1.0, description="CFG 系数（推荐1.0）", ge=0.5, le=10.0)
+    noise_seed: Optional[int] = Field(None, description="随机种子")
+    fps: int = Field(16, description="帧率", ge=8, le=60)
+
+
+class VideoGenerationResponse(BaseModel):
+    """视频生成响应模型"""
+    prompt_id: str = Field(..., description="任务提示ID")
+    status: str = Field(..., description="任务状态")
+    message: str = Field(..., description="响应消息")
+
+
+class PromptEnhanceRequest(BaseModel):
+    """提示词优化请求模型"""
+    user_prompt: str = Field(..., description="用户输入的简单提示词", min_length=1)
+    temperature: float = Field(0.7, description="生成温度", ge=0.0, le=2.0)
+    max_tokens: int = Field(2000, description="最大生成token数", ge=100, le=4000)
+
+
+class PromptEnhanceResponse(BaseModel):
+    """提示词优化响应模型"""
+    original_prompt: str = Field(..., description="原始提示词")
+    enhanced_prompt: str = Field(..., description="优化后的提示词")
+    status: str = Field(..., description="处理状态")
+    message: str = Field(..., description="响应消息")
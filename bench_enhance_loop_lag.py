@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+提示词优化的事件循环延迟测试
+
+并发调用 MoonshotEnhancer.enhance（带大图片），同时用一个 1 毫秒的定时协程测量事件循环延迟，
+对比 base64 / JSON 序列化在事件循环上执行（inline）和卸载到线程池（offload）两种方式。
+Moonshot API 由 httpx.MockTransport 模拟，不访问网络。
+
+用法:
+    python bench_enhance_loop_lag.py --image-mb 6 --concurrency 8 --rounds 5
+"""
+
+import argparse
+import asyncio
+import base64
+import os
+import statistics
+import time
+from typing import List
+
+import httpx
+
+import offload
+from prompt_enhance import MoonshotEnhancer
+
+TICK = 0.001
+
+
+def mock_moonshot(request: httpx.Request) -> httpx.Response:
+    return httpx.Response(200, json={"choices": [{"message": {"content": "优化后的提示词"}}]})
+
+
+class InlineEnhancer(MoonshotEnhancer):
+    """优化前的实现：base64 编码和 JSON 序列化都在事件循环上执行"""
+
+    async def enhance(self, user_prompt, image_data=None, temperature=0.7, max_tokens=2000):
+        image_base64 = base64.b64encode(image_data).decode("utf-8") if image_data else None
+        payload = self._build_payload(user_prompt, image_base64, temperature, max_tokens)
+        response = await self._get_client().post(self.api_url, json=payload)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+
+async def measure_lag(stop: asyncio.Event, samples: List[float]):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        started = loop.time()
+        await asyncio.sleep(TICK)
+        samples.append(loop.time() - started - TICK)
+
+
+def percentile(values: List[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * q), len(ordered) - 1)]
+
+
+async def run(mode: str, image: bytes, concurrency: int, rounds: int):
+    enhancer_class = InlineEnhancer if mode == "inline" else MoonshotEnhancer
+    enhancer = enhancer_class("sk-bench", "https://moonshot.invalid/v1/chat/completions", "moonshot-v1-8k")
+    enhancer._client = httpx.AsyncClient(transport=httpx.MockTransport(mock_moonshot))
+
+    samples: List[float] = []
+    stop = asyncio.Event()
+    ticker = asyncio.create_task(measure_lag(stop, samples))
+    started = time.perf_counter()
+    for _ in range(rounds):
+        await asyncio.gather(*(enhancer.enhance("一只猫在草地上奔跑", image) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticker
+    await enhancer.close()
+    offload.default_pool.shutdown()
+
+    calls = concurrency * rounds
+    print(
+        f"{mode:8s} 调用 {calls:4d} 次  总耗时 {elapsed:6.2f}s  "
+        f"事件循环延迟 p50 {statistics.median(samples) * 1000:7.2f}ms  "
+        f"p99 {percentile(samples, 0.99) * 1000:7.2f}ms  "
+        f"最大 {max(samples) * 1000:7.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="提示词优化的事件循环延迟测试")
+    parser.add_argument("--image-mb", type=float, default=6.0, help="图片大小（MB）")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发调用数")
+    parser.add_argument("--rounds", type=int, default=5, help="轮数")
+    args = parser.parse_args()
+
+    image = os.urandom(int(args.image_mb * 1024 * 1024))
+    print(f"图片 {args.image_mb}MB，并发 {args.concurrency}，JSON: {'orjson' if offload.orjson else 'json'}")
+    for mode in ("inline", "offload"):
+        asyncio.run(run(mode, image, args.concurrency, args.rounds))
+
+
+if __name__ == "__main__":
+    main()
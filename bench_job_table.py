@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+任务状态表的内存与淘汰开销测试
+
+在内存中登记 N 个已完成的任务（带典型的请求参数、输出描述和节点耗时），用 tracemalloc 统计每个任务占用的字节数，
+对比四种表示：ComfyUI /history 原始 JSON、普通对象（属性字典）、__slots__ 任务，
+以及配置了任务历史时写入历史后释放请求参数和节点耗时的 __slots__ 任务；
+并对比每次轮询扫描全部任务和时间轮两种淘汰方式的耗时。
+
+用法:
+    python bench_job_table.py --jobs 100000
+"""
+
+import argparse
+import gc
+import time
+import tracemalloc
+import uuid
+from typing import Any, Callable, Dict, List
+
+from job_tracker import STATUS_COMPLETED, EvictionWheel, Job
+
+NODES = ("6", "7", "8", "38", "39", "54", "55", "57", "58", "62", "63", "68", "70", "71", "72", "73", "75", "76")
+
+
+class DictJob:
+    """优化前的任务表示：与 Job 字段相同，但属性保存在实例字典中"""
+
+    __init__ = Job.__init__
+
+
+def make_params(i: int) -> Dict[str, Any]:
+    return {
+        "prompt": f"一只橘猫在草地上奔跑，阳光明媚，镜头缓慢推进 #{i}",
+        "negative_prompt": "",
+        "width": 640,
+        "height": 640,
+        "length": 81,
+        "steps": 6,
+        "seed": i,
+        "image_filename": f"{uuid.uuid4().hex}.jpg",
+    }
+
+
+def make_history(i: int, prompt_id: str) -> Dict[str, Any]:
+    """/history/{prompt_id} 返回的一条记录（省略了 prompt 字段中的完整工作流）"""
+    filename = f"video/wan22_{i:05d}_.mp4"
+    return {
+        "prompt": [i, prompt_id, {}, {"client_id": "gateway"}, ["76"]],
+        "outputs": {"76": {"gifs": [{
+            "filename": filename, "subfolder": "video", "type": "output",
+            "format": "video/h264-mp4", "frame_rate": 16.0, "workflow": f"wan22_{i:05d}_.png",
+            "fullpath": f"/ComfyUI/output/{filename}",
+        }]}},
+        "status": {"status_str": "success", "completed": True, "messages": [
+            ["execution_start", {"prompt_id": prompt_id, "timestamp": 1700000000000 + i}],
+            ["execution_cached", {"nodes": [], "prompt_id": prompt_id, "timestamp": 1700000000001 + i}],
+            ["execution_success", {"prompt_id": prompt_id, "timestamp": 1700000400000 + i}],
+        ]},
+        "meta": {"76": {"node_id": "76", "display_node": "76", "parent_node": None, "real_node_id": "76"}},
+    }
+
+
+def fill(job: Any, i: int):
+    job.status = STATUS_COMPLETED
+    job.progress = 100.0
+    job.remote_id = job.prompt_id
+    job.cost = 400.0
+    job.submitted_at = job.created_at
+    job.started_at = job.created_at + 1.0
+    job.finished_at = job.created_at + 400.0
+    job.outputs = [{
+        "filename": f"wan22_{i:05d}_.mp4",
+        "subfolder": "video",
+        "type": "output",
+        "format": "video/h264-mp4",
+        "url": f"http://127.0.0.1:8188/cfui/api/view?filename=wan22_{i:05d}_.mp4&subfolder=video&type=output",
+    }]
+    job.node_timings = {node: 1.5 for node in NODES}
+
+
+def build_history(count: int) -> Dict[str, Any]:
+    table = {}
+    for i in range(count):
+        prompt_id = str(uuid.uuid4())
+        table[prompt_id] = {"params": make_params(i), "history": make_history(i, prompt_id)}
+    return table
+
+
+def build_jobs(job_class: Callable[..., Any], release: bool = False) -> Callable[[int], Dict[str, Any]]:
+    def build(count: int) -> Dict[str, Any]:
+        table = {}
+        for i in range(count):
+            job = job_class(str(uuid.uuid4()), "wan22_i2v", "default", make_params(i), "tenant-a")
+            fill(job, i)
+            if release:
+                # 与 JobTracker(release_details=True) 结束任务时相同
+                job.params = None
+                job.node_timings = None
+            table[job.prompt_id] = job
+        return table
+    return build
+
+
+def measure(name: str, build: Callable[[int], Dict[str, Any]], count: int):
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    table = build(count)
+    gc.collect()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    print(f"{name:18s} {used / count:8.0f} 字节/任务  共 {used / 1024 / 1024:7.1f} MB")
+    del table
+
+
+def bench_eviction(count: int, ttl: float, ticks: int):
+    """任务在 ttl 内均匀结束，每次轮询淘汰到期的任务"""
+    jobs: List[Job] = []
+    now = time.time()
+    for i in range(count):
+        job = Job(str(uuid.uuid4()), "wan22_i2v", "default", {}, "tenant-a")
+        job.status = STATUS_COMPLETED
+        job.finished_at = now - ttl + ttl * i / count
+        jobs.append(job)
+    step = ttl / count * (count // ticks)
+
+    table = {job.prompt_id: job for job in jobs}
+    started = time.perf_counter()
+    for tick in range(ticks):
+        current = now + step * tick
+        for job in list(table.values()):
+            if job.finished and current - job.finished_at > ttl:
+                del table[job.prompt_id]
+    scan = time.perf_counter() - started
+
+    table = {job.prompt_id: job for job in jobs}
+    wheel = EvictionWheel(resolution=min(60.0, max(ttl / 60, 1.0)))
+    for job in jobs:
+        wheel.add(job.prompt_id, job.finished_at + ttl)
+    started = time.perf_counter()
+    for tick in range(ticks):
+        for prompt_id in wheel.expire(now + step * tick):
+            table.pop(prompt_id, None)
+    timed = time.perf_counter() - started
+
+    print(
+        f"淘汰 {count} 个任务（{ticks} 次轮询）: 全量扫描 {scan / ticks * 1000:7.2f}ms/次  "
+        f"时间轮 {timed / ticks * 1000:7.3f}ms/次"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="任务状态表的内存与淘汰开销测试")
+    parser.add_argument("--jobs", type=int, default=100000, help="任务数")
+    parser.add_argument("--ticks", type=int, default=100, help="淘汰测试的轮询次数")
+    args = parser.parse_args()
+
+    print(f"{args.jobs} 个已完成任务")
+    measure("/history 原始 JSON", build_history, args.jobs)
+    measure("属性字典", build_jobs(DictJob), args.jobs)
+    measure("__slots__", build_jobs(Job), args.jobs)
+    measure("__slots__ 已释放", build_jobs(Job, release=True), args.jobs)
+    bench_eviction(args.jobs, ttl=3600.0, ticks=args.ticks)
+
+
+if __name__ == "__main__":
+    main()
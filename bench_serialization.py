@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+状态与列表响应的序列化开销测试
+
+对比几种把任务状态变成响应体的方式，按每 1000 个任务的耗时输出：
+- FastAPI 默认：接口返回字典，jsonable_encoder 遍历后用标准库 json 序列化
+- response_model：先按响应模型校验再序列化（旧的 Qwen 状态接口）
+- FastJSONResponse：直接用 orjson 序列化构造好的字典
+- 分块输出：json_list_response 在条目很多时的 StreamingResponse（逐块序列化）
+
+场景：1000 次单个状态查询、一次 1000 个任务的批量状态、一页 1000 条的任务列表
+
+用法:
+    python bench_serialization.py --jobs 1000 --repeat 20
+"""
+
+import argparse
+import asyncio
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from api_models import TaskStatusResponse
+from fast_json import STREAM_CHUNK_SIZE, FastJSONResponse, _stream_object
+
+NODES = ("6", "7", "8", "38", "39", "54", "55", "57", "58", "62", "63", "68", "70", "71", "72", "73", "75", "76")
+
+
+def make_status(i: int) -> Dict[str, Any]:
+    """旧接口的状态响应（status_payload 的结构）"""
+    prompt_id = str(uuid.uuid4())
+    filename = f"wan22_{i:05d}_.mp4"
+    return {
+        "prompt_id": prompt_id,
+        "status": "completed",
+        "progress": 100.0,
+        "images": [{
+            "filename": filename,
+            "subfolder": "video",
+            "type": "output",
+            "format": "video/h264-mp4",
+            "url": f"http://127.0.0.1:8188/cfui/api/view?filename={filename}&subfolder=video&type=output",
+        }],
+        "error": None,
+        "eta_seconds": None,
+        "previews": [
+            {"kind": "poster", "source": filename, "filename": filename + ".poster.jpg", "size": 10326,
+             "url": f"/artifacts/{prompt_id}/{filename}.poster.jpg"},
+            {"kind": "preview", "source": filename, "filename": filename + ".preview.mp4", "size": 182044,
+             "url": f"/artifacts/{prompt_id}/{filename}.preview.mp4"},
+        ],
+    }
+
+
+def make_record(i: int) -> Dict[str, Any]:
+    """/api/jobs 中的一条记录"""
+    status = make_status(i)
+    return {
+        "prompt_id": status["prompt_id"],
+        "template": "wan22_i2v",
+        "tenant": "tenant-a",
+        "backend": "default",
+        "priority": "async",
+        "status": "completed",
+        "progress": 100.0,
+        "params": {
+            "prompt": f"一只橘猫在草地上奔跑，阳光明媚，镜头缓慢推进 #{i}",
+            "negative_prompt": "", "width": 640, "height": 640, "length": 81, "steps": 6, "seed": i,
+            "image_filename": f"{uuid.uuid4().hex}.jpg",
+        },
+        "outputs": status["images"],
+        "error": None,
+        "cost": 400.0,
+        "created_at": 1700000000.0 + i,
+        "submitted_at": 1700000000.5 + i,
+        "started_at": 1700000001.0 + i,
+        "finished_at": 1700000400.0 + i,
+        "node_timings": {node: 1.5 for node in NODES},
+        "previews": status["previews"],
+    }
+
+
+def render_default(content: Any) -> bytes:
+    return JSONResponse(jsonable_encoder(content)).body
+
+
+def render_fast(content: Any) -> bytes:
+    return FastJSONResponse(content).body
+
+
+async def render_model(field, content: Any) -> bytes:
+    return JSONResponse(await serialize_response(field=field, response_content=content)).body
+
+
+async def render_stream(key: str, items: List[Any]) -> bytes:
+    return b"".join([chunk async for chunk in _stream_object({}, key, items, STREAM_CHUNK_SIZE)])
+
+
+async def timed(func: Callable[[], Any], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = func()
+        if asyncio.iscoroutine(result):
+            await result
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def report(scenario: str, count: int, results: Dict[str, float]):
+    baseline = results["FastAPI 默认"]
+    print(scenario)
+    for name, seconds in results.items():
+        per_k = seconds / count * 1000
+        print(f"  {name:18s} {per_k * 1000:9.2f}ms/1k 任务  {baseline / seconds:6.1f}x")
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="状态与列表响应的序列化开销测试")
+    parser.add_argument("--jobs", type=int, default=1000, help="任务数")
+    parser.add_argument("--repeat", type=int, default=20, help="重复次数（取最快的一次）")
+    args = parser.parse_args()
+
+    statuses = [make_status(i) for i in range(args.jobs)]
+    records = [make_record(i) for i in range(args.jobs)]
+    field = create_response_field(name="response", type_=TaskStatusResponse)
+
+    async def each_model():
+        for status in statuses:
+            await render_model(field, status)
+
+    report(f"{args.jobs} 次单个状态查询", args.jobs, {
+        "FastAPI 默认": await timed(lambda: [render_default(status) for status in statuses], args.repeat),
+        "response_model": await timed(each_model, args.repeat),
+        "FastJSONResponse": await timed(lambda: [render_fast(status) for status in statuses], args.repeat),
+    })
+    report(f"批量状态（{args.jobs} 个任务）", args.jobs, {
+        "FastAPI 默认": await timed(lambda: render_default({"jobs": statuses}), args.repeat),
+        "FastJSONResponse": await timed(lambda: render_fast({"jobs": statuses}), args.repeat),
+        "分块输出": await timed(lambda: render_stream("jobs", statuses), args.repeat),
+    })
+    report(f"任务列表（{args.jobs} 条）", args.jobs, {
+        "FastAPI 默认": await timed(lambda: render_default({"jobs": records, "next_cursor": None}), args.repeat),
+        "FastJSONResponse": await timed(lambda: render_fast({"jobs": records, "next_cursor": None}), args.repeat),
+        "分块输出": await timed(lambda: render_stream("jobs", records), args.repeat),
+    })
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+网关冷启动耗时测试
+
+多次以子进程方式冷启动网关（与 systemd 重启时相同：新的解释器、导入模块、加载模板、打开任务历史、探测后端），
+记录从启动进程到端口可访问（/health/live）和到就绪（/health/ready 返回 200）的时间，
+以及 import gateway 本身的耗时和就绪响应中各启动阶段的耗时；就绪时间的中位数超过预算时以非零状态退出。
+
+需要一个可访问的 ComfyUI（或模拟服务），否则网关不会就绪。
+
+用法:
+    python bench_startup.py --comfyui http://127.0.0.1:8188 --runs 5 --budget 3
+"""
+
+import argparse
+import json
+import os
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+BASE_DIR = Path(__file__).resolve().parent
+
+# 子进程：加载指定的配置并启动网关
+BOOTSTRAP = (
+    "import asyncio, sys\n"
+    "from gateway_config import load_gateway_config\n"
+    "from gateway import serve\n"
+    "asyncio.run(serve(load_gateway_config(sys.argv[1])))\n"
+)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def write_config(directory: Path, comfyui: str, port: int, workers: int) -> Path:
+    path = directory / "config.ini"
+    path.write_text(
+        "[comfyui]\n"
+        f"base_url = {comfyui}\n"
+        "[gateway]\n"
+        "host = 127.0.0.1\n"
+        f"port = {port}\n"
+        "serve_legacy_ports = false\n"
+        f"workers = {workers}\n"
+        f"ipc_socket = {directory / 'gateway.sock'}\n"
+        f"job_db = {directory / 'jobs.db'}\n"
+        "[tenants]\n"
+        "usage_db =\n",
+        encoding="utf-8"
+    )
+    return path
+
+
+def fetch(url: str) -> Tuple[int, Optional[Dict[str, Any]]]:
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        return e.code, None
+    except OSError:
+        return 0, None
+
+
+def measure_import(runs: int) -> float:
+    """import gateway 的耗时（包含解释器启动）"""
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import gateway"], cwd=BASE_DIR, check=True)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def measure_startup(config: Path, port: int, timeout: float) -> Tuple[float, float, Dict[str, float]]:
+    """返回 (端口可访问, 就绪, 各启动阶段耗时)"""
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-c", BOOTSTRAP, str(config)],
+        cwd=BASE_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    live = ready = None
+    phases: Dict[str, float] = {}
+    try:
+        while time.perf_counter() - started < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"网关进程已退出（{process.returncode}）")
+            if live is None:
+                if fetch(base + "/health/live")[0] == 200:
+                    live = time.perf_counter() - started
+            else:
+                status, body = fetch(base + "/health/ready")
+                if status == 200:
+                    ready = time.perf_counter() - started
+                    phases = (body or {}).get("startup") or {}
+                    break
+            time.sleep(0.01)
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+    if ready is None:
+        raise RuntimeError(f"{timeout} 秒内未就绪（ComfyUI 是否可访问？）")
+    return live, ready, phases
+
+
+def main():
+    parser = argparse.ArgumentParser(description="网关冷启动耗时测试")
+    parser.add_argument("--comfyui", default="http://127.0.0.1:8188", help="ComfyUI 地址")
+    parser.add_argument("--runs", type=int, default=5, help="启动次数")
+    parser.add_argument("--workers", type=int, default=1, help="工作进程数")
+    parser.add_argument("--budget", type=float, default=3.0, help="就绪时间预算（秒，取中位数）")
+    parser.add_argument("--timeout", type=float, default=60.0, help="单次启动的超时（秒）")
+    args = parser.parse_args()
+
+    print(f"import gateway: {measure_import(args.runs) * 1000:.0f}ms")
+
+    lives: List[float] = []
+    readies: List[float] = []
+    phases: Dict[str, List[float]] = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for run in range(args.runs):
+            port = free_port()
+            config = write_config(Path(directory), args.comfyui, port, args.workers)
+            live, ready, timings = measure_startup(config, port, args.timeout)
+            lives.append(live)
+            readies.append(ready)
+            for phase, seconds in timings.items():
+                phases.setdefault(phase, []).append(seconds)
+            print(f"第 {run + 1} 次: 端口可访问 {live * 1000:6.0f}ms  就绪 {ready * 1000:6.0f}ms")
+            os.remove(config)
+
+    print(f"中位数: 端口可访问 {statistics.median(lives) * 1000:.0f}ms  就绪 {statistics.median(readies) * 1000:.0f}ms")
+    for phase, samples in phases.items():
+        print(f"  {phase:14s} {statistics.median(samples) * 1000:8.1f}ms")
+
+    median = statistics.median(readies)
+    if median > args.budget:
+        print(f"超出预算: 就绪 {median:.2f}s > {args.budget:.2f}s")
+        sys.exit(1)
+    print(f"预算内: 就绪 {median:.2f}s <= {args.budget:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
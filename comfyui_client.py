@@ -0,0 +1,338 @@
+"""
+ComfyUI 后端客户端
+每个后端一个长连接池，替代每次请求新建 httpx.AsyncClient
+
+- 熔断：连续失败达到阈值后直接拒绝请求（不再等满超时），冷却后放行探测请求（半开），
+  探测成功则恢复
+- 幂等读取（/history、/queue、/object_info、/view）：有限次数的抖动重试，
+  配置了副本地址时可发送对冲请求，先返回的结果生效
+"""
+
+import asyncio
+import logging
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import urlencode, urlsplit, urlunsplit
+
+import httpx
+
+from metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态（导出指标时的数值）
+BREAKER_CLOSED = "closed"
+BREAKER_HALF_OPEN = "half_open"
+BREAKER_OPEN = "open"
+BREAKER_STATE_VALUES = {BREAKER_CLOSED: 0, BREAKER_HALF_OPEN: 1, BREAKER_OPEN: 2}
+
+
+def default_ws_url(base_url: str) -> str:
+    """由 HTTP 地址推导 WebSocket 地址（http://host:port -> ws://host:port/ws）"""
+    parts = urlsplit(base_url)
+    scheme = "wss" if parts.scheme == "https" else "ws"
+    return urlunsplit((scheme, parts.netloc, "/ws", "", ""))
+
+
+class CircuitOpenError(httpx.TransportError):
+    """后端处于熔断状态，请求未发出"""
+
+
+class CircuitBreaker:
+    """单个后端的熔断器"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0, half_open_probes: int = 1):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = half_open_probes
+        self.state = BREAKER_CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probes = 0
+        # 各状态的进入次数
+        self.transitions: Dict[str, int] = {state: 0 for state in BREAKER_STATE_VALUES}
+
+    def _transition(self, state: str):
+        if state != self.state:
+            self.state = state
+            self.transitions[state] += 1
+
+    def retry_in(self) -> float:
+        """距离允许探测还有多少秒（未熔断时为 0）"""
+        if self.state != BREAKER_OPEN:
+            return 0.0
+        return max(self.opened_at + self.reset_timeout - time.monotonic(), 0.0)
+
+    def available(self) -> bool:
+        """当前是否会放行请求（不占用探测名额）"""
+        if self.state == BREAKER_CLOSED:
+            return True
+        if self.state == BREAKER_OPEN:
+            return self.retry_in() <= 0
+        return self._probes < self.half_open_probes
+
+    def allow(self) -> bool:
+        """请求前调用：放行返回 True，并在半开状态下占用一个探测名额"""
+        if self.state == BREAKER_CLOSED:
+            return True
+        if self.state == BREAKER_OPEN:
+            if self.retry_in() > 0:
+                return False
+            self._transition(BREAKER_HALF_OPEN)
+            self._probes = 0
+        if self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        return False
+
+    def release(self):
+        """请求没有得出后端状态（被取消、4xx 等）时归还半开状态下占用的探测名额"""
+        if self.state == BREAKER_HALF_OPEN and self._probes > 0:
+            self._probes -= 1
+
+    def record_success(self):
+        self.failures = 0
+        if self.state != BREAKER_CLOSED:
+            self._probes = 0
+            self._transition(BREAKER_CLOSED)
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == BREAKER_HALF_OPEN or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self._probes = 0
+            self._transition(BREAKER_OPEN)
+
+
+def _is_backend_failure(error: Exception) -> bool:
+    """网络错误、超时和 5xx 视为后端故障；4xx 是请求本身的问题"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError) and not isinstance(error, CircuitOpenError)
+
+
+class ComfyUIClient:
+    """ComfyUI 后端客户端（共享连接池）"""
+
+    def __init__(
+        self,
+        base_url: str,
+        name: str = "default",
+        ws_url: Optional[str] = None,
+        max_connections: int = 64,
+        replica_urls: Optional[List[str]] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        read_retries: int = 2,
+        retry_backoff: float = 0.2,
+        hedge_delay: float = 0.0
+    ):
+        self.name = name
+        self.base_url = base_url.rstrip("/")
+        self.api_url = f"{self.base_url}/cfui/api"
+        self.view_url_prefix = f"{self.base_url}/cfui/view"
+        self.ws_url = ws_url or default_ws_url(self.base_url)
+        # 同一 ComfyUI 的其它访问地址（共享历史记录和输出目录），只用于幂等读取
+        self.replica_urls = [url.rstrip("/") for url in replica_urls or []]
+        self.breaker = breaker or CircuitBreaker()
+        self.read_retries = read_retries
+        self.retry_backoff = retry_backoff
+        # 主地址超过该时间未返回时向副本发送对冲请求，0 表示不对冲
+        self.hedge_delay = hedge_delay
+        self.stats: Dict[str, int] = {"rejected": 0, "retries": 0, "hedged": 0, "hedge_wins": 0}
+
+        # 禁用代理，直接连接（适用于本地服务）
+        self._client = httpx.AsyncClient(
+            timeout=30.0,
+            proxies={},
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            )
+        )
+
+    async def close(self):
+        await self._client.aclose()
+
+    def available(self) -> bool:
+        return self.breaker.available()
+
+    # ------------------------------------------------------------------
+    # 熔断、重试与对冲
+    # ------------------------------------------------------------------
+
+    async def _guarded(self, call: Callable[[], Awaitable[httpx.Response]]) -> httpx.Response:
+        """经过熔断器发送请求"""
+        if not self.breaker.allow():
+            self.stats["rejected"] += 1
+            raise CircuitOpenError(
+                f"ComfyUI 后端 {self.name} 暂不可用（熔断中，{self.breaker.retry_in():.0f} 秒后重试）"
+            )
+        recorded = False
+        try:
+            response = await call()
+            response.raise_for_status()
+            if self.breaker.state != BREAKER_CLOSED:
+                logger.info(f"ComfyUI 后端 {self.name} 已恢复")
+            self.breaker.record_success()
+            recorded = True
+            return response
+        except httpx.HTTPError as e:
+            if _is_backend_failure(e):
+                previous = self.breaker.state
+                self.breaker.record_failure()
+                recorded = True
+                if self.breaker.state == BREAKER_OPEN and previous != BREAKER_OPEN:
+                    logger.warning(f"ComfyUI 后端 {self.name} 连续失败 {self.breaker.failures} 次，进入熔断: {e}")
+            raise
+        finally:
+            # 4xx、对冲时主请求被取消或其它异常都不能说明后端状态，只归还探测名额
+            if not recorded:
+                self.breaker.release()
+
+    async def _get_with_retries(self, url: str, timeout: float, guarded: bool) -> httpx.Response:
+        """幂等 GET：后端故障时带抖动重试（熔断拒绝不重试）"""
+        attempt = 0
+        while True:
+            try:
+                if guarded:
+                    return await self._guarded(lambda: self._client.get(url, timeout=timeout))
+                response = await self._client.get(url, timeout=timeout)
+                response.raise_for_status()
+                return response
+            except httpx.HTTPError as e:
+                if attempt >= self.read_retries or not _is_backend_failure(e):
+                    raise
+            attempt += 1
+            self.stats["retries"] += 1
+            # 全抖动退避，避免大量轮询同时重试
+            await asyncio.sleep(random.uniform(0, self.retry_backoff * (2 ** attempt)))
+
+    async def _read(self, path: str, timeout: float) -> httpx.Response:
+        """
+        幂等读取：主地址熔断时直接读副本；
+        配置了对冲时，主地址 hedge_delay 秒内未返回就同时请求副本，先成功的生效
+        """
+        replica = self.replica_urls[0] if self.replica_urls else None
+        if replica is None:
+            return await self._get_with_retries(self.base_url + path, timeout, guarded=True)
+        if not self.breaker.available():
+            return await self._get_with_retries(replica + path, timeout, guarded=False)
+        if self.hedge_delay <= 0:
+            return await self._get_with_retries(self.base_url + path, timeout, guarded=True)
+
+        primary = asyncio.ensure_future(self._get_with_retries(self.base_url + path, timeout, guarded=True))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay)
+        if done and not primary.exception():
+            return primary.result()
+
+        self.stats["hedged"] += 1
+        pending = {primary} if not done else set()
+        pending.add(asyncio.ensure_future(self._get_with_retries(replica + path, timeout, guarded=False)))
+        error: Optional[BaseException] = primary.exception() if done else None
+        try:
+            while pending:
+                finished, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in finished:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    # ------------------------------------------------------------------
+    # ComfyUI 接口
+    # ------------------------------------------------------------------
+
+    async def submit(
+        self,
+        workflow: Dict[str, Any],
+        client_id: str,
+        prompt_id: Optional[str] = None,
+        timeout: float = 30.0
+    ) -> str:
+        """提交工作流，返回 ComfyUI 的 prompt_id（非幂等，不重试）"""
+        payload = {
+            "prompt": workflow,
+            "client_id": client_id
+        }
+        # 较新版本的 ComfyUI 会沿用请求中的 prompt_id
+        if prompt_id:
+            payload["prompt_id"] = prompt_id
+
+        response = await self._guarded(
+            lambda: self._client.post(f"{self.api_url}/prompt", json=payload, timeout=timeout)
+        )
+        result = response.json()
+        return result.get("prompt_id", prompt_id)
+
+    async def get_history(self, prompt_id: str, timeout: float = 10.0) -> Dict[str, Any]:
+        """查询单个任务的历史记录"""
+        response = await self._read(f"/cfui/api/history/{prompt_id}", timeout)
+        return response.json()
+
+    async def get_queue(self, timeout: float = 10.0) -> Dict[str, Any]:
+        """查询执行队列"""
+        response = await self._read("/cfui/api/queue", timeout)
+        return response.json()
+
+    async def get_object_info(self, timeout: float = 30.0) -> Dict[str, Any]:
+        """查询全部节点类型的定义"""
+        response = await self._read("/cfui/api/object_info", timeout)
+        return response.json()
+
+    async def get_view(self, filename: str, subfolder: str = "", type: str = "output", timeout: float = 60.0) -> bytes:
+        """下载输出文件"""
+        query = urlencode({'filename': filename, 'subfolder': subfolder, 'type': type})
+        response = await self._read(f"/cfui/view?{query}", timeout)
+        return response.content
+
+    async def upload_image(self, file_content: bytes, filename: str, timeout: float = 30.0) -> str:
+        """上传图片到 ComfyUI 的 input 目录，返回上传后的文件名"""
+        files = {
+            'image': (filename, file_content, 'image/jpeg')
+        }
+        response = await self._guarded(
+            lambda: self._client.post(
+                f"{self.api_url}/upload/image",
+                files=files,
+                data={'overwrite': 'true'},
+                timeout=timeout
+            )
+        )
+        result = response.json()
+        return result.get('name', filename)
+
+    def view_url(self, filename: str, subfolder: str = "", type: str = "output") -> str:
+        """输出文件的下载地址"""
+        return f"{self.view_url_prefix}?{urlencode({'filename': filename, 'subfolder': subfolder, 'type': type})}"
+
+
+def register_client_metrics(metrics: MetricsRegistry, clients: Dict[str, ComfyUIClient]):
+    """导出各后端的熔断器状态和重试、对冲计数"""
+    metrics.gauge(
+        "gateway_backend_breaker_state",
+        "ComfyUI 后端熔断器状态（0 正常，1 半开，2 熔断）",
+        ("backend",),
+        lambda: [((name, ), BREAKER_STATE_VALUES[c.breaker.state]) for name, c in clients.items()]
+    )
+    metrics.counter_from(
+        "gateway_backend_breaker_transitions_total",
+        "熔断器进入各状态的次数",
+        ("backend", "state"),
+        lambda: [
+            ((name, state), count)
+            for name, c in clients.items()
+            for state, count in c.breaker.transitions.items()
+        ]
+    )
+    metrics.counter_from(
+        "gateway_backend_requests_total",
+        "ComfyUI 请求的熔断拒绝、重试和对冲次数",
+        ("backend", "outcome"),
+        lambda: [((name, outcome), count) for name, c in clients.items() for outcome, count in c.stats.items()]
+    )
@@ -0,0 +1,254 @@
+"""
+任务耗时模型
+根据跟踪器记录的已完成任务，学习每个模板在不同 (宽×高×帧数, 步数) 下的执行耗时，
+用于预估排队任务的完成时间、队列清空时间，以及按预估耗时做准入控制
+"""
+
+import logging
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from job_tracker import Job, STATUS_COMPLETED, STATUS_RUNNING
+from workflow_registry import WorkflowRegistry, WorkflowTemplate
+
+logger = logging.getLogger(__name__)
+
+# 工作量单位：百万 (像素×帧×步)
+_WORK_SCALE = 1e6
+# 预估耗时下限（秒）
+_MIN_ESTIMATE = 0.5
+
+
+class _Bucket:
+    """同一 (宽×高×帧数, 步数) 的耗时滑动平均"""
+
+    __slots__ = ("mean", "count")
+
+    def __init__(self, seconds: float):
+        self.mean = seconds
+        self.count = 1
+
+
+class _LinearFit:
+    """耗时 ≈ a + b × 工作量，带指数衰减的在线最小二乘（新样本权重更高）"""
+
+    __slots__ = ("n", "sx", "sy", "sxx", "sxy")
+
+    def __init__(self):
+        self.n = 0.0
+        self.sx = 0.0
+        self.sy = 0.0
+        self.sxx = 0.0
+        self.sxy = 0.0
+
+    def add(self, x: float, y: float, decay: float):
+        keep = 1.0 - decay
+        self.n = self.n * keep + 1.0
+        self.sx = self.sx * keep + x
+        self.sy = self.sy * keep + y
+        self.sxx = self.sxx * keep + x * x
+        self.sxy = self.sxy * keep + x * y
+
+    def predict(self, x: float) -> Optional[float]:
+        if self.n <= 0:
+            return None
+        mean_x = self.sx / self.n
+        mean_y = self.sy / self.n
+        var_x = self.sxx / self.n - mean_x * mean_x
+        if var_x > 1e-9 * max(mean_x * mean_x, 1.0):
+            slope = (self.sxy / self.n - mean_x * mean_y) / var_x
+            if slope > 0:
+                return mean_y + slope * (x - mean_x)
+        # 样本工作量都相同（或拟合出负斜率）时按比例缩放
+        if mean_x > 0:
+            return mean_y * x / mean_x
+        return mean_y
+
+
+class CostModel:
+    """
+    任务耗时模型
+
+    预估顺序：相同 (宽×高×帧数, 步数) 的历史均值 -> 模板的线性拟合 -> 模板的先验耗时
+    """
+
+    def __init__(self, registry: WorkflowRegistry, decay: float = 0.05, min_bucket_samples: int = 3):
+        self.registry = registry
+        self.decay = decay
+        self.min_bucket_samples = min_bucket_samples
+        self._buckets: Dict[Tuple[str, int, int], _Bucket] = {}
+        self._fits: Dict[str, _LinearFit] = {}
+        self._default_work: Dict[str, float] = {}
+        self.samples = 0
+
+    # ------------------------------------------------------------------
+    # 预估
+    # ------------------------------------------------------------------
+
+    def _work(self, template: WorkflowTemplate, params: Dict[str, Any]) -> Tuple[int, int, float]:
+        pixels, steps = template.workload(params)
+        return pixels, steps, pixels * steps / _WORK_SCALE
+
+    def _prior(self, template: WorkflowTemplate, work: float) -> float:
+        default_work = self._default_work.get(template.name)
+        if default_work is None:
+            _, _, default_work = self._work(template, template.default_params())
+            self._default_work[template.name] = default_work
+        if default_work <= 0:
+            return template.cost_prior
+        return template.cost_prior * work / default_work
+
+    def estimate(self, template_name: str, params: Dict[str, Any]) -> float:
+        """预估任务在 GPU 上的执行时间（秒）"""
+        template = self.registry.get(template_name)
+        pixels, steps, work = self._work(template, params)
+
+        bucket = self._buckets.get((template_name, pixels, steps))
+        if bucket is not None and bucket.count >= self.min_bucket_samples:
+            return max(bucket.mean, _MIN_ESTIMATE)
+
+        fit = self._fits.get(template_name)
+        predicted = fit.predict(work) if fit is not None else None
+        if predicted is None:
+            predicted = self._prior(template, work)
+        return max(predicted, _MIN_ESTIMATE)
+
+    def remaining(self, job: Job, now: Optional[float] = None) -> float:
+        """任务剩余的执行时间（秒）"""
+        if job.finished:
+            return 0.0
+        # 使用最新的模型重新预估（job.cost 是提交时的预估，用于准入记账）
+        cost = self.estimate(job.template, job.params)
+        if job.status == STATUS_RUNNING and job.started_at is not None:
+            elapsed = (now or time.time()) - job.started_at
+            # 已超出预估时仍视为即将完成，留出最小余量
+            return max(cost - elapsed, _MIN_ESTIMATE)
+        return cost
+
+    def schedule(self, active: Iterable[Job], queued: Iterable[Job]) -> Tuple[Dict[str, float], float]:
+        """
+        单个后端的排程预估：ComfyUI 按顺序逐个执行
+
+        active: 已提交到 ComfyUI 的任务；queued: 本地队列中的任务（按出队顺序）
+        返回 ({prompt_id: 预计完成的剩余秒数}, 队列清空的剩余秒数)
+        """
+        now = time.time()
+        etas: Dict[str, float] = {}
+        clock = 0.0
+        # 执行中的任务排在前面
+        ordered = sorted(active, key=lambda job: job.status != STATUS_RUNNING)
+        for job in ordered:
+            clock += self.remaining(job, now)
+            etas[job.prompt_id] = clock
+        for job in queued:
+            clock += self.remaining(job, now)
+            etas[job.prompt_id] = clock
+        return etas, clock
+
+    # ------------------------------------------------------------------
+    # 学习
+    # ------------------------------------------------------------------
+
+    def observe(self, job: Job):
+        """任务结束回调：记录成功任务的实际执行时间"""
+        if job.status != STATUS_COMPLETED or job.started_at is None or job.finished_at is None:
+            # 没有收到开始事件（如轮询得到的结果）时无法区分排队和执行时间
+            return
+        if job.template not in self.registry:
+            return
+        seconds = job.finished_at - job.started_at
+        if seconds <= 0:
+            return
+        self.record(job.template, job.params, seconds)
+
+    def record(self, template_name: str, params: Dict[str, Any], seconds: float):
+        template = self.registry.get(template_name)
+        pixels, steps, work = self._work(template, params)
+
+        key = (template_name, pixels, steps)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            self._buckets[key] = _Bucket(seconds)
+        else:
+            bucket.count += 1
+            # 样本较少时取算术平均，之后按 decay 做指数平均
+            weight = max(1.0 / bucket.count, self.decay)
+            bucket.mean += (seconds - bucket.mean) * weight
+
+        fit = self._fits.get(template_name)
+        if fit is None:
+            fit = self._fits[template_name] = _LinearFit()
+        fit.add(work, seconds, self.decay)
+        self.samples += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """各模板的样本数及默认参数下的预估耗时"""
+        templates: Dict[str, Any] = {}
+        for template in self.registry:
+            fit = self._fits.get(template.name)
+            templates[template.name] = {
+                "samples": round(fit.n, 1) if fit is not None else 0,
+                "default_estimate_seconds": round(self.estimate(template.name, template.default_params()), 1),
+            }
+        return {"samples": self.samples, "templates": templates}
+
+
+class AdmissionError(Exception):
+    """预估耗时超出准入限制"""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class AdmissionControl:
+    """
+    按预估耗时的准入控制
+
+    - max_request_seconds: 单个任务的预估耗时上限
+    - max_tenant_seconds: 单个租户未完成任务（排队 + 执行中）的预估耗时总和上限
+    0 表示不限制
+    """
+
+    def __init__(self, max_request_seconds: float = 0.0, max_tenant_seconds: float = 0.0):
+        self.max_request_seconds = max_request_seconds
+        self.max_tenant_seconds = max_tenant_seconds
+        self._outstanding: Dict[str, float] = {}
+
+    def outstanding(self, tenant: str) -> float:
+        return self._outstanding.get(tenant, 0.0)
+
+    def check(self, tenant: str, cost: float):
+        if self.max_request_seconds > 0 and cost > self.max_request_seconds:
+            raise AdmissionError(
+                f"任务预估耗时 {cost:.0f} 秒，超过单个任务上限 {self.max_request_seconds:.0f} 秒，"
+                f"请降低分辨率、帧数或步数",
+                status_code=413
+            )
+        if self.max_tenant_seconds > 0:
+            outstanding = self.outstanding(tenant)
+            if outstanding + cost > self.max_tenant_seconds:
+                raise AdmissionError(
+                    f"未完成任务的预估耗时合计 {outstanding:.0f} 秒，"
+                    f"加上本任务将超过上限 {self.max_tenant_seconds:.0f} 秒，请稍后重试",
+                    status_code=429,
+                    retry_after=max(outstanding + cost - self.max_tenant_seconds, 1.0)
+                )
+
+    def admit(self, job: Job):
+        self._outstanding[job.tenant] = self.outstanding(job.tenant) + (job.cost or 0.0)
+
+    def release(self, job: Job):
+        """任务结束回调"""
+        remaining = self.outstanding(job.tenant) - (job.cost or 0.0)
+        if remaining > 1e-6:
+            self._outstanding[job.tenant] = remaining
+        else:
+            self._outstanding.pop(job.tenant, None)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [
+            {"tenant": tenant, "outstanding_seconds": round(seconds, 1)}
+            for tenant, seconds in sorted(self._outstanding.items())
+        ]
@@ -0,0 +1,307 @@
+"""
+本地调度队列
+任务先进入网关本地队列，每个后端同时提交到 ComfyUI 的任务数不超过 max_inflight
+
+队列按优先级类别调度：
+- interactive: 同步接口（调用方在等待结果）
+- async: 异步接口（默认）
+- batch: 批量任务（请求头 X-Priority: batch）
+
+每个任务的排序键 = 类别偏移 + 预估耗时（开启最短任务优先时）+ 入队时间。
+由于所有排队任务的等待时间以相同速度增长，“入队时间”一项就是线性老化：
+低优先级任务多等待“类别偏移”秒后会排到新到的高优先级任务之前，不会饿死。
+
+多个租户之间按 GPU 时间做加权公平排队（start-time fair queueing）：
+每个租户一条按上述排序键排列的队列，每次出队选择虚拟开始时间最小的租户，
+出队后该租户的虚拟时间前进 预估耗时 / 权重。只有一个租户时与单队列完全一致。
+
+后端熔断期间不出队，任务留在本地队列，熔断器半开时再尝试提交。
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import httpx
+
+from comfyui_client import CircuitOpenError, ComfyUIClient
+from job_tracker import (
+    Job,
+    JobTracker,
+    PRIORITY_ASYNC,
+    PRIORITY_BATCH,
+    PRIORITY_INTERACTIVE,
+    STATUS_QUEUED,
+)
+from metrics import MetricsRegistry
+from tracing import NOOP_SPAN
+
+logger = logging.getLogger(__name__)
+
+# 类别偏移（秒）：相当于让该类别的任务“晚到”多少秒
+DEFAULT_PRIORITY_OFFSETS = {
+    PRIORITY_INTERACTIVE: 0.0,
+    PRIORITY_ASYNC: 120.0,
+    PRIORITY_BATCH: 900.0,
+}
+
+
+class _TenantLane:
+    """单个租户在单个后端上的排队任务"""
+
+    __slots__ = ("heap", "start", "finish")
+
+    def __init__(self):
+        # 小顶堆：[排序键, 序号, 任务, 工作流]
+        self.heap: List[List[Any]] = []
+        # 虚拟开始 / 结束时间（单位：GPU 秒 / 权重）
+        self.start = 0.0
+        self.finish = 0.0
+
+
+class DispatchQueue:
+    """所有模板共用的调度队列"""
+
+    def __init__(
+        self,
+        clients: Dict[str, ComfyUIClient],
+        tracker: JobTracker,
+        max_inflight: int = 2,
+        shortest_job_first: bool = False,
+        priority_offsets: Optional[Dict[str, float]] = None,
+        weight_of: Optional[Callable[[str], float]] = None,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        self.clients = clients
+        self.tracker = tracker
+        self.max_inflight = max_inflight
+        self.shortest_job_first = shortest_job_first
+        self.priority_offsets = dict(DEFAULT_PRIORITY_OFFSETS)
+        if priority_offsets:
+            self.priority_offsets.update(priority_offsets)
+        # 租户权重（默认都为 1）
+        self.weight_of = weight_of or (lambda tenant: 1.0)
+        # 后端 -> 租户 -> 排队任务
+        self._lanes: Dict[str, Dict[str, _TenantLane]] = {name: {} for name in clients}
+        # 后端的虚拟时间（最近一次出队任务的虚拟开始时间）
+        self._virtual: Dict[str, float] = {name: 0.0 for name in clients}
+        self._depth: Dict[str, int] = {name: 0 for name in clients}
+        self._inflight: Dict[str, int] = {name: 0 for name in clients}
+        # 入队、出队的次数（排程预估据此判断缓存是否失效）
+        self._changes: Dict[str, int] = {name: 0 for name in clients}
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._retry_timer: Optional[asyncio.TimerHandle] = None
+        self._submitting: Set[asyncio.Task] = set()
+        # 熔断拒绝后放回队列的任务：再次出队时不重复记录排队等待时间
+        self._requeued: Set[str] = set()
+        tracker.add_listener(self._on_job_finished)
+
+        metrics = metrics or MetricsRegistry()
+        self.queue_wait = metrics.summary(
+            "gateway_queue_wait_seconds",
+            "任务在网关本地队列中的等待时间",
+            ("priority",)
+        )
+        metrics.gauge(
+            "gateway_queue_depth",
+            "网关本地队列中的任务数",
+            ("backend", "priority"),
+            self._collect_depth
+        )
+        metrics.gauge(
+            "gateway_inflight",
+            "已提交到 ComfyUI 尚未结束的任务数",
+            ("backend",),
+            lambda: [((name,), count) for name, count in self._inflight.items()]
+        )
+
+    async def start(self):
+        self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        self._runner = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            await asyncio.gather(self._runner, return_exceptions=True)
+            self._runner = None
+        if self._retry_timer is not None:
+            self._retry_timer.cancel()
+            self._retry_timer = None
+        if self._submitting:
+            await asyncio.gather(*self._submitting, return_exceptions=True)
+
+    def sort_key(self, job: Job) -> float:
+        key = job.created_at + self.priority_offsets.get(job.priority, self.priority_offsets[PRIORITY_ASYNC])
+        if self.shortest_job_first and job.cost is not None:
+            key += job.cost
+        return key
+
+    def put(self, job: Job, workflow: Dict[str, Any]):
+        """任务入队（不阻塞）"""
+        job.status = STATUS_QUEUED
+        lanes = self._lanes[job.backend]
+        lane = lanes.get(job.tenant)
+        if lane is None:
+            lane = lanes[job.tenant] = _TenantLane()
+        if not lane.heap:
+            # 租户从空闲变为有任务排队：不能用空闲期间“攒下”的份额插队
+            lane.start = max(self._virtual[job.backend], lane.finish)
+        heapq.heappush(lane.heap, [self.sort_key(job), next(self._seq), job, workflow])
+        self._depth[job.backend] += 1
+        self._changes[job.backend] += 1
+        self._notify()
+
+    def _pop(self, backend: str):
+        """按公平排队选出下一个任务，返回 (任务, 工作流, 任务的虚拟开始时间)"""
+        lane_name, lane = min(
+            ((name, lane) for name, lane in self._lanes[backend].items() if lane.heap),
+            key=lambda item: (item[1].start, item[1].heap[0][0])
+        )
+        _, _, job, workflow = heapq.heappop(lane.heap)
+        self._depth[backend] -= 1
+        self._changes[backend] += 1
+        self._virtual[backend] = lane.start
+        lane.finish = lane.start + (job.cost or 0.0) / self.weight_of(lane_name)
+        start = lane.start
+        if lane.heap:
+            lane.start = lane.finish
+        return job, workflow, start
+
+    def _requeue(self, job: Job, workflow: Dict[str, Any], start: float):
+        """
+        请求未发出的任务放回队列：撤销出队时计入的份额
+
+        租户从任务原来的虚拟开始时间继续排队，而不是按新入队处理（那样会从 max(虚拟时间, 结束时间)
+        开始，这个任务的份额被计入两次）
+        """
+        job.status = STATUS_QUEUED
+        lanes = self._lanes[job.backend]
+        lane = lanes.get(job.tenant)
+        if lane is None:
+            lane = lanes[job.tenant] = _TenantLane()
+        lane.finish = max(lane.finish - (job.cost or 0.0) / self.weight_of(job.tenant), start)
+        lane.start = min(lane.start, start) if lane.heap else start
+        heapq.heappush(lane.heap, [self.sort_key(job), next(self._seq), job, workflow])
+        self._depth[job.backend] += 1
+        self._changes[job.backend] += 1
+        self._requeued.add(job.prompt_id)
+        self._notify()
+
+    def depth(self, backend: Optional[str] = None) -> int:
+        """本地排队任务数"""
+        if backend is not None:
+            return self._depth[backend]
+        return sum(self._depth.values())
+
+    def changes(self, backend: str) -> int:
+        """本地队列内容变化的次数（入队、出队时递增）"""
+        return self._changes[backend]
+
+    def queued_jobs(self, backend: str) -> List[Job]:
+        """本地队列中的任务（按预计出队顺序）"""
+        lanes = [
+            [lane.start, sorted(lane.heap), 0, self.weight_of(name)]
+            for name, lane in self._lanes[backend].items() if lane.heap
+        ]
+        ordered: List[Job] = []
+        while lanes:
+            current = min(lanes, key=lambda item: (item[0], item[1][item[2]][0]))
+            job = current[1][current[2]][2]
+            ordered.append(job)
+            current[0] += (job.cost or 0.0) / current[3]
+            current[2] += 1
+            if current[2] == len(current[1]):
+                lanes.remove(current)
+        return ordered
+
+    def inflight(self, backend: str) -> int:
+        return self._inflight[backend]
+
+    def wait_stats(self) -> Dict[str, Dict[str, float]]:
+        """各优先级类别的排队等待时间分位数"""
+        return {priority: self.queue_wait.stats(priority) for priority in self.priority_offsets}
+
+    def _collect_depth(self):
+        for backend, lanes in self._lanes.items():
+            counts = {priority: 0 for priority in self.priority_offsets}
+            for lane in lanes.values():
+                for entry in lane.heap:
+                    counts[entry[2].priority] = counts.get(entry[2].priority, 0) + 1
+            for priority, count in counts.items():
+                yield (backend, priority), count
+
+    def _notify(self):
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _on_job_finished(self, job: Job):
+        # 只有已提交到 ComfyUI 的任务占用后端额度
+        if job.remote_id is not None:
+            self._release(job.backend)
+
+    def _release(self, backend: str):
+        self._inflight[backend] = max(0, self._inflight[backend] - 1)
+        self._notify()
+
+    def _schedule_retry(self, delay: float):
+        """熔断的后端在半开时唤醒调度"""
+        if self._retry_timer is not None:
+            self._retry_timer.cancel()
+        self._retry_timer = asyncio.get_running_loop().call_later(delay, self._notify)
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            retry_in: Optional[float] = None
+            for backend in self._lanes:
+                client = self.clients[backend]
+                if self._depth[backend] and not client.available():
+                    wait = client.breaker.retry_in() or 1.0
+                    retry_in = wait if retry_in is None else min(retry_in, wait)
+                    continue
+                while self._depth[backend] and self._inflight[backend] < self.max_inflight:
+                    job, workflow, start = self._pop(backend)
+                    if job.prompt_id in self._requeued:
+                        self._requeued.discard(job.prompt_id)
+                    else:
+                        self.queue_wait.observe(time.time() - job.created_at, job.priority)
+                    self._inflight[backend] += 1
+                    task = asyncio.create_task(self._submit(backend, job, workflow, start))
+                    self._submitting.add(task)
+                    task.add_done_callback(self._submitting.discard)
+            if retry_in is not None:
+                self._schedule_retry(retry_in)
+
+    async def _submit(self, backend: str, job: Job, workflow: Dict[str, Any], start: float):
+        client = self.clients[backend]
+        dispatched = time.time()
+        # 只为已采样的任务记录（后台任务的上下文可能是其它请求的）
+        span = self.tracker.tracer.start_span("comfyui.submit", job.trace.job) if job.trace is not None else NOOP_SPAN
+        try:
+            remote_id = await client.submit(workflow, self.tracker.client_id, prompt_id=job.prompt_id)
+        except CircuitOpenError as e:
+            span.record_error(e)
+            span.end()
+            # 请求未发出：放回本地队列，等待熔断器半开
+            self._inflight[backend] = max(0, self._inflight[backend] - 1)
+            self._requeue(job, workflow, start)
+            return
+        except (httpx.HTTPError, ValueError) as e:
+            span.record_error(e)
+            span.end()
+            logger.error(f"提交工作流失败: {e}")
+            # 提交失败的任务没有 remote_id，需要在这里归还额度
+            self.tracker.mark_failed(job, f"提交工作流失败: {str(e)}")
+            self._release(backend)
+            return
+        span.end()
+        if job.trace is not None:
+            self.tracker.tracer.record("queue.local", job.trace.job, job.created_at, dispatched)
+        self.tracker.mark_submitted(job, remote_id)
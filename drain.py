@@ -0,0 +1,83 @@
+"""
+排空控制
+进程退出前不再接受新任务，等待同步接口的调用方拿到结果；超过期限仍未完成的等待返回 503
+网关主进程和多进程模式下的 HTTP 工作进程共用
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Optional, TypeVar
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+RETRY_AFTER_SECONDS = "10"
+
+
+class DrainGate:
+    """排空状态与同步等待计数"""
+
+    def __init__(self, name: str = "网关"):
+        self.name = name
+        self.draining = False
+        self.waiters = 0
+        self._idle: Optional[asyncio.Event] = None
+        # 排空超时后释放仍在等待的同步调用方
+        self._expired: Optional[asyncio.Event] = None
+
+    def open(self):
+        """在事件循环中调用（创建事件对象）"""
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._expired = asyncio.Event()
+
+    def begin(self):
+        """进入排空模式：拒绝新任务"""
+        if not self.draining:
+            self.draining = True
+            logger.info(f"{self.name}进入排空模式，等待 {self.waiters} 个同步请求完成")
+
+    async def drain(self, timeout: float):
+        """排空：最多等待 timeout 秒让同步接口的调用方拿到结果"""
+        self.begin()
+        if self._idle is None:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"排空超时，仍有 {self.waiters} 个同步请求未完成，任务将在重启后继续跟踪")
+        self._expired.set()
+
+    def check_accepting(self):
+        if self.draining:
+            raise HTTPException(
+                status_code=503,
+                detail="网关正在重启，暂不接受新任务，请稍后重试",
+                headers={"Retry-After": RETRY_AFTER_SECONDS}
+            )
+
+    async def guard(self, waiting: Awaitable[T], prompt_id: str) -> T:
+        """计入同步等待；排空超时时取消等待并返回 503"""
+        self.waiters += 1
+        self._idle.clear()
+        done = asyncio.ensure_future(waiting)
+        expired = asyncio.ensure_future(self._expired.wait())
+        try:
+            await asyncio.wait({done, expired}, return_when=asyncio.FIRST_COMPLETED)
+            if done.done():
+                return done.result()
+            raise HTTPException(
+                status_code=503,
+                detail=f"网关正在重启，任务 {prompt_id} 仍在执行，请稍后通过状态接口查询结果",
+                headers={"Retry-After": RETRY_AFTER_SECONDS}
+            )
+        finally:
+            expired.cancel()
+            if not done.done():
+                done.cancel()
+            self.waiters -= 1
+            if self.waiters == 0:
+                self._idle.set()
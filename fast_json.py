@@ -0,0 +1,47 @@
+"""
+快速 JSON 响应
+状态查询、批量状态、任务列表和同步接口返回的都是已经构造好的最终结构（普通字典和列表），
+直接返回 FastJSONResponse：跳过 FastAPI 对返回值的 jsonable_encoder 遍历和 response_model 校验，
+用 orjson 序列化（未安装时回退到标准库 json）。这些接口上的 response_model 只用于生成接口文档
+
+条目很多的列表用 StreamingResponse 分块序列化输出，不必先在内存中拼出完整的响应体
+"""
+
+from typing import Any, AsyncIterator, Dict, List
+
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from offload import json_dumps
+
+# 超过该条目数的列表改为分块输出
+STREAM_THRESHOLD = 256
+# 分块输出时每块的条目数
+STREAM_CHUNK_SIZE = 128
+
+
+class FastJSONResponse(JSONResponse):
+    """用 orjson 序列化的 JSON 响应（内容须为 JSON 兼容的字典、列表和标量）"""
+
+    def render(self, content: Any) -> bytes:
+        return json_dumps(content)
+
+
+async def _stream_object(fields: Dict[str, Any], key: str, items: List[Any], chunk_size: int) -> AsyncIterator[bytes]:
+    head = json_dumps(fields)[:-1]
+    yield head + (b"," if fields else b"") + json_dumps(key) + b":["
+    for start in range(0, len(items), chunk_size):
+        # 去掉每块外层的 [ ]，块之间以逗号连接
+        chunk = json_dumps(items[start:start + chunk_size])[1:-1]
+        yield (b"," if start else b"") + chunk
+    yield b"]}"
+
+
+def json_list_response(fields: Dict[str, Any], key: str, items: List[Any], chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    {**fields, key: items} 形式的响应
+
+    条目数不超过 STREAM_THRESHOLD 时一次序列化；否则分块输出（列表放在最后）
+    """
+    if len(items) <= STREAM_THRESHOLD:
+        return FastJSONResponse({**fields, key: items})
+    return StreamingResponse(_stream_object(fields, key, items, chunk_size), media_type="application/json")
@@ -0,0 +1,1005 @@
+"""
+ComfyUI Flows Gateway
+统一的多工作流网关：一个进程承载 Qwen Image、Image to Video、Wan2.2 I2V 三个模板，
+共用 ComfyUI 连接池、任务跟踪器、调度队列和上传缓存
+
+原有三个服务（comfyui_api_server.py / image2video_api_server.py / wan22_i2v_14b_4.py）
+的接口以兼容路由的形式保留：
+- 网关端口下挂载在 /qwen、/i2v、/wan22 前缀
+- 同时可在同一进程内继续监听原端口 8000 / 8001 / 5014
+"""
+
+import asyncio
+import logging
+import math
+import signal
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+
+from api_models import BatchStatusRequest
+from comfyui_client import CircuitBreaker, ComfyUIClient, register_client_metrics
+from cost_model import AdmissionControl, AdmissionError, CostModel
+from drain import DrainGate
+from fast_json import FastJSONResponse, json_list_response
+from dispatch_queue import DispatchQueue
+from gateway_config import GatewayConfig, load_gateway_config
+from health import HealthMonitor
+from idempotency import IdempotencyStore
+from job_store import JobStore, decode_cursor, encode_cursor, record_status, record_to_job
+from job_tracker import (
+    DEFAULT_TENANT,
+    FINISHED_STATUSES,
+    JOB_STATUSES,
+    PRIORITY_ASYNC,
+    PRIORITY_BATCH,
+    STATUS_PENDING,
+    STATUS_QUEUED,
+    Job,
+    JobTracker,
+)
+from legacy_routes import build_service_router
+from loop_monitor import MAX_PROFILE_SECONDS, LoopMonitor, sample_stacks
+from metrics import MetricsRegistry
+from node_timings import NodeTimingStats
+from offload import default_pool as offload_pool
+from object_info import SchemaCache, WorkflowValidationError
+from postprocess import PostProcessor, artifact_file
+from prompt_enhance import MoonshotEnhancer
+from resumable_upload import ResumableUploads, build_upload_router
+from tenants import TenantError, TenantRegistry, request_api_key
+from trace_capture import install_trace_capture
+from tracing import JobTrace, Tracer, install_tracing
+from upload_cache import UploadCache
+from workflow_registry import WorkflowRegistry, build_default_registry
+
+# 配置日志
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_BACKEND = "default"
+PRIORITY_HEADER = "X-Priority"
+# 排程预估的最长缓存时间（秒）：执行进度的变化不会使缓存失效，最多这么久重新计算一次
+SCHEDULE_MAX_AGE = 1.0
+# 排程预估：({prompt_id: 预计完成的剩余秒数}, 队列清空秒数, {prompt_id: 本地队列中的位置})
+Schedule = Tuple[Dict[str, float], float, Dict[str, int]]
+
+
+def resolve_priority(request: Request, default: str = PRIORITY_ASYNC) -> str:
+    """调度优先级：由接口决定，调用方只能通过请求头降级为 batch"""
+    if (request.headers.get(PRIORITY_HEADER) or "").lower() == PRIORITY_BATCH:
+        return PRIORITY_BATCH
+    return default
+
+
+class Gateway:
+    """网关核心：所有模板共享的连接池、跟踪器、队列和缓存"""
+
+    def __init__(self, config: GatewayConfig, registry: Optional[WorkflowRegistry] = None):
+        self.config = config
+        self.registry = registry or build_default_registry()
+        self.metrics = MetricsRegistry()
+        self.clients: Dict[str, ComfyUIClient] = {
+            DEFAULT_BACKEND: ComfyUIClient(
+                config.comfyui_base_url,
+                name=DEFAULT_BACKEND,
+                ws_url=config.comfyui_ws_url,
+                replica_urls=config.comfyui_replica_urls,
+                breaker=CircuitBreaker(config.breaker_failure_threshold, config.breaker_reset_timeout),
+                read_retries=config.read_retries,
+                hedge_delay=config.hedge_delay
+            )
+        }
+        register_client_metrics(self.metrics, self.clients)
+        self.metrics.gauge(
+            "gateway_offload_pending",
+            "线程池中排队和执行中的 CPU 密集任务数（base64、JSON 序列化、图片摘要）",
+            (),
+            lambda: [((), offload_pool.pending)]
+        )
+        self.loop_monitor = LoopMonitor(slow_threshold=config.slow_callback_threshold, metrics=self.metrics)
+        self.health_monitor = HealthMonitor(
+            self.clients,
+            interval=config.health_interval,
+            failure_threshold=config.health_failure_threshold,
+            metrics=self.metrics
+        )
+        self.tracer = Tracer.from_config(config)
+        self.tracker = JobTracker(
+            self.registry,
+            self.clients,
+            poll_interval=config.poll_interval,
+            job_ttl=config.job_ttl,
+            tracer=self.tracer,
+            queue_index_ttl=config.health_interval * 2,
+            release_details=bool(config.job_db)
+        )
+        # 健康探测每个周期获取的 /queue 同时用于更新队列索引，状态查询不再单独获取 /queue
+        self.health_monitor.add_observer(self.tracker.update_queue)
+        # 任务历史（留空 job_db 时不持久化）
+        self.job_store: Optional[JobStore] = JobStore(config.job_db) if config.job_db else None
+        if self.job_store is not None:
+            self.tracker.add_observer(self.job_store.put)
+        self.tenants = TenantRegistry.from_config(config, metrics=self.metrics)
+        self.queue = DispatchQueue(
+            self.clients,
+            self.tracker,
+            max_inflight=config.max_inflight,
+            shortest_job_first=config.shortest_job_first,
+            priority_offsets=config.priority_offsets,
+            weight_of=self.tenants.weight,
+            metrics=self.metrics
+        )
+        self.uploads = UploadCache()
+        self.resumable_uploads = ResumableUploads.from_config(config)
+        self.idempotency = IdempotencyStore(config.idempotency_ttl, config.idempotency_max_keys)
+        self.metrics.gauge(
+            "gateway_idempotency_keys",
+            "保留中的 Idempotency-Key 数",
+            (),
+            lambda: [((), len(self.idempotency))]
+        )
+        self.metrics.counter_from(
+            "gateway_idempotency_replays_total",
+            "使用已有 Idempotency-Key 重试、返回原任务的提交数",
+            (),
+            lambda: [((), self.idempotency.replays)]
+        )
+        self.schemas = SchemaCache(self.clients, refresh_interval=config.object_info_refresh)
+        self.costs = CostModel(self.registry)
+        self.admission = AdmissionControl(config.max_request_seconds, config.max_tenant_seconds)
+        self.node_timings = NodeTimingStats(self.registry, metrics=self.metrics)
+        self.tracker.add_listener(self.costs.observe)
+        self.tracker.add_listener(self.node_timings.observe)
+        self.tracker.add_listener(self.admission.release)
+        self.tracker.add_listener(self.tenants.record_finished)
+        # 后端 -> (队列变化次数, 计算时间, 排程预估)；任务登记、提交、开始执行、结束时失效
+        self._schedules: Dict[str, Tuple[int, float, Schedule]] = {}
+        self.tracker.add_observer(self._invalidate_schedule)
+        # 输出后处理（未启用时为 None）
+        self.postprocessor: Optional[PostProcessor] = None
+        if config.postprocess:
+            self.postprocessor = PostProcessor(
+                config.postprocess_dir,
+                self.clients,
+                workers=config.postprocess_workers,
+                ffmpeg=config.postprocess_ffmpeg,
+                thumbnail_size=config.thumbnail_size,
+                preview_size=config.preview_size,
+                preview_bitrate=config.preview_bitrate,
+                retention=config.artifact_retention,
+                metrics=self.metrics,
+                on_done=self.job_store.put if self.job_store is not None else None
+            )
+            self.tracker.add_listener(self.postprocessor.observe)
+        self.enhancer = MoonshotEnhancer(
+            config.moonshot_api_key,
+            config.moonshot_api_url,
+            config.moonshot_model
+        )
+        self._started = False
+        # 预热（首轮健康探测、节点定义、节点耗时历史）在后台并发进行，不阻塞端口开始监听；
+        # 首轮健康探测完成前就绪检查返回 503
+        self._warmup: Optional[asyncio.Task] = None
+        # 启动各阶段的耗时（秒），total 为从开始启动到预热完成
+        self.startup_timings: Dict[str, float] = {}
+        self.metrics.gauge(
+            "gateway_startup_seconds",
+            "启动各阶段的耗时（total 为从开始启动到预热完成）",
+            ("phase",),
+            lambda: [((phase,), seconds) for phase, seconds in self.startup_timings.items()]
+        )
+        # 排空模式：不再接受新任务，等待同步接口的调用方拿到结果后再退出
+        self.drain_gate = DrainGate()
+
+    @contextmanager
+    def _phase(self, name: str):
+        """记录一个启动阶段的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[name] = round(time.perf_counter() - started, 4)
+
+    async def start(self):
+        if self._started:
+            return
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        # 启动时并发加载并编译全部模板，模板缺失或绑定错误时直接失败
+        with self._phase("compile"):
+            await asyncio.gather(*(loop.run_in_executor(None, template.compile) for template in self.registry))
+        self.drain_gate.open()
+        self.tracer.start()
+        await self.loop_monitor.start()
+        resumed: List[Job] = []
+        if self.job_store is not None:
+            with self._phase("resume"):
+                await loop.run_in_executor(None, self.job_store.open)
+                resumed = await self.resume()
+        await self.tenants.start()
+        if self.postprocessor is not None:
+            await self.postprocessor.start()
+        await self.tracker.start()
+        await self.queue.start()
+        self._started = True
+        self.startup_timings["start"] = round(time.perf_counter() - started, 4)
+        self._warmup = asyncio.create_task(self._warm_up(started))
+        if resumed:
+            # 已提交的任务只核对状态，不重复提交
+            asyncio.create_task(self.tracker.reconcile(resumed))
+        logger.info(f"网关已启动，模板: {', '.join(self.registry.names())}，ComfyUI: {self.config.comfyui_base_url}")
+
+    async def _warm_up(self, started: float):
+        """后台预热：首轮健康探测、获取节点定义、加载节点耗时历史并发进行"""
+        async def timed(name: str, step):
+            with self._phase(name):
+                await step
+
+        steps = [timed("health", self.health_monitor.start())]
+        if self.config.validate_workflows:
+            # 节点定义获取完成前的请求跳过本地校验，由 ComfyUI 校验
+            steps.append(timed("schemas", self.schemas.start()))
+        if self.job_store is not None:
+            steps.append(timed("node_timings", self.seed_node_timings()))
+        for result in await asyncio.gather(*steps, return_exceptions=True):
+            if isinstance(result, Exception):
+                logger.error(f"启动预热失败: {result}")
+        self.startup_timings["total"] = round(time.perf_counter() - started, 4)
+        logger.info(
+            f"网关预热完成，耗时 {self.startup_timings['total']:.2f}s（"
+            + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.startup_timings.items() if name != "total")
+            + "）"
+        )
+
+    async def seed_node_timings(self):
+        """用任务历史中最近完成的任务初始化节点耗时统计（重启后不必重新积累样本）"""
+        loop = asyncio.get_running_loop()
+        try:
+            samples = await loop.run_in_executor(None, self.job_store.recent_node_timings)
+        except Exception as e:
+            logger.error(f"读取节点耗时历史失败: {e}")
+            return
+        count = self.node_timings.seed(samples)
+        if count:
+            logger.info(f"已从任务历史加载 {count} 个任务的节点耗时")
+
+    async def resume(self) -> List[Job]:
+        """
+        恢复上次运行时未结束的任务，返回已提交到 ComfyUI 的任务
+
+        沿用上次的 client_id，ComfyUI 继续向本进程推送这些任务的执行事件；
+        尚未提交的任务重新放入本地队列
+        """
+        loop = asyncio.get_running_loop()
+        store = self.job_store
+        client_id = await loop.run_in_executor(None, store.load_state, "client_id")
+        if client_id:
+            self.tracker.client_id = client_id
+        else:
+            await loop.run_in_executor(None, store.save_state, "client_id", self.tracker.client_id)
+
+        cutoff = time.time() - self.config.job_ttl
+        expired = await loop.run_in_executor(
+            None, store.expire_unfinished, cutoff, "网关重启前未结束，状态已过期"
+        )
+        if expired:
+            logger.warning(f"{expired} 个过期的未结束任务已标记为失败")
+
+        submitted: List[Job] = []
+        queued = 0
+        for record in await loop.run_in_executor(None, store.unfinished, cutoff):
+            if record["template"] not in self.registry or record["backend"] not in self.clients:
+                logger.warning(f"无法恢复任务 {record['prompt_id']}：模板或后端已不存在")
+                continue
+            job = record_to_job(record)
+            self.admission.admit(job)
+            self.tracker.add(job)
+            if job.remote_id is None:
+                template = self.registry.get(job.template)
+                self.queue.put(job, template.prepare(job.params))
+                queued += 1
+            else:
+                self.tracker.restore_remote(job)
+                submitted.append(job)
+        if submitted or queued:
+            logger.info(f"已恢复上次运行的任务：{len(submitted)} 个已提交，{queued} 个重新排队")
+        return submitted
+
+    @property
+    def draining(self) -> bool:
+        return self.drain_gate.draining
+
+    def begin_drain(self):
+        """进入排空模式：拒绝新任务，就绪检查返回 503"""
+        self.drain_gate.begin()
+
+    async def drain(self, timeout: float):
+        """排空：最多等待 timeout 秒让同步接口的调用方拿到结果"""
+        await self.drain_gate.drain(timeout)
+
+    async def wait_result(self, prompt_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """同步接口等待任务结束并返回状态，超时返回 None；排空超时时返回 503"""
+        job = self.tracker.get(prompt_id)
+        if job is None:
+            # 幂等重试拿到的任务可能已结束并从内存中淘汰：返回任务历史中的结果
+            record = await self.lookup_record(prompt_id)
+            if record is None:
+                raise HTTPException(status_code=404, detail=f"任务不存在: {prompt_id}")
+            status = record_status(record)
+            return status if status["status"] in FINISHED_STATUSES else None
+        finished = await self.drain_gate.guard(self.tracker.wait(job, timeout), job.prompt_id)
+        return job.to_status() if finished else None
+
+    async def stop(self):
+        if not self._started:
+            return
+        self._started = False
+        if self._warmup is not None:
+            self._warmup.cancel()
+            await asyncio.gather(self._warmup, return_exceptions=True)
+            self._warmup = None
+        await self.queue.stop()
+        await self.tracker.stop()
+        if self.postprocessor is not None:
+            await self.postprocessor.stop()
+        await self.schemas.stop()
+        await self.tenants.stop()
+        await self.health_monitor.stop()
+        await self.loop_monitor.stop()
+        if self.job_store is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.job_store.close)
+        for client in self.clients.values():
+            await client.close()
+        await self.enhancer.close()
+        await self.tracer.stop()
+        offload_pool.shutdown()
+
+    async def authorize(self, request: Request) -> str:
+        """按 API Key 识别租户并消耗一次提交配额，返回租户名"""
+        return self.authorize_key(request_api_key(request))
+
+    def authorize_key(self, api_key: Optional[str]) -> str:
+        self.drain_gate.check_accepting()
+        try:
+            return self.tenants.authorize_key(api_key).name
+        except TenantError as e:
+            logger.warning(f"拒绝提交: {e}")
+            headers = {"Retry-After": str(max(math.ceil(e.retry_after), 1))} if e.retry_after else None
+            raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+    async def identify(self, request: Request) -> str:
+        """按 API Key 识别租户（不消耗配额）"""
+        return self.identify_key(request_api_key(request))
+
+    def identify_key(self, api_key: Optional[str]) -> str:
+        try:
+            return self.tenants.identify_key(api_key).name
+        except TenantError as e:
+            raise HTTPException(status_code=e.status_code, detail=str(e))
+
+    def resolve_priority(self, request: Request, default: str = PRIORITY_ASYNC) -> str:
+        return resolve_priority(request, default)
+
+    def select_backend(self) -> str:
+        return DEFAULT_BACKEND
+
+    async def submit(
+        self,
+        template_name: str,
+        request: BaseModel,
+        tenant: str = DEFAULT_TENANT,
+        priority: str = PRIORITY_ASYNC
+    ) -> str:
+        """准备工作流并放入调度队列，返回 prompt_id（此时尚未提交到 ComfyUI）"""
+        return self.submit_job(template_name, request, tenant, priority).prompt_id
+
+    def submit_job(
+        self,
+        template_name: str,
+        request: BaseModel,
+        tenant: str = DEFAULT_TENANT,
+        priority: str = PRIORITY_ASYNC
+    ) -> Job:
+        self.drain_gate.check_accepting()
+        template = self.registry.get(template_name)
+        with self.tracer.span("submit", template=template_name, tenant=tenant):
+            params = template.resolve_params(request)
+            workflow = template.prepare(params)
+            backend = self.select_backend()
+
+            # 参数错误在本地直接拒绝，不占用 ComfyUI 队列
+            if self.config.validate_workflows:
+                try:
+                    self.schemas.validate(backend, workflow, template.binding_table.labels)
+                except WorkflowValidationError as e:
+                    logger.warning(f"{template.name} 工作流校验失败: {e}")
+                    raise HTTPException(status_code=400, detail=str(e))
+
+            cost = self.costs.estimate(template_name, params)
+            try:
+                self.admission.check(tenant, cost)
+            except AdmissionError as e:
+                logger.warning(f"{template.name} 任务被拒绝（租户 {tenant}）: {e}")
+                headers = {"Retry-After": str(max(math.ceil(e.retry_after), 1))} if e.retry_after else None
+                raise HTTPException(status_code=e.status_code, detail=str(e), headers=headers)
+
+        job = Job(
+            prompt_id=str(uuid.uuid4()),
+            template=template_name,
+            backend=backend,
+            params=params,
+            tenant=tenant,
+            priority=priority
+        )
+        job.cost = cost
+        # 任务后台各阶段（排队、执行、各节点）的 span 挂在请求的 span 下
+        job_span = self.tracer.start_span(
+            "job",
+            attributes={"prompt_id": job.prompt_id, "template": template_name, "tenant": tenant, "priority": priority},
+            start=job.created_at
+        )
+        if job_span.sampled:
+            job.trace = JobTrace(job_span)
+        self.admission.admit(job)
+        self.tenants.record_submitted(job)
+        self.tracker.add(job)
+        self.queue.put(job, workflow)
+        return job
+
+    async def upload_image(self, file_content: bytes, filename: str) -> str:
+        """上传图片到 ComfyUI（相同内容只上传一次）"""
+        client = self.clients[self.select_backend()]
+        try:
+            return await self.uploads.upload(client, file_content, filename)
+        except httpx.HTTPError as e:
+            logger.error(f"上传图片失败: {e}")
+            raise HTTPException(status_code=500, detail=f"上传图片失败: {str(e)}")
+
+    async def get_status(self, prompt_id: str, template_name: Optional[str] = None) -> Dict[str, Any]:
+        """查询任务状态：优先读取本地跟踪状态，未跟踪的任务直接查询 ComfyUI"""
+        job = self.tracker.get(prompt_id)
+        if job is not None:
+            schedule = None if job.finished else self.schedule(job.backend)
+            return self._job_status(job, schedule)
+
+        # 已从内存中淘汰或网关重启前提交的任务：查询任务历史
+        record = await self.lookup_record(prompt_id)
+        if record is not None:
+            if record["status"] in FINISHED_STATUSES or record["remote_id"] is None:
+                return record_status(record)
+            status_info = await self.tracker.lookup_remote(
+                record["remote_id"], record["template"], record["backend"]
+            )
+            if status_info.get("status") in ("unknown", "error"):
+                return record_status(record)
+            status_info["template"] = record["template"]
+            return status_info
+
+        template_name = template_name or self.registry.names()[0]
+        return await self.tracker.lookup_remote(prompt_id, template_name, self.select_backend())
+
+    def _job_status(self, job: Job, schedule: Optional[Schedule] = None) -> Dict[str, Any]:
+        status_info = job.to_status()
+        status_info["template"] = job.template
+        if schedule is not None and not job.finished:
+            etas, _, positions = schedule
+            status_info["eta_seconds"] = round(etas.get(job.prompt_id, job.cost or 0.0), 1)
+            position = self._queue_position(job, positions)
+            if position is not None:
+                status_info["queue_position"] = position
+        return status_info
+
+    def _queue_position(self, job: Job, positions: Dict[str, int]) -> Optional[int]:
+        """
+        排在任务之前、尚未开始执行的任务数（从 0 开始）
+
+        已提交的任务取 ComfyUI 队列中的位置；本地排队的任务为 ComfyUI 中排队的任务数加本地队列中的位置。
+        读取健康探测维护的队列索引，不访问 ComfyUI；索引中还没有的任务（刚提交）不返回位置
+        """
+        index = self.tracker.cached_queue_index(job.backend)
+        if job.status == STATUS_QUEUED:
+            position = positions.get(job.prompt_id)
+            if position is None:
+                return None
+            return position + (index.pending if index is not None else 0)
+        if job.status == STATUS_PENDING and index is not None:
+            located = index.locate(job.remote_id or job.prompt_id)
+            if located is not None and located[0] == STATUS_PENDING:
+                return located[1]
+        return None
+
+    async def batch_status(self, prompt_ids: List[str]) -> List[Dict[str, Any]]:
+        """批量查询任务状态：跟踪中的任务读内存，其余一次查询任务历史，不访问 ComfyUI"""
+        results: Dict[str, Dict[str, Any]] = {}
+        schedules: Dict[str, Schedule] = {}
+        missing: List[str] = []
+        for prompt_id in prompt_ids:
+            job = self.tracker.get(prompt_id)
+            if job is None:
+                missing.append(prompt_id)
+                continue
+            schedule = None
+            if not job.finished:
+                schedule = schedules.get(job.backend)
+                if schedule is None:
+                    schedule = schedules[job.backend] = self.schedule(job.backend)
+            results[prompt_id] = self._job_status(job, schedule)
+
+        if missing and self.job_store is not None:
+            loop = asyncio.get_running_loop()
+            try:
+                records = await loop.run_in_executor(None, self.job_store.get_many, missing)
+            except Exception as e:
+                logger.error(f"查询任务历史失败: {e}")
+                records = {}
+            for prompt_id, record in records.items():
+                results[prompt_id] = record_status(record)
+
+        return [
+            {"prompt_id": prompt_id, **results.get(prompt_id, {"status": "unknown"})}
+            for prompt_id in prompt_ids
+        ]
+
+    async def list_jobs(
+        self,
+        tenant: str,
+        status: Optional[str] = None,
+        template: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        cursor: Optional[str] = None,
+        limit: int = 50
+    ) -> Dict[str, Any]:
+        """租户的任务列表（按提交时间倒序，游标分页）"""
+        if self.job_store is None:
+            raise HTTPException(status_code=503, detail="任务历史未启用（job_db 为空）")
+        if status is not None and status not in JOB_STATUSES:
+            raise HTTPException(status_code=400, detail=f"未知的任务状态: {status}")
+        if template is not None and template not in self.registry:
+            raise HTTPException(status_code=400, detail=f"未知的模板: {template}")
+        try:
+            before = decode_cursor(cursor) if cursor else None
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+        loop = asyncio.get_running_loop()
+        # 多取一条判断是否还有下一页
+        records = await loop.run_in_executor(
+            None,
+            lambda: self.job_store.query(
+                tenant=tenant, status=status, template=template,
+                since=since, until=until, before=before, limit=limit + 1
+            )
+        )
+        has_more = len(records) > limit
+        records = records[:limit]
+
+        jobs = []
+        for record in records:
+            # 未结束的任务使用内存中的最新进度（结束时的最终状态已写入任务历史）
+            job = self.tracker.get(record["prompt_id"])
+            if job is not None and not job.finished:
+                if status is not None and job.status != status:
+                    # 状态已变化（尚未记录到任务历史），不再符合筛选条件；游标仍按数据库中的记录计算
+                    continue
+                record.update(
+                    status=job.status,
+                    progress=job.progress,
+                    outputs=job.outputs,
+                    error=job.error,
+                    node_timings=job.node_timings,
+                    previews=job.previews
+                )
+            record.pop("remote_id", None)
+            record.pop("updated_at", None)
+            jobs.append(record)
+        return {
+            "jobs": jobs,
+            "next_cursor": encode_cursor(records[-1]) if has_more else None,
+        }
+
+    async def lookup_record(self, prompt_id: str) -> Optional[Dict[str, Any]]:
+        """从任务历史中查询任务"""
+        if self.job_store is None:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, self.job_store.get, prompt_id)
+        except Exception as e:
+            logger.error(f"查询任务历史失败: {e}")
+            return None
+
+    def schedule(self, backend: str) -> Schedule:
+        """
+        后端的排程预估：({prompt_id: 预计完成的剩余秒数}, 队列清空秒数, {prompt_id: 本地队列中的位置})
+
+        计算需要对整个本地队列排序，状态轮询时复用缓存：入队、出队或任务状态变化后重新计算，
+        否则最多缓存 SCHEDULE_MAX_AGE 秒（调用方不能修改返回的字典）
+        """
+        changes = self.queue.changes(backend)
+        now = time.monotonic()
+        cached = self._schedules.get(backend)
+        if cached is not None and cached[0] == changes and now - cached[1] < SCHEDULE_MAX_AGE:
+            return cached[2]
+        queued = self.queue.queued_jobs(backend)
+        etas, drain = self.costs.schedule(self.tracker.active_jobs(backend), queued)
+        schedule = (etas, drain, {job.prompt_id: position for position, job in enumerate(queued)})
+        self._schedules[backend] = (changes, now, schedule)
+        return schedule
+
+    def _invalidate_schedule(self, job: Job):
+        self._schedules.pop(job.backend, None)
+
+    async def queue_summary(self) -> Dict[str, Any]:
+        """各后端的排队情况与预估清空时间"""
+        backends = {}
+        for name in self.clients:
+            _, drain, _ = self.schedule(name)
+            backends[name] = {
+                "queued": self.queue.depth(name),
+                "inflight": self.queue.inflight(name),
+                "drain_seconds": round(drain, 1),
+            }
+        return {
+            "backends": backends,
+            "queue_wait": self.queue.wait_stats(),
+            "cost_model": self.costs.snapshot(),
+            "tenants": self.admission.snapshot(),
+        }
+
+    async def template_node_timings(self, template: str) -> Dict[str, Any]:
+        """模板各节点的执行耗时分位数"""
+        if template not in self.registry:
+            raise HTTPException(status_code=404, detail=f"未知模板: {template}")
+        return self.node_timings.snapshot(template)
+
+    async def health(self) -> Dict[str, Any]:
+        """健康检查（读取后台探测的结果）"""
+        state = self.health_monitor.backends[self.select_backend()]
+        result: Dict[str, Any] = {
+            "status": "healthy" if state.healthy else "unhealthy",
+            "comfyui_status": "connected" if state.healthy else "disconnected",
+        }
+        if not state.healthy:
+            result["error"] = state.last_error
+        result["backends"] = self.health_monitor.snapshot()
+        return result
+
+    def ready(self) -> bool:
+        """就绪：已启动、未在排空且至少一个后端可用"""
+        return self._started and not self.draining and self.health_monitor.ready()
+
+    async def readiness(self) -> Dict[str, Any]:
+        return {"ready": self.ready(), "backends": self.health_monitor.snapshot(), "startup": self.startup_timings}
+
+    async def usage(self, tenant: str, days: int = 30) -> Dict[str, Any]:
+        """租户用量：本次运行的累计值和按日历史"""
+        return {
+            "tenant": tenant,
+            "current": self.tenants.usage_of(tenant),
+            "daily": await self.tenants.history(tenant, days)
+        }
+
+    async def render_metrics(self) -> str:
+        return self.metrics.render()
+
+    async def artifact(self, prompt_id: str, name: str) -> Path:
+        """产物目录中的输出或预览文件"""
+        return artifact_file(self.config.postprocess_dir, prompt_id, name)
+
+    async def profile(self, seconds: float) -> str:
+        """采样本进程各线程的调用栈，返回折叠栈文本"""
+        if not self.config.debug_profile:
+            raise HTTPException(status_code=404, detail="未启用采样分析（[gateway] debug_profile）")
+        return await asyncio.get_running_loop().run_in_executor(None, sample_stacks, seconds)
+
+
+def _add_cors(app: FastAPI):
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+
+def _manage_lifecycle(app: FastAPI, gateway: Gateway):
+    """由 lifespan 管理网关的启动和排空退出（包裹应用已有的 lifespan）"""
+    previous = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        async with previous(app) as state:
+            await gateway.start()
+            try:
+                yield state
+            finally:
+                await gateway.drain(gateway.config.drain_timeout)
+                await gateway.stop()
+
+    app.router.lifespan_context = lifespan
+
+
+def create_gateway_app(gateway: Gateway, manage_lifecycle: bool = True) -> FastAPI:
+    """网关主应用：全部模板的兼容路由挂载在各自前缀下"""
+    app = FastAPI(
+        title="ComfyUI Flows Gateway",
+        description="统一的 ComfyUI 多工作流网关",
+        version="1.0.0"
+    )
+    _add_cors(app)
+    install_trace_capture(app, service="gateway")
+    install_tracing(app, gateway.tracer)
+
+    @app.get("/")
+    async def root():
+        """API 根路径"""
+        return {
+            "service": "ComfyUI Flows Gateway",
+            "version": "1.0.0",
+            "templates": {
+                template.name: {
+                    "title": template.title,
+                    "prefix": template.legacy_prefix,
+                    "legacy_port": template.legacy_port
+                }
+                for template in gateway.registry
+            },
+            "endpoints": {
+                "status": "/api/status/{prompt_id}",
+                "batch_status": "/api/status:batch",
+                "jobs": "/api/jobs",
+                "queue": "/api/queue",
+                "uploads": "/api/uploads",
+                "node_timings": "/api/templates/{template}/node_timings",
+                "metrics": "/metrics",
+                "usage": "/api/usage",
+                "health": "/health",
+                "live": "/health/live",
+                "ready": "/health/ready"
+            }
+        }
+
+    @app.get("/health")
+    async def health_check():
+        """健康检查"""
+        return await gateway.health()
+
+    @app.get("/health/live")
+    async def liveness():
+        """存活检查：与 ComfyUI 后端状态无关，后端故障时不应重启网关"""
+        return {"status": "alive"}
+
+    @app.get("/health/ready")
+    async def readiness():
+        """就绪检查：启动完成前或没有可用后端时返回 503，负载均衡器应暂停转发"""
+        state = await gateway.readiness()
+        return JSONResponse(
+            {
+                "status": "ready" if state["ready"] else "not_ready",
+                "backends": state["backends"],
+                "startup": state.get("startup", {})
+            },
+            status_code=200 if state["ready"] else 503
+        )
+
+    @app.get("/api/status/{prompt_id}")
+    async def get_task_status(prompt_id: str):
+        """查询任意模板的任务状态"""
+        status_info = await gateway.get_status(prompt_id)
+        return FastJSONResponse({
+            "prompt_id": prompt_id,
+            "template": status_info.get("template"),
+            "status": status_info.get("status", "unknown"),
+            "progress": status_info.get("progress"),
+            "outputs": status_info.get("outputs"),
+            "error": status_info.get("error"),
+            "eta_seconds": status_info.get("eta_seconds"),
+            "queue_position": status_info.get("queue_position"),
+            "previews": status_info.get("previews")
+        })
+
+    @app.post("/api/status:batch")
+    async def get_batch_status(request: BatchStatusRequest):
+        """批量查询任务状态（一次请求，不逐个访问 ComfyUI）"""
+        return json_list_response({}, "jobs", await gateway.batch_status(request.prompt_ids))
+
+    @app.get("/api/jobs")
+    async def list_jobs(
+        request: Request,
+        status: Optional[str] = None,
+        template: Optional[str] = None,
+        since: Optional[float] = Query(None, description="提交时间下限（Unix 时间戳）"),
+        until: Optional[float] = Query(None, description="提交时间上限（Unix 时间戳，不含）"),
+        cursor: Optional[str] = Query(None, description="上一页返回的 next_cursor"),
+        limit: int = Query(50, ge=1, le=1000)
+    ):
+        """当前租户（由 API Key 识别）的任务列表，按提交时间倒序"""
+        page = await gateway.list_jobs(
+            await gateway.identify(request),
+            status=status,
+            template=template,
+            since=since,
+            until=until,
+            cursor=cursor,
+            limit=limit
+        )
+        return json_list_response({"next_cursor": page["next_cursor"]}, "jobs", page["jobs"])
+
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def get_metrics():
+        """Prometheus 格式的运行指标"""
+        return PlainTextResponse(await gateway.render_metrics(), media_type="text/plain; version=0.0.4")
+
+    @app.get("/debug/profile", response_class=PlainTextResponse)
+    async def debug_profile(seconds: float = Query(10, gt=0, le=MAX_PROFILE_SECONDS)):
+        """采样分析：返回折叠栈格式，可用 flamegraph.pl 或 speedscope 查看"""
+        return PlainTextResponse(await gateway.profile(seconds))
+
+    @app.get("/artifacts/{prompt_id}/{name}")
+    async def get_artifact(prompt_id: str, name: str):
+        """后处理生成的预览文件（状态响应 previews 中的 url）"""
+        return FileResponse(await gateway.artifact(prompt_id, name))
+
+    @app.get("/api/usage")
+    async def get_usage(request: Request, days: int = 30):
+        """当前租户（由 API Key 识别）的用量：本次运行的累计值和按日历史"""
+        return await gateway.usage(await gateway.identify(request), days)
+
+    @app.get("/api/queue")
+    async def get_queue_summary():
+        """排队情况、预估清空时间和各租户未完成的预估耗时"""
+        return await gateway.queue_summary()
+
+    app.include_router(build_upload_router(gateway), tags=["uploads"])
+
+    @app.get("/api/templates/{template}/node_timings")
+    async def get_node_timings(template: str):
+        """模板各节点的执行耗时分位数和占比（按平均耗时从高到低），用于定位瓶颈节点"""
+        return await gateway.template_node_timings(template)
+
+    for template in gateway.registry:
+        app.include_router(
+            build_service_router(gateway, template),
+            prefix=template.legacy_prefix,
+            tags=[template.name]
+        )
+
+    if manage_lifecycle:
+        _manage_lifecycle(app, gateway)
+    return app
+
+
+def create_service_app(
+    template_name: str,
+    gateway: Optional[Gateway] = None,
+    manage_lifecycle: bool = True
+) -> FastAPI:
+    """单个模板的兼容应用：接口与原服务完全一致，挂载在根路径"""
+    if gateway is None:
+        gateway = Gateway(load_gateway_config())
+    template = gateway.registry.get(template_name)
+
+    app = FastAPI(
+        title=template.title,
+        description=f"{template.title}（由 ComfyUI Flows Gateway 提供）",
+        version="1.0.0"
+    )
+    _add_cors(app)
+    # 请求轨迹录制（设置 COMFYUI_TRACE_FILE 环境变量后启用）
+    install_trace_capture(app, service=template.name)
+    install_tracing(app, gateway.tracer)
+    app.include_router(build_service_router(gateway, template))
+    if template.kind == "image2video":
+        app.include_router(build_upload_router(gateway), tags=["uploads"])
+
+    if manage_lifecycle:
+        _manage_lifecycle(app, gateway)
+    return app
+
+
+def create_default_app() -> FastAPI:
+    """单端口模式：uvicorn gateway:create_default_app --factory"""
+    return create_gateway_app(Gateway(load_gateway_config()))
+
+
+class _SharedSignalServer:
+    """
+    多个 uvicorn.Server 共用一组信号处理
+
+    第一次收到信号时先排空网关（端口继续提供状态查询，新任务返回 503），再停止服务；
+    排空期间再次按 Ctrl+C（SIGINT）时立即停止，重复的 SIGTERM 不影响排空
+    （systemd 会同时向主进程和工作进程发送 SIGTERM）
+    """
+
+    def __init__(self, servers: List[Any], gateway: Any):
+        self.servers = servers
+        self.gateway = gateway
+        self._draining: Optional[asyncio.Task] = None
+
+    def install(self):
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self.handle_exit, sig)
+            except NotImplementedError:
+                signal.signal(sig, lambda signum, _: self.handle_exit(signum))
+
+    def handle_exit(self, sig: int = signal.SIGTERM):
+        if self._draining is None:
+            self._draining = asyncio.ensure_future(self._drain_and_exit())
+            return
+        if sig == signal.SIGINT:
+            logger.warning("再次收到退出信号，立即停止")
+            self._exit()
+
+    async def _drain_and_exit(self):
+        await self.gateway.drain(self.gateway.config.drain_timeout)
+        self._exit()
+
+    def _exit(self):
+        for server in self.servers:
+            server.should_exit = True
+
+
+def create_server(app: FastAPI, **kwargs) -> Any:
+    """创建不自行处理信号的 uvicorn.Server（由 _SharedSignalServer 统一处理）"""
+    import uvicorn
+
+    class _Server(uvicorn.Server):
+        def install_signal_handlers(self):
+            pass
+
+    return _Server(uvicorn.Config(app, log_level="info", **kwargs))
+
+
+async def serve(config: GatewayConfig):
+    """在一个进程内启动网关端口及（可选的）原服务端口；workers > 1 时改为多进程模式"""
+    if config.workers > 1:
+        from workers import serve_workers
+        await serve_workers(config)
+        return
+
+    gateway = Gateway(config)
+    apps = [(create_gateway_app(gateway, manage_lifecycle=False), config.port)]
+    if config.serve_legacy_ports:
+        for template in gateway.registry:
+            if template.legacy_port:
+                apps.append((create_service_app(template.name, gateway, manage_lifecycle=False), template.legacy_port))
+
+    servers = [create_server(app, host=config.host, port=port) for app, port in apps]
+    _SharedSignalServer(servers, gateway).install()
+
+    await gateway.start()
+    try:
+        await asyncio.gather(*(server.serve() for server in servers))
+    finally:
+        await gateway.stop()
+
+
+if __name__ == "__main__":
+    config = load_gateway_config()
+
+    print("=" * 60)
+    print("ComfyUI Flows Gateway")
+    print("=" * 60)
+    print(f"服务地址: http://{config.host}:{config.port}")
+    print(f"API 文档: http://{config.host}:{config.port}/docs")
+    if config.serve_legacy_ports:
+        print("兼容端口: 8000 (Qwen Image) / 8001 (Image to Video) / 5014 (Wan2.2 I2V)")
+    print(f"ComfyUI: {config.comfyui_base_url}")
+    if config.workers > 1:
+        print(f"工作进程: {config.workers}")
+    print("=" * 60)
+
+    asyncio.run(serve(config))
@@ -0,0 +1,155 @@
+"""
+网关配置
+从 config.ini 读取配置，文件不存在或缺少配置项时使用默认值
+"""
+
+import configparser
+import logging
+from pathlib import Path
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent
+DEFAULT_CONFIG_PATH = BASE_DIR / "config.ini"
+
+DEFAULT_COMFYUI_BASE_URL = "http://60.169.65.100:5000"
+DEFAULT_MOONSHOT_API_URL = "https://api.moonshot.cn/v1/chat/completions"
+DEFAULT_MOONSHOT_MODEL = "moonshot-v1-8k"
+
+
+class GatewayConfig:
+    """网关配置项"""
+
+    def __init__(self, parser: Optional[configparser.ConfigParser] = None):
+        parser = parser or configparser.ConfigParser()
+        self.parser = parser
+
+        # ComfyUI 服务配置
+        self.comfyui_base_url = parser.get('comfyui', 'base_url', fallback=DEFAULT_COMFYUI_BASE_URL)
+        self.comfyui_ws_url = parser.get('comfyui', 'ws_url', fallback='') or None
+        # 同一 ComfyUI 的其它访问地址（逗号分隔），用于幂等读取的对冲和熔断期间的读取
+        self.comfyui_replica_urls = [
+            url.strip() for url in parser.get('comfyui', 'replica_urls', fallback='').split(',') if url.strip()
+        ]
+        # 连续失败多少次后熔断，熔断多少秒后放行探测请求
+        self.breaker_failure_threshold = parser.getint('comfyui', 'breaker_failure_threshold', fallback=5)
+        self.breaker_reset_timeout = parser.getfloat('comfyui', 'breaker_reset_timeout', fallback=30.0)
+        # 幂等读取（/history、/queue、/view）的重试次数
+        self.read_retries = parser.getint('comfyui', 'read_retries', fallback=2)
+        # 主地址超过该时间（秒）未返回时向副本发送对冲请求，0 表示不对冲
+        self.hedge_delay = parser.getfloat('comfyui', 'hedge_delay', fallback=0.0)
+
+        # Moonshot AI API 配置
+        self.moonshot_api_key = parser.get('moonshot', 'api_key', fallback='')
+        self.moonshot_api_url = parser.get('moonshot', 'api_url', fallback=DEFAULT_MOONSHOT_API_URL)
+        self.moonshot_model = parser.get('moonshot', 'model', fallback=DEFAULT_MOONSHOT_MODEL)
+
+        # 网关进程配置
+        self.host = parser.get('gateway', 'host', fallback='0.0.0.0')
+        self.port = parser.getint('gateway', 'port', fallback=8080)
+        # 同一进程内同时监听旧服务端口（8000 / 8001 / 5014），旧客户端无需修改地址
+        self.serve_legacy_ports = parser.getboolean('gateway', 'serve_legacy_ports', fallback=True)
+        # HTTP 工作进程数，大于 1 时由主进程统一跟踪任务，工作进程通过本地套接字访问
+        self.workers = max(parser.getint('gateway', 'workers', fallback=1), 1)
+        # 主进程与工作进程通信的 Unix 套接字（相对路径基于项目目录）
+        self.ipc_socket = BASE_DIR / parser.get('gateway', 'ipc_socket', fallback='gateway.sock').strip()
+        # 每个 ComfyUI 后端同时提交的任务数上限，其余任务在网关本地排队
+        self.max_inflight = parser.getint('gateway', 'max_inflight', fallback=2)
+        # WebSocket 断开时轮询 /history 的间隔（秒）
+        self.poll_interval = parser.getfloat('gateway', 'poll_interval', fallback=5.0)
+        # 已结束任务在内存中保留的时间（秒）
+        self.job_ttl = parser.getfloat('gateway', 'job_ttl', fallback=3600.0)
+        # 退出时等待同步接口调用方拿到结果的最长时间（秒）
+        self.drain_timeout = parser.getfloat('gateway', 'drain_timeout', fallback=60.0)
+        # 提交接口 Idempotency-Key 的保留时间（秒）和最多保留的键数
+        self.idempotency_ttl = parser.getfloat('gateway', 'idempotency_ttl', fallback=86400.0)
+        self.idempotency_max_keys = parser.getint('gateway', 'idempotency_max_keys', fallback=100000)
+        # 任务历史数据库（相对路径基于项目目录，留空表示不持久化）
+        job_db = parser.get('gateway', 'job_db', fallback='jobs.db').strip()
+        self.job_db: Optional[Path] = (BASE_DIR / job_db) if job_db else None
+        # 事件循环被阻塞超过该时间（秒）时记录调用栈，0 表示不检测
+        self.slow_callback_threshold = parser.getfloat('gateway', 'slow_callback_threshold', fallback=0.1)
+        # 启用 /debug/profile 采样分析接口
+        self.debug_profile = parser.getboolean('gateway', 'debug_profile', fallback=False)
+        # 后端健康探测间隔（秒），连续失败多少次判定为不可用
+        self.health_interval = parser.getfloat('gateway', 'health_interval', fallback=5.0)
+        self.health_failure_threshold = parser.getint('gateway', 'health_failure_threshold', fallback=3)
+        # 提交前使用 ComfyUI /object_info 在本地校验工作流
+        self.validate_workflows = parser.getboolean('gateway', 'validate_workflows', fallback=True)
+        # 节点定义刷新间隔（秒），0 表示只在启动时拉取一次
+        self.object_info_refresh = parser.getfloat('gateway', 'object_info_refresh', fallback=600.0)
+        # 按预估耗时的准入限制（秒），0 表示不限制
+        self.max_request_seconds = parser.getfloat('gateway', 'max_request_seconds', fallback=0.0)
+        self.max_tenant_seconds = parser.getfloat('gateway', 'max_tenant_seconds', fallback=0.0)
+        # 同一优先级类别内按预估耗时从短到长调度
+        self.shortest_job_first = parser.getboolean('gateway', 'shortest_job_first', fallback=False)
+        # 优先级类别偏移（秒），格式: interactive:0, async:120, batch:900
+        self.priority_offsets = parse_priority_offsets(parser.get('gateway', 'priority_offsets', fallback=''))
+
+        # 可续传的分块上传：数据目录（多进程模式下各工作进程共享）、文件大小上限、分块大小上限、未完成上传的保留时间
+        self.upload_dir = BASE_DIR / parser.get('uploads', 'dir', fallback='uploads').strip()
+        self.upload_max_size = parser.getint('uploads', 'max_size', fallback=64 * 1024 * 1024)
+        self.upload_chunk_size = parser.getint('uploads', 'chunk_size', fallback=4 * 1024 * 1024)
+        self.upload_ttl = parser.getfloat('uploads', 'ttl', fallback=86400.0)
+
+        # 输出后处理：任务完成后在进程池中生成缩略图、视频封面和预览（需要 Pillow / ffmpeg）
+        self.postprocess = parser.getboolean('postprocess', 'enabled', fallback=False)
+        self.postprocess_dir = BASE_DIR / parser.get('postprocess', 'dir', fallback='artifacts').strip()
+        self.postprocess_workers = max(parser.getint('postprocess', 'workers', fallback=2), 1)
+        self.postprocess_ffmpeg = parser.get('postprocess', 'ffmpeg', fallback='ffmpeg').strip()
+        self.thumbnail_size = parser.getint('postprocess', 'thumbnail_size', fallback=320)
+        self.preview_size = parser.getint('postprocess', 'preview_size', fallback=480)
+        self.preview_bitrate = parser.get('postprocess', 'preview_bitrate', fallback='300k').strip()
+        # 产物目录的保留时间（秒），0 表示不清理
+        self.artifact_retention = parser.getfloat('postprocess', 'retention', fallback=86400.0)
+
+        # 分布式追踪：采样比例（0 表示关闭），导出到本地文件和/或 OTLP/HTTP collector
+        self.trace_sample_rate = parser.getfloat('tracing', 'sample_rate', fallback=0.0)
+        trace_file = parser.get('tracing', 'file', fallback='traces/spans.otlp.jsonl').strip()
+        self.trace_file: Optional[Path] = (BASE_DIR / trace_file) if trace_file else None
+        self.trace_endpoint = parser.get('tracing', 'endpoint', fallback='').strip() or None
+
+        # 租户配置（租户本身在 [tenant:<名称>] 小节中定义）
+        # 为 true 时拒绝未携带 API Key 的提交
+        self.require_api_key = parser.getboolean('tenants', 'require_api_key', fallback=False)
+        # 未携带 API Key 的调用方的速率限制（每秒提交数，0 表示不限制）
+        self.default_rate = parser.getfloat('tenants', 'default_rate', fallback=0.0)
+        self.default_burst = parser.getfloat('tenants', 'default_burst', fallback=10.0)
+        # 租户用量数据库（相对路径基于项目目录，留空表示不持久化）
+        usage_db = parser.get('tenants', 'usage_db', fallback='usage.db').strip()
+        self.usage_db: Optional[Path] = (BASE_DIR / usage_db) if usage_db else None
+        # 用量批量写入数据库的间隔（秒）
+        self.usage_flush_interval = parser.getfloat('tenants', 'usage_flush_interval', fallback=10.0)
+
+
+def parse_priority_offsets(value: str) -> Dict[str, float]:
+    """解析 "interactive:0, async:120, batch:900" 格式的优先级偏移"""
+    offsets: Dict[str, float] = {}
+    for item in value.split(','):
+        item = item.strip()
+        if not item:
+            continue
+        name, _, seconds = item.partition(':')
+        try:
+            offsets[name.strip()] = float(seconds)
+        except ValueError:
+            logger.warning(f"忽略无效的优先级偏移配置: {item}")
+    return offsets
+
+
+def load_gateway_config(path: Optional[Path] = None) -> GatewayConfig:
+    """加载配置文件"""
+    config_path = Path(path) if path else DEFAULT_CONFIG_PATH
+    parser = configparser.ConfigParser()
+
+    if config_path.exists():
+        parser.read(config_path, encoding='utf-8')
+    else:
+        logger.warning(f"配置文件不存在: {config_path}，使用默认配置")
+        logger.warning("如需修改配置，请复制 config.example.ini 为 config.ini")
+
+    config = GatewayConfig(parser)
+    if not config.moonshot_api_key:
+        logger.warning("Moonshot API Key 未配置，提示词优化功能将不可用")
+    return config
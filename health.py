@@ -0,0 +1,161 @@
+"""
+后端健康探测
+每个 ComfyUI 后端一个后台探测循环，定期请求 /queue 并记录延迟、队列长度和最近成功时间，
+/health 直接返回内存中的状态，不再每次请求都访问 ComfyUI
+
+- 存活（/health/live）：网关进程能正常处理请求即可，与后端状态无关
+- 就绪（/health/ready）：网关已启动且至少一个后端可用
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from comfyui_client import ComfyUIClient
+from metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+
+class BackendHealth:
+    """单个后端的最近探测结果"""
+
+    __slots__ = (
+        "name", "healthy", "latency", "queue_running", "queue_pending",
+        "last_success", "last_checked", "last_error", "failures"
+    )
+
+    def __init__(self, name: str):
+        self.name = name
+        # 尚未探测时为 None
+        self.healthy: Optional[bool] = None
+        self.latency: Optional[float] = None
+        self.queue_running = 0
+        self.queue_pending = 0
+        self.last_success: Optional[float] = None
+        self.last_checked: Optional[float] = None
+        self.last_error: Optional[str] = None
+        # 连续失败次数
+        self.failures = 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "status": {True: "healthy", False: "unhealthy", None: "unknown"}[self.healthy],
+            "latency_ms": round(self.latency * 1000, 1) if self.latency is not None else None,
+            "queue_running": self.queue_running,
+            "queue_pending": self.queue_pending,
+            "last_success": self.last_success,
+            "last_checked": self.last_checked,
+            "consecutive_failures": self.failures,
+            "error": self.last_error,
+        }
+
+
+class HealthMonitor:
+    """
+    后台健康探测
+
+    连续失败 failure_threshold 次才判定为不可用，偶发的超时或重启不会立即影响就绪状态
+    """
+
+    def __init__(
+        self,
+        clients: Dict[str, ComfyUIClient],
+        interval: float = 5.0,
+        timeout: float = 5.0,
+        failure_threshold: int = 3,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        self.clients = clients
+        self.interval = interval
+        self.timeout = timeout
+        self.failure_threshold = failure_threshold
+        self.backends: Dict[str, BackendHealth] = {name: BackendHealth(name) for name in clients}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # 每次成功获取 /queue 后调用，参数为 (后端, /queue 结果)
+        self._observers: List[Callable[[str, Dict[str, Any]], Any]] = []
+
+        metrics = metrics or MetricsRegistry()
+        metrics.gauge(
+            "gateway_backend_up",
+            "ComfyUI 后端是否可用（1 可用，0 不可用）",
+            ("backend",),
+            lambda: [((name,), 1 if state.healthy else 0) for name, state in self.backends.items()]
+        )
+        metrics.gauge(
+            "gateway_backend_probe_latency_seconds",
+            "最近一次健康探测的耗时",
+            ("backend",),
+            lambda: [((name,), state.latency) for name, state in self.backends.items() if state.latency is not None]
+        )
+        metrics.gauge(
+            "gateway_backend_comfyui_queue",
+            "最近一次探测到的 ComfyUI 队列长度",
+            ("backend", "state"),
+            self._collect_queue
+        )
+
+    def add_observer(self, callback: Callable[[str, Dict[str, Any]], Any]):
+        self._observers.append(callback)
+
+    async def start(self):
+        # 启动时先探测一轮，就绪状态不必等到第一个探测周期
+        await asyncio.gather(*(self.probe(name) for name in self.clients))
+        for name in self.clients:
+            self._tasks[name] = asyncio.create_task(self._probe_loop(name))
+
+    async def stop(self):
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+        self._tasks.clear()
+
+    async def probe(self, backend: str):
+        """探测一次后端并更新状态"""
+        state = self.backends[backend]
+        started = time.perf_counter()
+        try:
+            queue_data = await self.clients[backend].get_queue(timeout=self.timeout)
+        except Exception as e:
+            state.last_checked = time.time()
+            state.last_error = str(e) or type(e).__name__
+            state.failures += 1
+            if state.failures >= self.failure_threshold or state.healthy is None:
+                if state.healthy is not False:
+                    logger.warning(f"ComfyUI 后端 {backend} 不可用: {state.last_error}")
+                state.healthy = False
+            return
+
+        state.latency = time.perf_counter() - started
+        state.queue_running = len(queue_data.get("queue_running", []))
+        state.queue_pending = len(queue_data.get("queue_pending", []))
+        state.last_checked = state.last_success = time.time()
+        state.last_error = None
+        state.failures = 0
+        if state.healthy is False:
+            logger.info(f"ComfyUI 后端 {backend} 已恢复")
+        state.healthy = True
+        for observer in self._observers:
+            try:
+                observer(backend, queue_data)
+            except Exception as e:
+                logger.error(f"处理 {backend} 的队列数据失败: {e}")
+
+    async def _probe_loop(self, backend: str):
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.probe(backend)
+
+    def ready(self) -> bool:
+        """至少一个后端可用"""
+        return any(state.healthy for state in self.backends.values())
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {name: state.to_dict() for name, state in self.backends.items()}
+
+    def _collect_queue(self):
+        for name, state in self.backends.items():
+            if state.last_success is not None:
+                yield (name, "running"), state.queue_running
+                yield (name, "pending"), state.queue_pending
@@ -0,0 +1,141 @@
+"""
+提交接口的幂等键
+客户端在请求头 Idempotency-Key 中携带同一个键重试提交时，返回第一次提交的 prompt_id，
+不会重复上传图片、重复提交任务；第一次请求仍在处理时，重试的请求等待它的结果
+
+键按租户隔离，完成后保留 ttl 秒，最多保留 max_keys 个（超出时淘汰最早完成的）
+"""
+
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from fastapi import HTTPException
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+# 幂等键的最大长度
+MAX_KEY_LENGTH = 255
+# 等待进行中的相同请求的最长时间（秒）；第一次请求超过该时间仍未完成时视为已放弃
+CLAIM_TIMEOUT = 120.0
+
+
+def request_fingerprint(endpoint: str, params: Dict[str, Any]) -> str:
+    """请求的摘要：同一个幂等键只能用于参数相同的请求"""
+    body = json.dumps([endpoint, params], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("fingerprint", "prompt_id", "started_at", "finished_at", "done")
+
+    def __init__(self, fingerprint: str):
+        self.fingerprint = fingerprint
+        self.prompt_id: Optional[str] = None
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        # 第一次请求结束时设置：结果为 prompt_id，请求失败时为 None
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+
+class IdempotencyStore:
+    """(租户, 幂等键) -> prompt_id 的有界存储"""
+
+    def __init__(self, ttl: float = 86400.0, max_keys: int = 100000):
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self.replays = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def claim(self, tenant: str, key: str, fingerprint: str) -> Optional[str]:
+        """
+        登记一次提交
+
+        返回 None 表示调用方应执行提交，并在结束后调用 complete 或 release；
+        否则返回第一次提交的 prompt_id（进行中时等待其完成）
+        """
+        if not key or len(key) > MAX_KEY_LENGTH:
+            raise HTTPException(status_code=400, detail=f"{IDEMPOTENCY_HEADER} 长度应为 1-{MAX_KEY_LENGTH} 个字符")
+        slot = (tenant, key)
+        while True:
+            entry = self._entries.get(slot)
+            now = time.monotonic()
+            if entry is not None and self._expired(entry, now):
+                del self._entries[slot]
+                entry = None
+            if entry is None:
+                self._entries[slot] = _Entry(fingerprint)
+                self._prune(now)
+                return None
+
+            if entry.fingerprint != fingerprint:
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"{IDEMPOTENCY_HEADER} 已用于参数不同的请求"
+                )
+            if entry.prompt_id is not None:
+                self.replays += 1
+                logger.info(f"幂等键重复提交，返回已有任务: {entry.prompt_id}")
+                return entry.prompt_id
+
+            remaining = entry.started_at + CLAIM_TIMEOUT - now
+            try:
+                await asyncio.wait_for(asyncio.shield(entry.done), remaining)
+            except asyncio.TimeoutError:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"相同 {IDEMPOTENCY_HEADER} 的请求仍在处理中，请稍后重试",
+                    headers={"Retry-After": "5"}
+                )
+            # 第一次请求失败时重新登记，由本次请求执行提交
+
+    async def complete(self, tenant: str, key: str, prompt_id: str):
+        """提交成功：记录 prompt_id，唤醒等待的重复请求"""
+        entry = self._entries.get((tenant, key))
+        if entry is None or entry.done.done():
+            return
+        entry.prompt_id = prompt_id
+        entry.finished_at = time.monotonic()
+        entry.done.set_result(prompt_id)
+        self._entries.move_to_end((tenant, key))
+
+    async def release(self, tenant: str, key: str):
+        """提交失败：删除登记，之后的重试重新执行提交"""
+        entry = self._entries.pop((tenant, key), None)
+        if entry is not None and not entry.done.done():
+            entry.done.set_result(None)
+
+    def _expired(self, entry: _Entry, now: float) -> bool:
+        if entry.finished_at is not None:
+            return now - entry.finished_at > self.ttl
+        # 进行中的请求超时仍未完成（如处理它的工作进程已退出）
+        return now - entry.started_at > CLAIM_TIMEOUT
+
+    def _prune(self, now: float):
+        """
+        淘汰过期的键；超出 max_keys 时淘汰最早完成的键
+
+        进行中的键不会因超出容量被淘汰（否则重试会重复提交），容量只是完成的键的上限。
+        完成的键按完成时间排列，进行中的键数量受并发数限制，扫描到未过期的完成的键就可以停止
+        """
+        stale = []
+        excess = len(self._entries) - self.max_keys
+        for slot, entry in self._entries.items():
+            if self._expired(entry, now):
+                stale.append(slot)
+            elif entry.finished_at is not None:
+                if len(stale) >= excess:
+                    break
+                stale.append(slot)
+        for slot in stale:
+            entry = self._entries.pop(slot)
+            if not entry.done.done():
+                entry.done.set_result(None)
@@ -47,9 +47,9 @@ echo -e "Group: ${GREEN}$CURRENT_GROUP${NC}"
 WORKING_DIR=$(pwd)
 echo -e "Working Directory: ${GREEN}$WORKING_DIR${NC}"
 
-# Check if wan22_i2v_14b_4.py exists
-if [ ! -f "$WORKING_DIR/wan22_i2v_14b_4.py" ]; then
-    echo -e "${RED}Error: wan22_i2v_14b_4.py not found in current directory${NC}"
+# Check if gateway.py exists
+if [ ! -f "$WORKING_DIR/gateway.py" ]; then
+    echo -e "${RED}Error: gateway.py not found in current directory${NC}"
     echo -e "${YELLOW}Please run this script from the project root directory${NC}"
     exit 1
 fi
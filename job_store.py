@@ -0,0 +1,399 @@
+"""
+任务历史索引
+每个任务（请求参数、模板、后端、租户、各阶段时间、输出描述）都记录到本地 SQLite，
+ComfyUI 清理 /history 或网关重启后仍可查询任务状态
+
+- WAL 模式：写入不阻塞读取
+- 批量写入：状态变更先合并在内存中（同一任务只保留最新状态），由单独的写线程定期一次事务写入
+- 重启交接：未结束的任务在下次启动时恢复跟踪（已提交的不会重复提交）
+"""
+
+import base64
+import json
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from job_tracker import FINISHED_STATUSES, PRIORITY_ASYNC, STATUS_COMPLETED, STATUS_FAILED, Job
+
+logger = logging.getLogger(__name__)
+
+# 列顺序与 _UPSERT 一致
+COLUMNS = (
+    "prompt_id", "remote_id", "template", "backend", "tenant", "priority", "status",
+    "progress", "cost", "params", "outputs", "error",
+    "created_at", "submitted_at", "started_at", "finished_at", "updated_at", "node_timings", "previews",
+)
+# 以 JSON 文本存储的列
+_JSON_COLUMNS = ("params", "outputs", "node_timings", "previews")
+# 任务结束后内存中会释放的列：写入 NULL 时保留已有的值
+_RETAINED_COLUMNS = ("params", "node_timings")
+# 旧版本数据库缺少的列：列名 -> 类型
+_ADDED_COLUMNS = {"node_timings": "TEXT", "previews": "TEXT"}
+
+_SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS jobs (
+        prompt_id TEXT PRIMARY KEY,
+        remote_id TEXT,
+        template TEXT NOT NULL,
+        backend TEXT NOT NULL,
+        tenant TEXT NOT NULL,
+        priority TEXT,
+        status TEXT NOT NULL,
+        progress REAL,
+        cost REAL,
+        params TEXT,
+        outputs TEXT,
+        error TEXT,
+        created_at REAL NOT NULL,
+        submitted_at REAL,
+        started_at REAL,
+        finished_at REAL,
+        updated_at REAL NOT NULL,
+        node_timings TEXT,
+        previews TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS jobs_remote_id ON jobs (remote_id)",
+    "CREATE INDEX IF NOT EXISTS jobs_tenant_created ON jobs (tenant, created_at)",
+    "CREATE INDEX IF NOT EXISTS jobs_created ON jobs (created_at)",
+    # 网关自身的状态（如 ComfyUI client_id），重启后沿用
+    "CREATE TABLE IF NOT EXISTS gateway_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+)
+
+_SELECT = f"SELECT {', '.join(COLUMNS)} FROM jobs"
+# SQLite 单条语句的参数个数上限较低（旧版本为 999）
+_MAX_PARAMS = 900
+
+_UPSERT = (
+    f"INSERT INTO jobs ({', '.join(COLUMNS)}) VALUES ({', '.join('?' for _ in COLUMNS)}) "
+    "ON CONFLICT (prompt_id) DO UPDATE SET "
+    + ", ".join(
+        f"{column} = COALESCE(excluded.{column}, {column})" if column in _RETAINED_COLUMNS
+        else f"{column} = excluded.{column}"
+        for column in COLUMNS[1:]
+    )
+)
+_RETAINED_INDEXES = tuple(COLUMNS.index(column) for column in _RETAINED_COLUMNS)
+
+
+def job_row(job: Job) -> tuple:
+    """任务的当前状态（在事件循环中调用，只做序列化，不访问数据库）"""
+    return (
+        job.prompt_id, job.remote_id, job.template, job.backend, job.tenant, job.priority, job.status,
+        job.progress, job.cost,
+        json.dumps(job.params, ensure_ascii=False, default=str) if job.params is not None else None,
+        json.dumps(job.outputs, ensure_ascii=False) if job.outputs is not None else None,
+        job.error,
+        job.created_at, job.submitted_at, job.started_at, job.finished_at, time.time(),
+        json.dumps(job.node_timings) if job.node_timings is not None else None,
+        json.dumps(job.previews) if job.previews is not None else None,
+    )
+
+
+def row_to_record(row: tuple) -> Dict[str, Any]:
+    record = dict(zip(COLUMNS, row))
+    for column in _JSON_COLUMNS:
+        if record[column] is not None:
+            record[column] = json.loads(record[column])
+    return record
+
+
+class JobStore:
+    """任务历史的 SQLite 存储"""
+
+    def __init__(self, path: Path, flush_interval: float = 1.0, batch_size: int = 500):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        # prompt_id -> 尚未写入的最新状态
+        self._pending: Dict[str, tuple] = {}
+        self._cond = threading.Condition()
+        self._closing = False
+        self._writer: Optional[threading.Thread] = None
+        self._local = threading.local()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def _reader(self) -> sqlite3.Connection:
+        """每个线程一个连接（查询和少量的状态写入，任务写入只由写线程进行）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    def open(self):
+        conn = self._connect()
+        try:
+            with conn:
+                for statement in _SCHEMA:
+                    conn.execute(statement)
+                existing = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+                for column, column_type in _ADDED_COLUMNS.items():
+                    if column not in existing:
+                        conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        finally:
+            conn.close()
+        self._closing = False
+        self._writer = threading.Thread(target=self._write_loop, name="job-store-writer", daemon=True)
+        self._writer.start()
+
+    def close(self):
+        """写入剩余状态并停止写线程（阻塞，在线程池中调用）"""
+        if self._writer is None:
+            return
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        self._writer.join()
+        self._writer = None
+
+    # ------------------------------------------------------------------
+    # 写入
+    # ------------------------------------------------------------------
+
+    def put(self, job: Job):
+        """记录任务的最新状态（不阻塞）"""
+        row = job_row(job)
+        with self._cond:
+            previous = self._pending.get(job.prompt_id)
+            if previous is not None and any(row[i] is None for i in _RETAINED_INDEXES):
+                # 已释放参数的任务（如后处理完成后更新预览）：沿用尚未写入的参数和节点耗时
+                row = tuple(
+                    previous[i] if row[i] is None and i in _RETAINED_INDEXES else value
+                    for i, value in enumerate(row)
+                )
+            self._pending[job.prompt_id] = row
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _write_loop(self):
+        conn = self._connect()
+        try:
+            while True:
+                with self._cond:
+                    if not self._pending and not self._closing:
+                        self._cond.wait(self.flush_interval)
+                    batch, self._pending = self._pending, {}
+                    closing = self._closing
+                if batch:
+                    self._write(conn, batch)
+                if closing:
+                    with self._cond:
+                        if not self._pending:
+                            return
+        finally:
+            conn.close()
+
+    def _write(self, conn: sqlite3.Connection, batch: Dict[str, tuple]):
+        try:
+            with conn:
+                conn.executemany(_UPSERT, batch.values())
+        except sqlite3.Error as e:
+            logger.error(f"写入任务历史失败: {e}")
+            if self._closing:
+                return
+            # 写入失败时并回内存（保留更新的状态），下次重试
+            with self._cond:
+                for prompt_id, row in batch.items():
+                    self._pending.setdefault(prompt_id, row)
+            time.sleep(self.flush_interval)
+
+    # ------------------------------------------------------------------
+    # 查询与重启交接（阻塞，在线程池中调用）
+    # ------------------------------------------------------------------
+
+    def get(self, prompt_id: str) -> Optional[Dict[str, Any]]:
+        """按网关 prompt_id 或 ComfyUI prompt_id 查询任务"""
+        with self._cond:
+            row = self._pending.get(prompt_id)
+        if row is None:
+            conn = self._reader()
+            row = conn.execute(f"{_SELECT} WHERE prompt_id = ?", (prompt_id,)).fetchone()
+            if row is None:
+                row = conn.execute(f"{_SELECT} WHERE remote_id = ? LIMIT 1", (prompt_id,)).fetchone()
+        return row_to_record(row) if row is not None else None
+
+    def unfinished(self, since: float) -> List[Dict[str, Any]]:
+        """since 之后提交、尚未结束的任务（按提交时间排序）"""
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        cursor = self._reader().execute(
+            f"{_SELECT} WHERE created_at >= ? AND status NOT IN ({placeholders}) ORDER BY created_at",
+            (since, *FINISHED_STATUSES)
+        )
+        return [row_to_record(row) for row in cursor.fetchall()]
+
+    def recent_node_timings(self, limit: int = 1000) -> List[Tuple[str, Dict[str, float]]]:
+        """最近完成的任务的 (模板, 节点耗时)，按完成时间从早到晚排列"""
+        cursor = self._reader().execute(
+            "SELECT template, node_timings FROM jobs WHERE status = ? AND node_timings IS NOT NULL "
+            "ORDER BY finished_at DESC LIMIT ?",
+            (STATUS_COMPLETED, limit)
+        )
+        return [(template, json.loads(timings)) for template, timings in reversed(cursor.fetchall())]
+
+    def expire_unfinished(self, before: float, error: str) -> int:
+        """把 before 之前提交、仍未结束的任务标记为失败，返回条数"""
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        conn = self._reader()
+        now = time.time()
+        with conn:
+            cursor = conn.execute(
+                f"UPDATE jobs SET status = ?, error = ?, finished_at = ?, updated_at = ? "
+                f"WHERE created_at < ? AND status NOT IN ({placeholders})",
+                (STATUS_FAILED, error, now, now, before, *FINISHED_STATUSES)
+            )
+        return cursor.rowcount
+
+    def load_state(self, key: str) -> Optional[str]:
+        row = self._reader().execute("SELECT value FROM gateway_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row is not None else None
+
+    def save_state(self, key: str, value: str):
+        conn = self._reader()
+        with conn:
+            conn.execute(
+                "INSERT INTO gateway_state (key, value) VALUES (?, ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (key, value)
+            )
+
+    def get_many(self, prompt_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """批量查询任务（只按网关 prompt_id），返回 {prompt_id: 任务记录}"""
+        wanted = list(dict.fromkeys(prompt_ids))
+        with self._cond:
+            rows = {prompt_id: self._pending[prompt_id] for prompt_id in wanted if prompt_id in self._pending}
+        missing = [prompt_id for prompt_id in wanted if prompt_id not in rows]
+        conn = self._reader()
+        for start in range(0, len(missing), _MAX_PARAMS):
+            chunk = missing[start:start + _MAX_PARAMS]
+            cursor = conn.execute(f"{_SELECT} WHERE prompt_id IN ({', '.join('?' for _ in chunk)})", chunk)
+            for row in cursor.fetchall():
+                rows[row[0]] = row
+        return {prompt_id: row_to_record(row) for prompt_id, row in rows.items()}
+
+    def query(
+        self,
+        tenant: Optional[str] = None,
+        status: Optional[str] = None,
+        template: Optional[str] = None,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+        before: Optional[Tuple[float, str]] = None,
+        limit: int = 50
+    ) -> List[Dict[str, Any]]:
+        """
+        按条件列出任务（按提交时间倒序）
+
+        before 为上一页最后一条的 (created_at, prompt_id)，用于游标分页
+        """
+        # 先取尚未写入的状态再查询数据库：查询期间被写入的状态至少出现在其中一处
+        with self._cond:
+            pending = list(self._pending.values())
+        conditions: List[str] = []
+        args: List[Any] = []
+        if tenant is not None:
+            conditions.append("tenant = ?")
+            args.append(tenant)
+        if status is not None:
+            conditions.append("status = ?")
+            args.append(status)
+        if template is not None:
+            conditions.append("template = ?")
+            args.append(template)
+        if since is not None:
+            conditions.append("created_at >= ?")
+            args.append(since)
+        if until is not None:
+            conditions.append("created_at < ?")
+            args.append(until)
+        if before is not None:
+            conditions.append("(created_at < ? OR (created_at = ? AND prompt_id < ?))")
+            args.extend((before[0], before[0], before[1]))
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        # 每个未写入的状态最多使数据库中的一行不再符合条件：多取 len(pending) 行，合并后仍有 limit 行
+        cursor = self._reader().execute(
+            f"{_SELECT}{where} ORDER BY created_at DESC, prompt_id DESC LIMIT ?", (*args, limit + len(pending))
+        )
+        rows = {row[0]: row for row in cursor.fetchall()}
+
+        # 尚未写入的状态：覆盖数据库中的旧状态，并补上还未写入的新任务
+        index = {column: i for i, column in enumerate(COLUMNS)}
+        for row in pending:
+            created_at, prompt_id = row[index["created_at"]], row[0]
+            matched = (
+                (tenant is None or row[index["tenant"]] == tenant)
+                and (status is None or row[index["status"]] == status)
+                and (template is None or row[index["template"]] == template)
+                and (since is None or created_at >= since)
+                and (until is None or created_at < until)
+                and (before is None or (created_at, prompt_id) < before)
+            )
+            if matched:
+                rows[prompt_id] = row
+            else:
+                rows.pop(prompt_id, None)
+        ordered = sorted(rows.values(), key=lambda row: (row[index["created_at"]], row[0]), reverse=True)
+        return [row_to_record(row) for row in ordered[:limit]]
+
+
+def encode_cursor(record: Dict[str, Any]) -> str:
+    """分页游标：最后一条记录的 (created_at, prompt_id)"""
+    raw = json.dumps([record["created_at"], record["prompt_id"]]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    """解析分页游标，格式错误时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, prompt_id = json.loads(raw)
+        return float(created_at), str(prompt_id)
+    except Exception:
+        raise ValueError(f"无效的分页游标: {cursor}")
+
+
+def record_to_job(record: Dict[str, Any]) -> Job:
+    """由任务记录重建任务（用于重启后恢复跟踪）"""
+    job = Job(
+        prompt_id=record["prompt_id"],
+        template=record["template"],
+        backend=record["backend"],
+        params=record["params"] or {},
+        tenant=record["tenant"],
+        priority=record["priority"] or PRIORITY_ASYNC
+    )
+    job.remote_id = record["remote_id"]
+    job.status = record["status"]
+    job.progress = record["progress"]
+    job.cost = record["cost"]
+    job.created_at = record["created_at"]
+    job.submitted_at = record["submitted_at"]
+    job.started_at = record["started_at"]
+    job.node_timings = record["node_timings"]
+    job.previews = record["previews"]
+    return job
+
+
+def record_status(record: Dict[str, Any]) -> Dict[str, Any]:
+    """任务记录转换为状态查询的结果"""
+    return {
+        "status": record["status"],
+        "progress": record["progress"],
+        "outputs": record["outputs"],
+        "error": record["error"],
+        "previews": record["previews"],
+        "template": record["template"],
+    }
@@ -0,0 +1,672 @@
+"""
+任务状态跟踪
+订阅 ComfyUI WebSocket 事件维护本地任务状态，WebSocket 不可用时回退到轮询 /history
+"""
+
+import asyncio
+import heapq
+import inspect
+import json
+import logging
+import math
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+from comfyui_client import CircuitOpenError, ComfyUIClient
+from tracing import JobTrace, Tracer
+from workflow_registry import WorkflowRegistry
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+STATUS_QUEUED = "queued"        # 在网关本地队列中等待提交
+STATUS_PENDING = "pending"      # 已提交，在 ComfyUI 队列中等待
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+
+ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+FINISHED_STATUSES = (STATUS_COMPLETED, STATUS_FAILED)
+JOB_STATUSES = (STATUS_QUEUED,) + ACTIVE_STATUSES + FINISHED_STATUSES
+
+# 未识别调用方时使用的租户
+DEFAULT_TENANT = "anonymous"
+
+# 调度优先级类别
+PRIORITY_INTERACTIVE = "interactive"    # 同步接口，调用方在等待结果
+PRIORITY_ASYNC = "async"                # 异步接口
+PRIORITY_BATCH = "batch"                # 批量任务
+PRIORITIES = (PRIORITY_INTERACTIVE, PRIORITY_ASYNC, PRIORITY_BATCH)
+
+# 直接查询 ComfyUI 得到的已结束任务状态的缓存条数
+REMOTE_STATUS_CACHE_SIZE = 1024
+# 队列索引中查不到任务时，索引早于该时间（秒）才重新获取 /queue（索引建立之后提交的任务），
+# 查询不存在的任务时每个后端每秒最多获取一次
+QUEUE_INDEX_MISS_AGE = 1.0
+
+
+class Job:
+    """
+    网关跟踪的单个任务
+
+    只保存状态查询需要的字段（输出是提取后的描述，不保留 /history 原始 JSON）；
+    配置了任务历史时，任务结束并写入历史后释放请求参数和节点耗时（params、node_timings 变为 None）。
+    使用 __slots__，十万级任务常驻内存时每个任务省去一个属性字典
+    """
+
+    __slots__ = (
+        "prompt_id", "template", "backend", "params", "tenant", "priority", "cost", "remote_id",
+        "status", "progress", "outputs", "error", "created_at", "submitted_at", "started_at",
+        "finished_at", "last_refresh", "node_timings", "running_node", "previews", "trace", "_done",
+    )
+
+    def __init__(
+        self,
+        prompt_id: str,
+        template: str,
+        backend: str,
+        params: Dict[str, Any],
+        tenant: str = DEFAULT_TENANT,
+        priority: str = PRIORITY_ASYNC
+    ):
+        self.prompt_id = prompt_id
+        self.template = template
+        self.backend = backend
+        # 任务结束并写入任务历史后可能被释放为 None
+        self.params: Optional[Dict[str, Any]] = params
+        self.tenant = tenant
+        self.priority = priority
+        # 预估执行时间（秒）
+        self.cost: Optional[float] = None
+        # ComfyUI 返回的 prompt_id（旧版本 ComfyUI 不沿用请求中的 prompt_id）
+        self.remote_id: Optional[str] = None
+        self.status = STATUS_QUEUED
+        self.progress: Optional[float] = None
+        self.outputs: Optional[List[Dict[str, Any]]] = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.submitted_at: Optional[float] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.last_refresh = 0.0
+        # 各节点的执行耗时（秒），节点 ID -> 耗时；缓存命中的节点不计入
+        self.node_timings: Optional[Dict[str, float]] = None
+        # 正在执行的节点及其开始时间
+        self.running_node: Optional[Tuple[str, float]] = None
+        # 后处理生成的预览文件（缩略图、封面、预览视频），未启用或尚未生成时为 None
+        self.previews: Optional[List[Dict[str, Any]]] = None
+        # 已采样任务的追踪 span（未采样时为 None）
+        self.trace: Optional[JobTrace] = None
+        self._done: Optional[asyncio.Event] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATUSES
+
+    def done_event(self) -> asyncio.Event:
+        if self._done is None:
+            self._done = asyncio.Event()
+            if self.finished:
+                self._done.set()
+        return self._done
+
+    def to_status(self) -> Dict[str, Any]:
+        return {
+            "status": self.status,
+            "progress": self.progress,
+            "outputs": self.outputs,
+            "error": self.error,
+            "previews": self.previews,
+        }
+
+
+class EvictionWheel:
+    """
+    已结束任务的淘汰时间轮
+
+    按到期时间分桶，每个桶覆盖 resolution 秒；到期的桶整体取出，
+    淘汰时不需要扫描全部任务，开销只与到期的任务数有关
+    """
+
+    def __init__(self, resolution: float = 60.0):
+        self.resolution = resolution
+        self._buckets: Dict[int, List[str]] = {}
+        self._slots: List[int] = []
+
+    def __len__(self) -> int:
+        return sum(len(bucket) for bucket in self._buckets.values())
+
+    def add(self, key: str, expires_at: float):
+        # 桶的结束时间不早于 expires_at，任务不会提前淘汰
+        slot = math.ceil(expires_at / self.resolution)
+        bucket = self._buckets.get(slot)
+        if bucket is None:
+            bucket = self._buckets[slot] = []
+            heapq.heappush(self._slots, slot)
+        bucket.append(key)
+
+    def expire(self, now: float) -> List[str]:
+        """取出 now 之前到期的全部键"""
+        current = math.floor(now / self.resolution)
+        expired: List[str] = []
+        while self._slots and self._slots[0] <= current:
+            expired.extend(self._buckets.pop(heapq.heappop(self._slots)))
+        return expired
+
+
+class QueueIndex:
+    """
+    ComfyUI 队列的 prompt_id -> (状态, 位置) 索引
+
+    由一次 /queue 结果构建（健康探测每个周期都会获取 /queue），查询时不再逐个扫描 queue_running / queue_pending；
+    queue_pending 按提交序号排序，位置从 0 开始
+    """
+
+    __slots__ = ("positions", "running", "pending", "updated_at")
+
+    def __init__(self, queue_data: Dict[str, Any], now: Optional[float] = None):
+        running = queue_data.get("queue_running", [])
+        pending = sorted(queue_data.get("queue_pending", []), key=lambda item: item[0])
+        self.positions: Dict[str, Tuple[str, int]] = {}
+        for index, item in enumerate(running):
+            self.positions[item[1]] = (STATUS_RUNNING, index)
+        for index, item in enumerate(pending):
+            self.positions[item[1]] = (STATUS_PENDING, index)
+        self.running = len(running)
+        self.pending = len(pending)
+        self.updated_at = time.monotonic() if now is None else now
+
+    def __len__(self) -> int:
+        return self.running + self.pending
+
+    def locate(self, prompt_id: str) -> Optional[Tuple[str, int]]:
+        return self.positions.get(prompt_id)
+
+
+def _history_error(status: Dict[str, Any]) -> Optional[str]:
+    """从 /history 的 status 字段中提取错误信息"""
+    if "error" in status:
+        return status.get("error")
+    if status.get("status_str") != "error":
+        return None
+    for message in status.get("messages", []):
+        if len(message) == 2 and message[0] == "execution_error":
+            return message[1].get("exception_message") or "execution_error"
+    return "执行失败"
+
+
+class JobTracker:
+    """任务跟踪器：所有模板、所有后端共用一个实例"""
+
+    def __init__(
+        self,
+        registry: WorkflowRegistry,
+        clients: Dict[str, ComfyUIClient],
+        poll_interval: float = 5.0,
+        safety_poll_interval: float = 30.0,
+        job_ttl: float = 3600.0,
+        tracer: Optional[Tracer] = None,
+        queue_index_ttl: float = 10.0,
+        release_details: bool = False
+    ):
+        self.registry = registry
+        self.tracer = tracer or Tracer()
+        self.clients = clients
+        # 提交工作流时使用的 client_id，ComfyUI 只向该 client_id 推送执行事件
+        self.client_id = f"gateway-{uuid.uuid4()}"
+        self.poll_interval = poll_interval
+        self.safety_poll_interval = safety_poll_interval
+        # 已结束任务在内存中保留的时间
+        self.job_ttl = job_ttl
+        # 任务结束后释放请求参数和节点耗时（已由观察者写入任务历史，状态查询不需要）
+        self.release_details = release_details
+        self.jobs: Dict[str, Job] = {}
+        # 尚未结束的任务（轮询和排程只遍历这些任务）
+        self._unfinished: Dict[str, Job] = {}
+        # 已结束任务按 finished_at + job_ttl 淘汰；最终状态在结束时已交给观察者写入任务历史
+        self._eviction = EvictionWheel(resolution=min(60.0, max(job_ttl / 60, 1.0)))
+        # 未跟踪任务的最终状态（输出描述只提取一次）：(后端, prompt_id) -> 状态
+        self._remote_finished: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        # 各后端 ComfyUI 队列的索引：由健康探测的 /queue 结果更新，超过 queue_index_ttl 秒或
+        # WebSocket status 事件报告的队列长度与索引不一致时，下次查询重新获取
+        self.queue_index_ttl = queue_index_ttl
+        self._queue_index: Dict[str, QueueIndex] = {}
+        self._queue_fetch: Dict[str, asyncio.Task] = {}
+        self._by_remote: Dict[str, Job] = {}
+        self._ws_connected: Dict[str, bool] = {name: False for name in clients}
+        self._listeners: List[Callable[[Job], None]] = []
+        self._tasks: List[asyncio.Task] = []
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        # 任务状态变更时调用（用于持久化），参数为任务
+        self._observers: List[Callable[[Job], None]] = []
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        for name, client in self.clients.items():
+            self._tasks.append(asyncio.create_task(self._listen(name, client)))
+        self._tasks.append(asyncio.create_task(self._poll_loop()))
+
+    async def stop(self):
+        fetching = list(self._queue_fetch.values())
+        for task in self._tasks + list(self._refreshing.values()) + fetching:
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._refreshing.values(), *fetching, return_exceptions=True)
+        self._tasks.clear()
+        self._refreshing.clear()
+        self._queue_fetch.clear()
+
+    def ws_connected(self, backend: str) -> bool:
+        return self._ws_connected.get(backend, False)
+
+    def active_jobs(self, backend: str) -> List[Job]:
+        """已提交到 ComfyUI、尚未结束的任务"""
+        return [
+            job for job in self._unfinished.values()
+            if job.backend == backend and job.status in ACTIVE_STATUSES
+        ]
+
+    # ------------------------------------------------------------------
+    # 任务登记与状态变更
+    # ------------------------------------------------------------------
+
+    def add_listener(self, callback: Callable[[Job], None]):
+        """注册任务结束回调（完成或失败时调用一次）"""
+        self._listeners.append(callback)
+
+    def add_observer(self, callback: Callable[[Job], None]):
+        """注册状态变更回调（登记、提交、开始执行、结束时调用）"""
+        self._observers.append(callback)
+
+    def _changed(self, job: Job):
+        for callback in self._observers:
+            try:
+                callback(job)
+            except Exception as e:
+                logger.error(f"任务状态回调失败: {e}")
+
+    def add(self, job: Job):
+        self.jobs[job.prompt_id] = job
+        if job.finished:
+            self._eviction.add(job.prompt_id, job.finished_at + self.job_ttl)
+        else:
+            self._unfinished[job.prompt_id] = job
+        # 提交时会请求 ComfyUI 沿用本地 prompt_id，提前登记以免漏掉提交返回前的事件
+        self._by_remote[job.prompt_id] = job
+        self._changed(job)
+
+    def restore_remote(self, job: Job):
+        """登记重启前已提交到 ComfyUI 的任务"""
+        self._by_remote[job.remote_id] = job
+        job.last_refresh = time.time()
+
+    def get(self, prompt_id: str) -> Optional[Job]:
+        job = self.jobs.get(prompt_id)
+        if job is None:
+            job = self._by_remote.get(prompt_id)
+        return job
+
+    def mark_submitted(self, job: Job, remote_id: str):
+        job.remote_id = remote_id
+        job.submitted_at = time.time()
+        job.last_refresh = job.submitted_at
+        if job.status == STATUS_QUEUED:
+            job.status = STATUS_PENDING
+        self._by_remote[remote_id] = job
+        self._changed(job)
+        logger.info(f"工作流提交成功，prompt_id: {job.prompt_id}")
+
+    def mark_running(self, job: Job):
+        if job.status in (STATUS_QUEUED, STATUS_PENDING):
+            job.status = STATUS_RUNNING
+            job.started_at = time.time()
+            if job.trace is not None:
+                if job.submitted_at is not None:
+                    self.tracer.record("comfyui.queue", job.trace.job, job.submitted_at, job.started_at)
+                job.trace.execute = self.tracer.start_span("execute", job.trace.job, start=job.started_at)
+            self._changed(job)
+
+    def mark_completed(self, job: Job, outputs: List[Dict[str, Any]]):
+        job.outputs = outputs
+        job.progress = 100.0
+        self._finish(job, STATUS_COMPLETED)
+
+    def mark_failed(self, job: Job, error: str):
+        job.error = error
+        self._finish(job, STATUS_FAILED)
+
+    def _finish(self, job: Job, status: str):
+        if job.finished:
+            return
+        job.status = status
+        job.finished_at = time.time()
+        self._unfinished.pop(job.prompt_id, None)
+        self._eviction.add(job.prompt_id, job.finished_at + self.job_ttl)
+        self._node_finished(job, now=job.finished_at)
+        if job.trace is not None:
+            job.trace.finish(status, job.error)
+            job.trace = None
+        self._changed(job)
+        if job._done is not None:
+            # 正在等待的调用方持有该事件；之后的 done_event() 会新建一个已触发的事件
+            job._done.set()
+            job._done = None
+        for callback in self._listeners:
+            try:
+                callback(job)
+            except Exception as e:
+                logger.error(f"任务结束回调失败: {e}")
+        if self.release_details:
+            job.params = None
+            job.node_timings = None
+
+    async def wait(self, job: Job, timeout: float) -> bool:
+        """等待任务结束，超时返回 False"""
+        if job.finished:
+            return True
+        try:
+            await asyncio.wait_for(job.done_event().wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    # ------------------------------------------------------------------
+    # WebSocket 事件
+    # ------------------------------------------------------------------
+
+    async def _listen(self, backend: str, client: ComfyUIClient):
+        """订阅 ComfyUI WebSocket，断线后指数退避重连"""
+        try:
+            import websockets
+        except ImportError:
+            logger.warning("未安装 websockets，任务状态将通过轮询获取")
+            return
+
+        connect_kwargs = {"max_size": None, "open_timeout": 10}
+        if "proxy" in inspect.signature(websockets.connect).parameters:
+            # 与 HTTP 客户端一致，禁用代理直连
+            connect_kwargs["proxy"] = None
+
+        url = f"{client.ws_url}?clientId={self.client_id}"
+        backoff = 1.0
+        while True:
+            try:
+                async with websockets.connect(url, **connect_kwargs) as ws:
+                    self._ws_connected[backend] = True
+                    backoff = 1.0
+                    logger.info(f"已连接 ComfyUI WebSocket（{backend}）: {client.ws_url}")
+                    # 断线期间（包括网关重启期间）的事件已丢失，重新核对执行中的任务
+                    for job in self.active_jobs(backend):
+                        self.schedule_refresh(job)
+                    async for raw in ws:
+                        # 二进制消息是预览图，忽略
+                        if isinstance(raw, bytes):
+                            continue
+                        self.handle_message(backend, json.loads(raw))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"ComfyUI WebSocket 连接断开（{backend}）: {e}")
+            finally:
+                self._ws_connected[backend] = False
+
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def handle_message(self, backend: str, message: Dict[str, Any]):
+        """处理一条 ComfyUI WebSocket 消息"""
+        msg_type = message.get("type")
+        data = message.get("data") or {}
+        if msg_type == "status":
+            self._check_queue_length(backend, data)
+            return
+        prompt_id = data.get("prompt_id")
+        job = self._by_remote.get(prompt_id) if prompt_id else None
+        if job is None or job.finished:
+            return
+
+        job.last_refresh = time.time()
+        if msg_type == "execution_start":
+            self.mark_running(job)
+        elif msg_type == "executing":
+            if data.get("node") is None:
+                # node 为 None 表示该 prompt 执行结束，从 /history 读取输出
+                self._node_finished(job)
+                self.schedule_refresh(job)
+            else:
+                self.mark_running(job)
+                self._node_started(job, str(data["node"]))
+        elif msg_type == "executed":
+            self._node_finished(job, node_id=str(data.get("node")))
+        elif msg_type == "execution_cached":
+            if job.trace is not None and job.trace.execute is not None:
+                job.trace.execute.set_attribute("comfyui.cached_nodes", ",".join(map(str, data.get("nodes") or [])))
+        elif msg_type == "progress":
+            self.mark_running(job)
+            maximum = data.get("max") or 0
+            if maximum:
+                job.progress = round(data.get("value", 0) * 100.0 / maximum, 1)
+        elif msg_type == "execution_success":
+            self.schedule_refresh(job)
+        elif msg_type == "execution_error":
+            self.mark_failed(job, data.get("exception_message") or "execution_error")
+        elif msg_type == "execution_interrupted":
+            self.mark_failed(job, "任务已被中断")
+
+    def _node_started(self, job: Job, node_id: str):
+        """executing 事件：上一个节点结束，node_id 开始执行"""
+        now = time.time()
+        self._node_finished(job, now=now)
+        job.running_node = (node_id, now)
+        if job.trace is not None:
+            node = self.registry.get(job.template).load().get(node_id) or {}
+            job.trace.start_node(self.tracer, node_id, node.get("class_type"))
+
+    def _node_finished(self, job: Job, now: Optional[float] = None, node_id: Optional[str] = None):
+        """记录正在执行的节点的耗时（node_id 不为空时只在该节点正在执行时记录）"""
+        if job.running_node is None or (node_id is not None and job.running_node[0] != node_id):
+            return
+        running, started = job.running_node
+        job.running_node = None
+        if job.node_timings is None:
+            job.node_timings = {}
+        # 同一节点可能执行多次（如循环），累计耗时
+        elapsed = (now or time.time()) - started
+        job.node_timings[running] = round(job.node_timings.get(running, 0.0) + elapsed, 3)
+        if job.trace is not None:
+            job.trace.end_node()
+
+    # ------------------------------------------------------------------
+    # /history 轮询
+    # ------------------------------------------------------------------
+
+    def schedule_refresh(self, job: Job):
+        """后台刷新任务状态（同一任务只保留一个刷新任务）"""
+        if job.prompt_id in self._refreshing:
+            return
+        task = asyncio.create_task(self.refresh(job))
+        self._refreshing[job.prompt_id] = task
+        task.add_done_callback(lambda _: self._refreshing.pop(job.prompt_id, None))
+
+    async def refresh(self, job: Job) -> Optional[bool]:
+        """从 /history 刷新单个任务，返回 /history 中是否有该任务（查询失败时为 None）"""
+        if job.finished:
+            return True
+        remote_id = job.remote_id or job.prompt_id
+        client = self.clients[job.backend]
+        started = time.time()
+        try:
+            history = await client.get_history(remote_id)
+        except CircuitOpenError as e:
+            # 熔断期间的轮询直接跳过，避免刷屏
+            logger.debug(f"跳过任务状态查询: {e}")
+            return None
+        except httpx.HTTPError as e:
+            logger.error(f"查询任务状态失败: {e}")
+            return None
+
+        job.last_refresh = time.time()
+        entry = history.get(remote_id)
+        if job.trace is not None:
+            self.tracer.record("fetch_outputs", job.trace.job, started, job.last_refresh, {"found": entry is not None})
+        if entry is None:
+            return False
+        self.apply_history(job, entry)
+        return True
+
+    def apply_history(self, job: Job, entry: Dict[str, Any]):
+        status = entry.get("status", {})
+        if status.get("completed", False):
+            template = self.registry.get(job.template)
+            client = self.clients[job.backend]
+            outputs = template.extract_outputs(entry.get("outputs", {}), client.view_url)
+            self.mark_completed(job, outputs)
+            return
+
+        error = _history_error(status)
+        if error is not None:
+            self.mark_failed(job, error)
+            return
+
+        self.mark_running(job)
+
+    async def _poll_loop(self):
+        """兜底轮询：WebSocket 断开时按 poll_interval，连接正常时按 safety_poll_interval"""
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            now = time.time()
+            for prompt_id in self._eviction.expire(now):
+                job = self.jobs.get(prompt_id)
+                if job is not None and job.finished:
+                    self._evict(job)
+            for job in list(self._unfinished.values()):
+                if job.status not in ACTIVE_STATUSES:
+                    continue
+                interval = self.safety_poll_interval if self.ws_connected(job.backend) else self.poll_interval
+                if now - job.last_refresh >= interval:
+                    self.schedule_refresh(job)
+
+    async def reconcile(self, jobs: List[Job]):
+        """
+        核对重启前已提交的任务：仍在 ComfyUI 队列中的继续跟踪，
+        已执行完的从 /history 读取结果，两处都没有的视为丢失
+        """
+        by_backend: Dict[str, List[Job]] = {}
+        for job in jobs:
+            by_backend.setdefault(job.backend, []).append(job)
+
+        for backend, backend_jobs in by_backend.items():
+            try:
+                queue_data = await self.clients[backend].get_queue()
+            except httpx.HTTPError as e:
+                # 后端不可用时交给兜底轮询
+                logger.warning(f"核对恢复的任务失败（{backend}）: {e}")
+                continue
+            index = self.update_queue(backend, queue_data)
+            for job in backend_jobs:
+                located = index.locate(job.remote_id or job.prompt_id)
+                if located is not None and located[0] == STATUS_RUNNING:
+                    self.mark_running(job)
+                elif located is None:
+                    found = await self.refresh(job)
+                    if found is False:
+                        self.mark_failed(job, "网关重启期间任务丢失（ComfyUI 队列和历史记录中均不存在）")
+
+    def _evict(self, job: Job):
+        self.jobs.pop(job.prompt_id, None)
+        self._unfinished.pop(job.prompt_id, None)
+        self._by_remote.pop(job.prompt_id, None)
+        if job.remote_id is not None:
+            self._by_remote.pop(job.remote_id, None)
+
+    # ------------------------------------------------------------------
+    # 未被网关跟踪的任务
+    # ------------------------------------------------------------------
+
+    async def lookup_remote(self, prompt_id: str, template_name: str, backend: str) -> Dict[str, Any]:
+        """直接查询 ComfyUI（用于网关启动前提交的任务）"""
+        key = (backend, prompt_id)
+        cached = self._remote_finished.get(key)
+        if cached is not None:
+            self._remote_finished.move_to_end(key)
+            return dict(cached)
+
+        client = self.clients[backend]
+        template = self.registry.get(template_name)
+        try:
+            history = await client.get_history(prompt_id)
+            if prompt_id in history:
+                entry = history[prompt_id]
+                status = entry.get("status", {})
+                if status.get("completed", False):
+                    return self._remember_remote(key, {
+                        "status": STATUS_COMPLETED,
+                        "outputs": template.extract_outputs(entry.get("outputs", {}), client.view_url),
+                    })
+                error = _history_error(status)
+                if error is not None:
+                    return self._remember_remote(key, {"status": STATUS_FAILED, "error": error})
+                return {"status": STATUS_RUNNING, "progress": status.get("progress", 0)}
+
+            index = await self.queue_index(backend)
+            located = index.locate(prompt_id)
+            if located is None and time.monotonic() - index.updated_at > QUEUE_INDEX_MISS_AGE:
+                located = (await self.queue_index(backend, QUEUE_INDEX_MISS_AGE)).locate(prompt_id)
+            if located is None:
+                return {"status": "unknown"}
+            if located[0] == STATUS_RUNNING:
+                return {"status": STATUS_RUNNING}
+            return {"status": STATUS_PENDING, "queue_position": located[1]}
+
+        except CircuitOpenError as e:
+            return {"status": "error", "error": str(e)}
+        except httpx.HTTPError as e:
+            logger.error(f"查询任务状态失败: {e}")
+            return {"status": "error", "error": str(e)}
+
+    # ------------------------------------------------------------------
+    # ComfyUI 队列索引
+    # ------------------------------------------------------------------
+
+    def update_queue(self, backend: str, queue_data: Dict[str, Any]) -> QueueIndex:
+        """用一次 /queue 结果重建后端的队列索引（健康探测的观察者）"""
+        index = self._queue_index[backend] = QueueIndex(queue_data)
+        return index
+
+    def cached_queue_index(self, backend: str) -> Optional[QueueIndex]:
+        """后端当前的队列索引（不重新获取，可能已过期）"""
+        return self._queue_index.get(backend)
+
+    def _check_queue_length(self, backend: str, data: Dict[str, Any]):
+        """status 事件：队列长度与索引不一致时使索引过期"""
+        remaining = ((data.get("status") or {}).get("exec_info") or {}).get("queue_remaining")
+        index = self._queue_index.get(backend)
+        if index is not None and remaining is not None and remaining != len(index):
+            index.updated_at = -math.inf
+
+    async def queue_index(self, backend: str, max_age: Optional[float] = None) -> QueueIndex:
+        """后端的队列索引；超过 max_age 秒（默认 queue_index_ttl）时重新获取 /queue（并发的查询共用一次请求）"""
+        index = self._queue_index.get(backend)
+        max_age = self.queue_index_ttl if max_age is None else max_age
+        if index is not None and time.monotonic() - index.updated_at <= max_age:
+            return index
+        task = self._queue_fetch.get(backend)
+        if task is None:
+            task = self._queue_fetch[backend] = asyncio.create_task(self._fetch_queue(backend))
+            task.add_done_callback(lambda _: self._queue_fetch.pop(backend, None))
+        return await asyncio.shield(task)
+
+    async def _fetch_queue(self, backend: str) -> QueueIndex:
+        return self.update_queue(backend, await self.clients[backend].get_queue())
+
+    def _remember_remote(self, key: Tuple[str, str], status: Dict[str, Any]) -> Dict[str, Any]:
+        self._remote_finished[key] = status
+        while len(self._remote_finished) > REMOTE_STATUS_CACHE_SIZE:
+            self._remote_finished.popitem(last=False)
+        return dict(status)
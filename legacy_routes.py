@@ -0,0 +1,413 @@
+"""
+兼容路由
+按模板生成与原有三个服务完全一致的接口（/api/generate、/api/status/{prompt_id} 等），
+实际逻辑全部委托给共享的 Gateway
+"""
+
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from fastapi import APIRouter, File, Form, HTTPException, Request, UploadFile
+
+from api_models import (
+    ImageGenerationResponse,
+    PromptEnhanceResponse,
+    TaskStatusResponse,
+    VideoGenerationResponse,
+)
+from fast_json import FastJSONResponse
+from idempotency import IDEMPOTENCY_HEADER, request_fingerprint
+from job_tracker import PRIORITY_ASYNC, PRIORITY_INTERACTIVE
+from offload import sha256_hexdigest
+from workflow_registry import WorkflowTemplate
+
+logger = logging.getLogger(__name__)
+
+
+def status_payload(template: WorkflowTemplate, prompt_id: str, status_info: Dict[str, Any]) -> Dict[str, Any]:
+    """网关内部状态 -> 旧接口的状态响应格式"""
+    return {
+        "prompt_id": prompt_id,
+        "status": status_info.get("status", "unknown"),
+        "progress": status_info.get("progress"),
+        template.result_key: status_info.get("outputs"),
+        "error": status_info.get("error"),
+        "eta_seconds": status_info.get("eta_seconds"),
+        "queue_position": status_info.get("queue_position"),
+        "previews": status_info.get("previews")
+    }
+
+
+def build_service_router(gateway, template: WorkflowTemplate) -> APIRouter:
+    """为单个模板生成兼容路由"""
+    router = APIRouter()
+    messages = template.messages
+
+    @router.get("/")
+    async def root():
+        """API 根路径"""
+        endpoints = {}
+        if template.kind == "image2video":
+            endpoints["upload_and_generate"] = "/api/upload_and_generate"
+            endpoints["generate_with_filename"] = "/api/generate"
+        else:
+            endpoints["generate"] = "/api/generate"
+        endpoints["status"] = "/api/status/{prompt_id}"
+        if "enhance_prompt" in template.extra_routes:
+            endpoints["enhance_prompt"] = "/api/enhance_prompt"
+        endpoints["health"] = "/health"
+
+        return {
+            "service": template.title,
+            "version": "1.0.0",
+            **template.service_info,
+            "endpoints": endpoints
+        }
+
+    @router.get("/health")
+    async def health_check():
+        """健康检查"""
+        return await gateway.health()
+
+    async def submit(http_request: Request, tenant: str, request, priority: str) -> str:
+        """提交任务（优先级可由请求头降级），返回 prompt_id"""
+        return await gateway.submit(
+            template.name,
+            request,
+            tenant=tenant,
+            priority=gateway.resolve_priority(http_request, priority)
+        )
+
+    async def submit_once(
+        http_request: Request,
+        params: Dict[str, Any],
+        produce: Callable[[str], Awaitable[str]]
+    ) -> str:
+        """
+        携带 Idempotency-Key 时同一个键只提交一次，重试的请求返回第一次提交的 prompt_id
+
+        只有真正提交时才限流（produce 的参数为租户名）：重试的请求不消耗配额，排空期间也能拿到已有的结果
+        """
+        key = http_request.headers.get(IDEMPOTENCY_HEADER)
+        if key is None:
+            return await produce(await gateway.authorize(http_request))
+        tenant = await gateway.identify(http_request)
+        prompt_id = await gateway.idempotency.claim(tenant, key, request_fingerprint(template.name, params))
+        if prompt_id is not None:
+            return prompt_id
+        try:
+            prompt_id = await produce(await gateway.authorize(http_request))
+        except BaseException:
+            await gateway.idempotency.release(tenant, key)
+            raise
+        await gateway.idempotency.complete(tenant, key, prompt_id)
+        return prompt_id
+
+    async def submit_request(http_request: Request, request, priority: str) -> str:
+        return await submit_once(
+            http_request,
+            request.model_dump(mode="json"),
+            lambda tenant: submit(http_request, tenant, request, priority)
+        )
+
+    async def wait_for_result(prompt_id: str, timeout: int) -> FastJSONResponse:
+        """等待任务结束并返回结果（替代原来的定时轮询）"""
+        status_info = await gateway.wait_result(prompt_id, timeout)
+        if status_info is None:
+            raise HTTPException(
+                status_code=408,
+                detail=f"{messages['timeout']}（{timeout}秒），请使用异步接口或增加超时时间"
+            )
+
+        if status_info["status"] == "failed":
+            raise HTTPException(
+                status_code=500,
+                detail=f"{messages['failed']}: {status_info.get('error') or 'Unknown error'}"
+            )
+
+        return FastJSONResponse({
+            "prompt_id": prompt_id,
+            "status": "completed",
+            template.result_key: status_info.get("outputs") or [],
+            "message": messages["completed"]
+        })
+
+    if template.kind == "text2image":
+        request_model = template.request_model
+
+        @router.post("/api/generate", response_model=ImageGenerationResponse)
+        async def generate_image(request: request_model, http_request: Request):
+            """
+            生成图片接口
+
+            接收提示词和生成参数，调用 ComfyUI 工作流生成图片
+            """
+            try:
+                logger.info(f"收到图片生成请求，提示词: {request.prompt[:50]}...")
+
+                prompt_id = await submit_request(http_request, request, PRIORITY_ASYNC)
+
+                return ImageGenerationResponse(
+                    prompt_id=prompt_id,
+                    status="submitted",
+                    message=messages["submitted"]
+                )
+
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.error(f"{messages['error']}: {e}")
+                raise HTTPException(status_code=500, detail=str(e))
+
+        @router.get("/api/status/{prompt_id}", response_model=TaskStatusResponse)
+        async def get_task_status(prompt_id: str):
+            """
+            查询任务状态接口
+
+            根据 prompt_id 查询图片生成任务的状态和结果
+            """
+            try:
+                status_info = await gateway.get_status(prompt_id, template.name)
+                return FastJSONResponse(status_payload(template, prompt_id, status_info))
+
+            except Exception as e:
+                logger.error(f"查询任务状态失败: {e}")
+                raise HTTPException(status_code=500, detail=str(e))
+
+        @router.post("/api/generate_sync")
+        async def generate_image_sync(request: request_model, http_request: Request, timeout: int = template.sync_timeout):
+            """
+            同步生成图片接口（等待完成）
+
+            提交任务后等待生成完成，直接返回结果
+            """
+            try:
+                logger.info(f"收到同步图片生成请求，提示词: {request.prompt[:50]}...")
+
+                prompt_id = await submit_request(http_request, request, PRIORITY_INTERACTIVE)
+                return await wait_for_result(prompt_id, timeout)
+
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.error(f"同步{messages['error']}: {e}")
+                raise HTTPException(status_code=500, detail=str(e))
+
+        return router
+
+    # ------------------------------------------------------------------
+    # 图生视频模板
+    # ------------------------------------------------------------------
+
+    request_model = template.request_model
+    defaults = template.form_defaults
+
+    async def submit_uploaded(
+        http_request: Request, priority: str, image: Optional[UploadFile], upload_id: Optional[str], **params
+    ) -> str:
+        if (image is None) == (upload_id is None):
+            raise HTTPException(status_code=422, detail="请提供 image 或 upload_id 之一")
+
+        if upload_id is not None:
+            async def submit_resolved(tenant: str) -> str:
+                # 分块上传已完成，图片已在 ComfyUI 上
+                upload = await asyncio.get_running_loop().run_in_executor(
+                    None, gateway.resumable_uploads.resolve, tenant, upload_id
+                )
+                request = request_model(image_filename=upload["image_filename"], **params)
+                return await submit(http_request, tenant, request, priority)
+
+            return await submit_once(http_request, {**params, "upload_id": upload_id}, submit_resolved)
+
+        image_content = await image.read()
+
+        async def upload_and_submit(tenant: str) -> str:
+            # 限流通过后才上传到 ComfyUI，避免被拒绝的请求占用上传
+            with gateway.tracer.span("upload", template=template.name, size=len(image_content)):
+                uploaded_filename = await gateway.upload_image(image_content, image.filename)
+
+            # 准备请求参数
+            request = request_model(image_filename=uploaded_filename, **params)
+            return await submit(http_request, tenant, request, priority)
+
+        # 重试的请求按图片内容识别，不会再次上传图片（文件名和大小相同的不同图片不算重试）
+        fingerprint = dict(params)
+        if http_request.headers.get(IDEMPOTENCY_HEADER) is not None:
+            fingerprint["image"] = await sha256_hexdigest(image_content)
+        return await submit_once(http_request, fingerprint, upload_and_submit)
+
+    @router.post("/api/upload_and_generate", response_model=VideoGenerationResponse)
+    async def upload_and_generate_video(
+        http_request: Request,
+        image: Optional[UploadFile] = File(None, description="要转换为视频的图片"),
+        upload_id: Optional[str] = Form(None, description="已完成的分块上传 ID（代替 image）"),
+        prompt: str = Form(..., description="正向提示词"),
+        width: int = Form(defaults["width"], description="视频宽度"),
+        height: int = Form(defaults["height"], description="视频高度"),
+        length: int = Form(defaults["length"], description="视频帧数"),
+        steps: int = Form(defaults["steps"], description="采样步数"),
+        cfg: float = Form(defaults["cfg"], description="CFG系数"),
+        fps: int = Form(defaults["fps"], description="帧率"),
+        noise_seed: Optional[int] = Form(None, description="随机种子")
+    ):
+        """
+        上传图片并生成视频（一步到位）
+
+        上传图片文件，设置参数，直接生成视频
+        """
+        try:
+            logger.info(f"收到图生视频请求，图片: {image.filename if image else upload_id}, 提示词: {prompt[:50]}...")
+
+            prompt_id = await submit_uploaded(
+                http_request, PRIORITY_ASYNC, image, upload_id, prompt=prompt, width=width, height=height, length=length,
+                steps=steps, cfg=cfg, fps=fps, noise_seed=noise_seed
+            )
+
+            return VideoGenerationResponse(
+                prompt_id=prompt_id,
+                status="submitted",
+                message=messages["submitted"]
+            )
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"{messages['error']}: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @router.post("/api/generate", response_model=VideoGenerationResponse)
+    async def generate_video_with_filename(request: request_model, http_request: Request):
+        """
+        使用已存在的图片文件名生成视频
+
+        适用于图片已经在 ComfyUI 服务器上的情况
+        """
+        try:
+            logger.info(f"收到图生视频请求，图片: {request.image_filename}, 提示词: {request.prompt[:50]}...")
+
+            prompt_id = await submit_request(http_request, request, PRIORITY_ASYNC)
+
+            return VideoGenerationResponse(
+                prompt_id=prompt_id,
+                status="submitted",
+                message=messages["submitted"]
+            )
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"{messages['error']}: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @router.get("/api/status/{prompt_id}")
+    async def get_video_task_status(prompt_id: str):
+        """
+        查询任务状态接口
+
+        根据 prompt_id 查询视频生成任务的状态和结果
+        """
+        try:
+            status_info = await gateway.get_status(prompt_id, template.name)
+            return FastJSONResponse(status_payload(template, prompt_id, status_info))
+
+        except Exception as e:
+            logger.error(f"查询任务状态失败: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    @router.post("/api/upload_and_generate_sync")
+    async def upload_and_generate_video_sync(
+        http_request: Request,
+        image: Optional[UploadFile] = File(None),
+        upload_id: Optional[str] = Form(None),
+        prompt: str = Form(...),
+        width: int = Form(defaults["width"]),
+        height: int = Form(defaults["height"]),
+        length: int = Form(defaults["length"]),
+        steps: int = Form(defaults["steps"]),
+        cfg: float = Form(defaults["cfg"]),
+        fps: int = Form(defaults["fps"]),
+        noise_seed: Optional[int] = Form(None),
+        timeout: int = Form(template.sync_timeout, description="超时时间（秒）")
+    ):
+        """
+        同步图生视频（等待完成）
+
+        上传图片后等待视频生成完成，直接返回结果
+        """
+        try:
+            logger.info(f"收到同步图生视频请求，图片: {image.filename if image else upload_id}")
+
+            prompt_id = await submit_uploaded(
+                http_request, PRIORITY_INTERACTIVE, image, upload_id, prompt=prompt, width=width, height=height, length=length,
+                steps=steps, cfg=cfg, fps=fps, noise_seed=noise_seed
+            )
+            return await wait_for_result(prompt_id, timeout)
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"同步{messages['error']}: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    if "enhance_prompt" in template.extra_routes:
+        @router.post("/api/enhance_prompt", response_model=PromptEnhanceResponse)
+        async def enhance_prompt(
+            user_prompt: str = Form(..., description="用户输入的简单提示词"),
+            image: Optional[UploadFile] = File(None, description="要转换为视频的图片（支持视觉分析）"),
+            temperature: float = Form(0.7, description="生成温度"),
+            max_tokens: int = Form(2000, description="最大生成token数")
+        ):
+            """
+            提示词优化接口
+
+            使用 Moonshot AI 视觉模型根据用户提示词和图片，生成高质量的图生视频提示词。
+
+            **支持视觉输入**：Moonshot AI 支持图片分析，可以结合图片内容生成更准确的提示词。
+
+            该接口会根据用户描述和图片内容，生成包含以下部分的详细提示词：
+            - 主体描述：详细的主体特征
+            - 背景描述：场景和环境细节
+            - 运动描述：合理的动作和变化
+            - 其他细节：光线、氛围等
+
+            参数：
+            - user_prompt: 用户的简单提示词（必填）
+            - image: 图片文件（可选，支持视觉分析）
+            - temperature: 生成温度，默认 0.7
+            - max_tokens: 最大生成 token 数，默认 2000
+            """
+            try:
+                logger.info(f"收到提示词优化请求，原始提示词: {user_prompt[:50]}...")
+
+                # 读取图片数据（如果有）
+                image_data = None
+                if image:
+                    image_data = await image.read()
+                    logger.info(f"已接收图片: {image.filename}, 大小: {len(image_data)} bytes")
+                else:
+                    logger.info("未上传图片，仅使用文本提示词")
+
+                # 调用 Moonshot API 优化提示词
+                with gateway.tracer.span("enhance", model=gateway.enhancer.model, image=image_data is not None):
+                    enhanced_prompt = await gateway.enhancer.enhance(
+                        user_prompt=user_prompt,
+                        image_data=image_data,
+                        temperature=temperature,
+                        max_tokens=max_tokens
+                    )
+
+                return PromptEnhanceResponse(
+                    original_prompt=user_prompt,
+                    enhanced_prompt=enhanced_prompt,
+                    status="success",
+                    message="提示词优化成功" + ("（已使用视觉模型分析图片内容）" if image_data else "")
+                )
+
+            except HTTPException:
+                raise
+            except Exception as e:
+                logger.error(f"优化提示词失败: {e}")
+                raise HTTPException(status_code=500, detail=str(e))
+
+    return router
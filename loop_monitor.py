@@ -0,0 +1,142 @@
+"""
+事件循环监控
+- 延迟：定时协程每 interval 秒唤醒一次，实际唤醒时间与预期的差值即事件循环延迟，分位数导出到 /metrics
+- 慢回调：看门狗线程发现事件循环超过 slow_threshold 秒没有响应时，记录事件循环线程当前的调用栈
+  （此时正在执行的就是阻塞事件循环的回调），每次阻塞只记录一次；不依赖 asyncio 调试模式
+- 采样分析：按固定间隔采样各线程的调用栈，输出 flamegraph.pl / speedscope 可读取的折叠栈格式
+"""
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Dict, Optional
+
+from metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# 采样分析的时长上限（秒）
+MAX_PROFILE_SECONDS = 60.0
+# 看门狗检查间隔（秒）
+WATCHDOG_INTERVAL = 0.05
+
+
+class LoopMonitor:
+    """事件循环延迟与慢回调监控"""
+
+    def __init__(
+        self,
+        interval: float = 0.25,
+        slow_threshold: float = 0.1,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self.slow_callbacks = 0
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+
+        metrics = metrics or MetricsRegistry()
+        self.lag = metrics.summary(
+            "gateway_event_loop_lag_seconds",
+            "事件循环延迟（定时协程实际唤醒时间与预期的差值）"
+        )
+        metrics.counter_from(
+            "gateway_event_loop_slow_callbacks_total",
+            "阻塞事件循环超过阈值的次数",
+            (),
+            lambda: [((), self.slow_callbacks)]
+        )
+
+    async def start(self):
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._measure_loop())
+        if self.slow_threshold > 0:
+            self._watchdog = threading.Thread(
+                target=self._watch,
+                args=(asyncio.get_running_loop(),),
+                name="loop-watchdog",
+                daemon=True
+            )
+            self._watchdog.start()
+
+    async def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join()
+            self._watchdog = None
+
+    async def _measure_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lag.observe(max(loop.time() - expected, 0.0))
+
+    def _watch(self, loop: asyncio.AbstractEventLoop):
+        """
+        看门狗线程：向事件循环投递一个空回调，slow_threshold 秒内没有执行说明事件循环被阻塞，
+        此时记录事件循环线程的调用栈
+        """
+        responded = threading.Event()
+        while not self._stopped.wait(WATCHDOG_INTERVAL):
+            responded.clear()
+            posted = time.monotonic()
+            try:
+                loop.call_soon_threadsafe(responded.set)
+            except RuntimeError:
+                # 事件循环已关闭
+                return
+            if responded.wait(self.slow_threshold):
+                continue
+
+            self.slow_callbacks += 1
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "（无法获取调用栈）\n"
+            logger.warning(f"事件循环已阻塞超过 {self.slow_threshold * 1000:.0f}ms，当前调用栈:\n{stack}")
+            while not responded.wait(WATCHDOG_INTERVAL):
+                if self._stopped.is_set():
+                    return
+            logger.warning(f"事件循环阻塞结束，共 {(time.monotonic() - posted) * 1000:.0f}ms")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}"
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> str:
+    """
+    采样所有线程（除采样线程本身）的调用栈，返回折叠栈文本：每行 "线程;外层;...;内层 次数"
+
+    在线程池中调用，不占用事件循环
+    """
+    seconds = min(max(seconds, 0.0), MAX_PROFILE_SECONDS)
+    own = threading.get_ident()
+    counts: Counter = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names: Dict[int, str] = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, str(thread_id)).replace(" ", "_"))
+            counts[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+    return "".join(f"{stack} {count}\n" for stack, count in counts.most_common())
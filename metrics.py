@@ -0,0 +1,199 @@
+"""
+网关运行指标
+以 Prometheus 文本格式通过 /metrics 暴露，分位数基于最近的观测窗口计算
+"""
+
+import math
+from collections import deque
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+DEFAULT_QUANTILES = (0.5, 0.9, 0.99)
+
+LabelValues = Tuple[str, ...]
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩法分位数（sorted_values 需已排序且非空）"""
+    index = max(0, min(len(sorted_values) - 1, int(math.ceil(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: Iterable[str], values: Iterable[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == int(value) and abs(value) < 1e15:
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Window:
+    """单组标签的观测窗口"""
+
+    __slots__ = ("values", "count", "total")
+
+    def __init__(self, window: int):
+        self.values: Deque[float] = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.values.append(value)
+        self.count += 1
+        self.total += value
+
+
+class Summary:
+    """分位数统计（最近 window 个观测值）"""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...] = (),
+        window: int = 1024,
+        quantiles: Tuple[float, ...] = DEFAULT_QUANTILES
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.window = window
+        self.quantiles = quantiles
+        self._series: Dict[LabelValues, _Window] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = _Window(self.window)
+        series.observe(value)
+
+    def stats(self, *labels: str) -> Dict[str, float]:
+        """单组标签的分位数、次数和总和"""
+        series = self._series.get(labels)
+        if series is None or not series.values:
+            return {"count": 0}
+        ordered = sorted(series.values)
+        result = {f"p{int(q * 100)}": round(percentile(ordered, q), 4) for q in self.quantiles}
+        result["count"] = series.count
+        result["sum"] = round(series.total, 4)
+        return result
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} summary"]
+        for labels, series in sorted(self._series.items()):
+            if series.values:
+                ordered = sorted(series.values)
+                for q in self.quantiles:
+                    lines.append(
+                        f"{self.name}{_format_labels(self.labelnames, labels, ('quantile', str(q)))} "
+                        f"{_format_value(percentile(ordered, q))}"
+                    )
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(series.total)}")
+            lines.append(f"{self.name}_count{label_text} {series.count}")
+        return lines
+
+
+class Counter:
+    """累计计数"""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self._values[labels] = self._values.get(labels, 0.0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Gauge:
+    """瞬时值，在输出时调用回调读取：回调返回 [(标签值, 数值), ...]"""
+
+    type = "gauge"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...],
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]]
+    ):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.collect = collect
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+        for labels, value in self.collect():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class CallbackCounter(Gauge):
+    """由其它组件自行累计、在输出时读取的计数"""
+
+    type = "counter"
+
+
+class MetricsRegistry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+
+    def _register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"指标已注册: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def summary(self, name: str, help: str, labelnames: Tuple[str, ...] = (), **kwargs) -> Summary:
+        return self._register(Summary(name, help, labelnames, **kwargs))
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...],
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]]
+    ) -> Gauge:
+        return self._register(Gauge(name, help, labelnames, collect))
+
+    def counter_from(
+        self,
+        name: str,
+        help: str,
+        labelnames: Tuple[str, ...],
+        collect: Callable[[], Iterable[Tuple[LabelValues, float]]]
+    ) -> CallbackCounter:
+        return self._register(CallbackCounter(name, help, labelnames, collect))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics.values():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
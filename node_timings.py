@@ -0,0 +1,83 @@
+"""
+节点耗时统计
+跟踪器根据 ComfyUI 的 executing / executed 事件记录每个任务中各节点的执行耗时（Job.node_timings），
+这里按模板和节点汇总最近的样本，给出各节点耗时的分位数和占比，用于定位工作流中的瓶颈节点
+（如 VAEDecode、KSamplerAdvanced、VHS_VideoCombine、UnetLoaderGGUF）
+"""
+
+import logging
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from job_tracker import Job, STATUS_COMPLETED
+from metrics import MetricsRegistry
+from workflow_registry import WorkflowRegistry
+
+logger = logging.getLogger(__name__)
+
+# 每个节点保留的样本数
+NODE_TIMING_WINDOW = 256
+
+
+class NodeTimingStats:
+    """按 (模板, 节点) 汇总的节点耗时"""
+
+    def __init__(self, registry: WorkflowRegistry, metrics: Optional[MetricsRegistry] = None):
+        self.registry = registry
+        metrics = metrics or MetricsRegistry()
+        self.durations = metrics.summary(
+            "gateway_node_duration_seconds",
+            "ComfyUI 节点执行耗时（不含缓存命中的节点）",
+            ("template", "node", "class_type"),
+            window=NODE_TIMING_WINDOW
+        )
+        # 模板 -> 出现过的节点 ID -> class_type
+        self._nodes: Dict[str, Dict[str, str]] = {}
+
+    def observe(self, job: Job):
+        """任务结束回调：记录成功任务的各节点耗时"""
+        if job.status != STATUS_COMPLETED or not job.node_timings:
+            return
+        self.record(job.template, job.node_timings)
+
+    def record(self, template_name: str, node_timings: Dict[str, float]):
+        if template_name not in self.registry:
+            return
+        nodes = self._nodes.get(template_name)
+        if nodes is None:
+            nodes = self._nodes[template_name] = {}
+        for node_id, seconds in node_timings.items():
+            class_type = nodes.get(node_id)
+            if class_type is None:
+                node = self.registry.get(template_name).load().get(node_id) or {}
+                class_type = nodes[node_id] = node.get("class_type", "")
+            self.durations.observe(seconds, template_name, node_id, class_type)
+
+    def seed(self, samples: Iterable[Tuple[str, Dict[str, float]]]) -> int:
+        """用任务历史中的样本 (模板, 节点耗时) 初始化统计，返回样本数"""
+        count = 0
+        for template_name, node_timings in samples:
+            self.record(template_name, node_timings)
+            count += 1
+        return count
+
+    def snapshot(self, template_name: str) -> Dict[str, Any]:
+        """模板各节点的耗时分位数，按平均耗时从高到低排列"""
+        nodes: List[Dict[str, Any]] = []
+        for node_id, class_type in self._nodes.get(template_name, {}).items():
+            stats = self.durations.stats(template_name, node_id, class_type)
+            if not stats["count"]:
+                continue
+            nodes.append({
+                "node": node_id,
+                "class_type": class_type,
+                "count": stats["count"],
+                "mean": round(stats["sum"] / stats["count"], 3),
+                "p50": stats["p50"],
+                "p90": stats["p90"],
+                "p99": stats["p99"],
+            })
+        total = sum(node["mean"] for node in nodes)
+        for node in nodes:
+            node["share"] = round(node["mean"] / total, 3) if total > 0 else 0.0
+        nodes.sort(key=lambda node: node["mean"], reverse=True)
+        return {"template": template_name, "mean_total_seconds": round(total, 3), "nodes": nodes}
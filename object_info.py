@@ -0,0 +1,327 @@
+"""
+ComfyUI 节点定义缓存与本地工作流校验
+启动时拉取每个后端的 /object_info 并定期刷新，提交前在本地校验工作流
+（枚举取值、数值范围、必填输入、节点连接类型），参数错误无需等到 ComfyUI 返回
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from comfyui_client import ComfyUIClient
+
+logger = logging.getLogger(__name__)
+
+# 输入类型
+KIND_ENUM = "enum"
+KIND_INT = "INT"
+KIND_FLOAT = "FLOAT"
+KIND_STRING = "STRING"
+KIND_BOOLEAN = "BOOLEAN"
+# 其它类型（MODEL、IMAGE 等）只能通过节点连接提供
+KIND_LINK = "link"
+
+_ANY_TYPE = "*"
+# 枚举错误信息中最多列出的可选值个数
+_MAX_LISTED_OPTIONS = 8
+# 这些节点的 image 输入是 ComfyUI 输入目录中的文件（没有 image_upload 标记时按节点类型识别），
+# 获取节点定义之后上传的文件不在缓存的可选值中；节点的其它枚举输入（如 channel）照常校验
+_UPLOAD_NODE_PREFIX = "LoadImage"
+_UPLOAD_INPUT = "image"
+
+
+class WorkflowValidationError(ValueError):
+    """工作流本地校验失败"""
+
+    def __init__(self, errors: List[str]):
+        self.errors = errors
+        super().__init__("工作流参数校验失败: " + "; ".join(errors))
+
+
+class InputSpec:
+    """单个节点输入的编译结果"""
+
+    __slots__ = ("kind", "type_name", "options", "minimum", "maximum", "upload")
+
+    def __init__(
+        self,
+        kind: str,
+        type_name: str,
+        options: Optional[FrozenSet[Any]] = None,
+        minimum: Optional[float] = None,
+        maximum: Optional[float] = None,
+        upload: bool = False
+    ):
+        self.kind = kind
+        self.type_name = type_name
+        self.options = options
+        self.minimum = minimum
+        self.maximum = maximum
+        # 取值为上传的文件（image_upload 等）：可选值随上传变化，不校验枚举
+        self.upload = upload
+
+
+class NodeSchema:
+    """单个节点类型的编译结果"""
+
+    __slots__ = ("class_type", "required", "optional", "output_types")
+
+    def __init__(
+        self,
+        class_type: str,
+        required: Dict[str, InputSpec],
+        optional: Dict[str, InputSpec],
+        output_types: Tuple[str, ...]
+    ):
+        self.class_type = class_type
+        self.required = required
+        self.optional = optional
+        self.output_types = output_types
+
+    def get(self, input_name: str) -> Optional[InputSpec]:
+        spec = self.required.get(input_name)
+        if spec is None:
+            spec = self.optional.get(input_name)
+        return spec
+
+
+def compile_input(raw: Any) -> InputSpec:
+    """/object_info 中的输入定义 -> InputSpec
+
+    输入定义的格式为 [类型或枚举列表, 选项]，新版本 ComfyUI 的枚举写作
+    ["COMBO", {"options": [...]}]
+    """
+    if not isinstance(raw, (list, tuple)) or not raw:
+        return InputSpec(KIND_LINK, _ANY_TYPE)
+
+    type_info = raw[0]
+    options = raw[1] if len(raw) > 1 and isinstance(raw[1], dict) else {}
+
+    upload = any(key.endswith("_upload") and value for key, value in options.items())
+    if isinstance(type_info, list):
+        return InputSpec(KIND_ENUM, "COMBO", options=frozenset(_hashable(v) for v in type_info), upload=upload)
+    if type_info == "COMBO" and isinstance(options.get("options"), list):
+        return InputSpec(
+            KIND_ENUM, "COMBO", options=frozenset(_hashable(v) for v in options["options"]), upload=upload
+        )
+
+    type_name = str(type_info)
+    if type_name in (KIND_INT, KIND_FLOAT):
+        return InputSpec(type_name, type_name, minimum=options.get("min"), maximum=options.get("max"))
+    if type_name in (KIND_STRING, KIND_BOOLEAN):
+        return InputSpec(type_name, type_name)
+    return InputSpec(KIND_LINK, type_name)
+
+
+def compile_node(class_type: str, info: Dict[str, Any]) -> NodeSchema:
+    inputs = info.get("input") or {}
+    required = {name: compile_input(raw) for name, raw in (inputs.get("required") or {}).items()}
+    optional = {name: compile_input(raw) for name, raw in (inputs.get("optional") or {}).items()}
+    if class_type.startswith(_UPLOAD_NODE_PREFIX):
+        for spec in (required.get(_UPLOAD_INPUT), optional.get(_UPLOAD_INPUT)):
+            if spec is not None and spec.kind == KIND_ENUM:
+                spec.upload = True
+    output_types = tuple(str(t) if not isinstance(t, list) else "COMBO" for t in info.get("output") or ())
+    return NodeSchema(class_type, required, optional, output_types)
+
+
+def _hashable(value: Any) -> Any:
+    return tuple(value) if isinstance(value, list) else value
+
+
+def _is_link(value: Any) -> bool:
+    return (
+        isinstance(value, list)
+        and len(value) == 2
+        and isinstance(value[0], str)
+        and isinstance(value[1], int)
+    )
+
+
+def _types_compatible(expected: str, actual: str) -> bool:
+    if expected == actual or expected == _ANY_TYPE or actual == _ANY_TYPE:
+        return True
+    # ComfyUI 允许用逗号分隔的联合类型
+    return bool(set(expected.split(",")) & set(actual.split(",")))
+
+
+def _check_value(spec: InputSpec, value: Any) -> Optional[str]:
+    """校验字面量取值，返回错误信息"""
+    kind = spec.kind
+    if kind == KIND_ENUM:
+        if spec.upload:
+            # 上传的文件名：只要求是字符串，文件是否存在由 ComfyUI 校验
+            if not isinstance(value, str):
+                return f"需要文件名，实际为 {type(value).__name__}"
+            return None
+        if _hashable(value) not in spec.options:
+            listed = sorted(str(v) for v in spec.options)
+            if len(listed) > _MAX_LISTED_OPTIONS:
+                listed = listed[:_MAX_LISTED_OPTIONS] + ["..."]
+            return f"取值 {value!r} 不在可选范围内（可选: {', '.join(listed)}）"
+        return None
+
+    if kind == KIND_INT or kind == KIND_FLOAT:
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return f"需要数值，实际为 {type(value).__name__}"
+        if kind == KIND_INT and isinstance(value, float) and not value.is_integer():
+            return f"需要整数，实际为 {value!r}"
+        if spec.minimum is not None and value < spec.minimum:
+            return f"取值 {value!r} 小于最小值 {spec.minimum}"
+        if spec.maximum is not None and value > spec.maximum:
+            return f"取值 {value!r} 大于最大值 {spec.maximum}"
+        return None
+
+    if kind == KIND_STRING:
+        if not isinstance(value, str):
+            return f"需要字符串，实际为 {type(value).__name__}"
+        return None
+
+    if kind == KIND_BOOLEAN:
+        if not isinstance(value, bool):
+            return f"需要布尔值，实际为 {type(value).__name__}"
+        return None
+
+    return f"{spec.type_name} 类型的输入必须来自节点连接"
+
+
+class BackendSchema:
+    """单个后端的节点定义（按需编译并缓存）"""
+
+    def __init__(self, object_info: Dict[str, Any], fetched_at: Optional[float] = None):
+        self.object_info = object_info
+        self.fetched_at = fetched_at or time.time()
+        self._nodes: Dict[str, Optional[NodeSchema]] = {}
+
+    def __len__(self) -> int:
+        return len(self.object_info)
+
+    def node(self, class_type: str) -> Optional[NodeSchema]:
+        try:
+            return self._nodes[class_type]
+        except KeyError:
+            info = self.object_info.get(class_type)
+            schema = compile_node(class_type, info) if isinstance(info, dict) else None
+            self._nodes[class_type] = schema
+            return schema
+
+    def validate(
+        self,
+        workflow: Dict[str, Any],
+        labels: Optional[Dict[Tuple[str, str], str]] = None
+    ) -> List[str]:
+        """校验 API 格式的工作流，返回错误列表（空列表表示通过）
+
+        labels: (节点, 输入名) -> 请求字段名，用于让错误信息指向用户提交的参数
+        """
+        errors: List[str] = []
+        for node_id, node in workflow.items():
+            class_type = node.get("class_type")
+            schema = self.node(class_type)
+            if schema is None:
+                errors.append(f"节点 {node_id}: ComfyUI 中不存在节点类型 {class_type}")
+                continue
+
+            inputs = node.get("inputs") or {}
+            for input_name in schema.required:
+                if input_name not in inputs:
+                    errors.append(f"节点 {node_id}（{class_type}）缺少必填输入 {input_name}")
+
+            for input_name, value in inputs.items():
+                spec = schema.get(input_name)
+                if spec is None:
+                    # ComfyUI 会忽略未定义的输入
+                    continue
+
+                if _is_link(value):
+                    message = self._check_link(workflow, spec, value)
+                else:
+                    message = _check_value(spec, value)
+                if message is None:
+                    continue
+
+                field = labels.get((node_id, input_name)) if labels else None
+                if field:
+                    errors.append(f"参数 {field}: {message}")
+                else:
+                    errors.append(f"节点 {node_id}（{class_type}）输入 {input_name}: {message}")
+        return errors
+
+    def _check_link(self, workflow: Dict[str, Any], spec: InputSpec, link: List[Any]) -> Optional[str]:
+        source_id, output_index = link
+        source = workflow.get(source_id)
+        if source is None:
+            return f"连接的节点 {source_id} 不存在"
+        source_schema = self.node(source.get("class_type"))
+        if source_schema is None:
+            # 源节点类型缺失时已单独报错
+            return None
+        if output_index < 0 or output_index >= len(source_schema.output_types):
+            return f"节点 {source_id} 没有第 {output_index} 个输出"
+        actual = source_schema.output_types[output_index]
+        if spec.kind != KIND_ENUM and not _types_compatible(spec.type_name, actual):
+            return f"需要 {spec.type_name} 类型的连接，节点 {source_id} 输出的是 {actual}"
+        return None
+
+
+class SchemaCache:
+    """所有后端的节点定义缓存：启动时拉取，之后定期刷新"""
+
+    def __init__(self, clients: Dict[str, ComfyUIClient], refresh_interval: float = 600.0):
+        self.clients = clients
+        self.refresh_interval = refresh_interval
+        self._schemas: Dict[str, BackendSchema] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.refresh_all()
+        if self.refresh_interval > 0:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def get(self, backend: str) -> Optional[BackendSchema]:
+        return self._schemas.get(backend)
+
+    async def refresh(self, backend: str) -> bool:
+        client = self.clients[backend]
+        try:
+            object_info = await client.get_object_info()
+        except Exception as e:
+            logger.warning(f"获取 {backend} 的节点定义失败: {e}")
+            return False
+        self._schemas[backend] = BackendSchema(object_info)
+        logger.info(f"已缓存 {backend} 的节点定义: {len(object_info)} 个节点类型")
+        return True
+
+    async def refresh_all(self):
+        await asyncio.gather(*(self.refresh(name) for name in self.clients))
+
+    async def _refresh_loop(self):
+        while True:
+            # 尚未拉取成功的后端较快重试
+            missing = any(name not in self._schemas for name in self.clients)
+            await asyncio.sleep(min(self.refresh_interval, 30.0) if missing else self.refresh_interval)
+            await self.refresh_all()
+
+    def validate(
+        self,
+        backend: str,
+        workflow: Dict[str, Any],
+        labels: Optional[Dict[Tuple[str, str], str]] = None
+    ):
+        """校验工作流，失败时抛出 WorkflowValidationError
+
+        尚未获取到节点定义时直接放行，由 ComfyUI 校验
+        """
+        schema = self._schemas.get(backend)
+        if schema is None:
+            return
+        errors = schema.validate(workflow, labels)
+        if errors:
+            raise WorkflowValidationError(errors)
@@ -0,0 +1,114 @@
+"""
+CPU 密集操作卸载
+大图片的 base64 编码、大请求体的 JSON 序列化、内容摘要等放到有界线程池中执行，
+不阻塞事件循环上的其它请求；小数据直接在当前线程处理（线程切换的开销比计算本身更大）
+
+安装了 orjson 时使用 orjson 序列化 JSON，否则使用标准库 json
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional, TypeVar
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson 是可选依赖
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# 超过该大小（字节）的数据才卸载到线程池
+OFFLOAD_THRESHOLD = 64 * 1024
+
+
+def json_dumps(obj: Any) -> bytes:
+    """序列化为 UTF-8 JSON（不转义非 ASCII 字符）"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_loads(data: Any) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class CpuPool:
+    """
+    有界线程池
+
+    同时排队的任务数不超过 max_pending，超出时调用方在事件循环上等待，而不是无限堆积在线程池队列中。
+    base64、orjson 执行时持有 GIL，线程池不能让它们并行，但事件循环线程每个切换间隔（约 5 毫秒）
+    都能拿回执行权，其它请求的延迟不再随数据大小增长；hashlib 处理大数据时会释放 GIL，可以真正并行
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, max_pending: int = 64):
+        self.max_workers = max_workers or min(4, os.cpu_count() or 1)
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self.pending = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix="offload")
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args) -> T:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+        async with self._slots:
+            self.pending += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+            finally:
+                self.pending -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        self._slots = None
+
+
+default_pool = CpuPool()
+
+
+async def run_cpu(func: Callable[..., T], *args, size: int = OFFLOAD_THRESHOLD) -> T:
+    """size 超过阈值时在线程池中执行 func，否则直接调用"""
+    if size < OFFLOAD_THRESHOLD:
+        return func(*args)
+    return await default_pool.run(func, *args)
+
+
+async def sha256_hexdigest(data: bytes) -> str:
+    return await run_cpu(_sha256_hexdigest, data, size=len(data))
+
+
+async def encode_data_url_payload(build: Callable[[str], Any], data: bytes) -> bytes:
+    """
+    把 data 编码为 base64 后交给 build 生成请求体，并序列化为 JSON
+
+    base64 编码和 JSON 序列化在同一个线程池任务中完成，数 MB 的字符串不会在两步之间回到事件循环
+    """
+    return await run_cpu(_build_data_url_payload, build, data, size=len(data))
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+def _sha256_hexdigest(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _build_data_url_payload(build: Callable[[str], Any], data: bytes) -> bytes:
+    return json_dumps(build(_b64encode(data)))
@@ -0,0 +1,318 @@
+"""
+输出后处理
+任务完成后（可选）在进程池中为输出生成预览文件，前端不必下载完整的图片或视频：
+
+- 图片（Qwen SaveImage）：缩略图 JPEG
+- 视频（Wan2.2 VHS_VideoCombine、SaveWEBM）：首帧封面 JPEG 和低码率预览 MP4
+- 动图（SaveAnimatedWEBP）：缩小、抽帧后的动图预览 WEBP
+
+原始输出下载到产物目录（<dir>/<prompt_id>/），预览文件写在同一目录，由 /artifacts/{prompt_id}/{文件名} 提供下载，
+并列在状态响应的 previews 中。图片处理依赖 Pillow，视频处理依赖 ffmpeg，都是可选的：缺少时跳过对应的预览。
+Pillow 和进程池只在启用后处理时才导入（render_* 在子进程中导入 Pillow），不增加网关的启动时间。
+各 render_* 函数只读写本地文件，可以直接用合成的小图片测试，不需要 ComfyUI 和 GPU
+"""
+
+import asyncio
+import importlib.util
+import logging
+import shutil
+import subprocess
+import time
+from pathlib import Path, PurePosixPath
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from comfyui_client import ComfyUIClient
+from job_tracker import STATUS_COMPLETED, Job
+from metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+# 预览类型
+PREVIEW_THUMBNAIL = "thumbnail"
+PREVIEW_POSTER = "poster"
+PREVIEW_VIDEO = "preview"
+PREVIEW_ANIMATED = "animated"
+
+# 预览文件名后缀
+_SUFFIXES = {
+    PREVIEW_THUMBNAIL: ".thumb.jpg",
+    PREVIEW_POSTER: ".poster.jpg",
+    PREVIEW_VIDEO: ".preview.mp4",
+    PREVIEW_ANIMATED: ".preview.webp",
+}
+_VIDEO_EXTENSIONS = (".mp4", ".webm", ".mov", ".mkv", ".gif")
+_IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+
+# 动图预览最多保留的帧数
+ANIMATED_MAX_FRAMES = 48
+# ffmpeg 单个预览的超时（秒）
+FFMPEG_TIMEOUT = 300
+
+
+def preview_kinds(output: Dict[str, Any]) -> Tuple[str, ...]:
+    """根据输出描述（format 和扩展名）决定生成哪些预览"""
+    fmt = (output.get("format") or "").lower()
+    extension = PurePosixPath(output.get("filename") or "").suffix.lower()
+    if fmt == "webp" or extension == ".webp":
+        return (PREVIEW_ANIMATED,)
+    if fmt.startswith("video/") or fmt in ("mp4", "webm") or extension in _VIDEO_EXTENSIONS:
+        return (PREVIEW_POSTER, PREVIEW_VIDEO)
+    if extension in _IMAGE_EXTENSIONS:
+        return (PREVIEW_THUMBNAIL,)
+    return ()
+
+
+def _fit(width: int, height: int, size: int) -> Tuple[int, int]:
+    """等比缩放到长边不超过 size"""
+    scale = min(size / max(width, height), 1.0)
+    return max(int(width * scale), 1), max(int(height * scale), 1)
+
+
+def render_thumbnail(source: str, target: str, size: int) -> str:
+    """图片缩略图（JPEG）"""
+    from PIL import Image
+
+    with Image.open(source) as image:
+        image = image.convert("RGB")
+        image.thumbnail((size, size))
+        image.save(target, "JPEG", quality=85)
+    return target
+
+
+def render_animated_preview(source: str, target: str, size: int, max_frames: int = ANIMATED_MAX_FRAMES) -> str:
+    """动图预览：缩小并均匀抽取不超过 max_frames 帧（保持总时长）"""
+    from PIL import Image, ImageSequence
+
+    with Image.open(source) as image:
+        total = getattr(image, "n_frames", 1)
+        step = max(-(-total // max_frames), 1)
+        frames = []
+        durations = []
+        for index, frame in enumerate(ImageSequence.Iterator(image)):
+            # 帧解码后 info 中才是这一帧的 duration（之前是上一帧的）
+            frame.load()
+            duration = frame.info.get("duration", 0)
+            if index % step:
+                durations[-1] += duration
+                continue
+            frames.append(frame.convert("RGBA").resize(_fit(frame.width, frame.height, size)))
+            durations.append(duration)
+        frames[0].save(
+            target, "WEBP", save_all=len(frames) > 1, append_images=frames[1:],
+            duration=durations if len(frames) > 1 else durations[0], loop=0, quality=70
+        )
+    return target
+
+
+def _run_ffmpeg(ffmpeg: str, args: List[str]):
+    subprocess.run(
+        [ffmpeg, "-hide_banner", "-loglevel", "error", "-y", *args],
+        check=True, capture_output=True, timeout=FFMPEG_TIMEOUT
+    )
+
+
+def render_poster(ffmpeg: str, source: str, target: str, size: int) -> str:
+    """视频首帧封面（JPEG）"""
+    _run_ffmpeg(ffmpeg, [
+        "-i", source, "-frames:v", "1",
+        "-vf", f"scale='min({size},iw)':-2", "-q:v", "4", target
+    ])
+    return target
+
+
+def render_video_preview(ffmpeg: str, source: str, target: str, size: int, bitrate: str) -> str:
+    """低码率预览视频（H.264 MP4，无音轨，可边下边播）"""
+    _run_ffmpeg(ffmpeg, [
+        "-i", source, "-an",
+        "-vf", f"scale='min({size},iw)':-2",
+        "-c:v", "libx264", "-preset", "veryfast", "-b:v", bitrate, "-pix_fmt", "yuv420p",
+        "-movflags", "+faststart", target
+    ])
+    return target
+
+
+def artifact_file(directory: Path, prompt_id: str, name: str) -> Path:
+    """产物目录中的文件（拒绝路径穿越），不存在时返回 404"""
+    if not prompt_id or not name or "/" in prompt_id + name or "\\" in prompt_id + name or ".." in prompt_id + name:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    path = directory / prompt_id / name
+    if not path.is_file():
+        raise HTTPException(status_code=404, detail="文件不存在")
+    return path
+
+
+class PostProcessor:
+    """任务完成后生成预览文件（任务结束回调触发，在进程池中执行）"""
+
+    def __init__(
+        self,
+        directory: Path,
+        clients: Dict[str, ComfyUIClient],
+        workers: int = 2,
+        ffmpeg: str = "ffmpeg",
+        thumbnail_size: int = 320,
+        preview_size: int = 480,
+        preview_bitrate: str = "300k",
+        retention: float = 86400.0,
+        metrics: Optional[MetricsRegistry] = None,
+        on_done: Optional[Callable[[Job], None]] = None
+    ):
+        self.directory = Path(directory)
+        self.clients = clients
+        self.workers = workers
+        self.ffmpeg = shutil.which(ffmpeg)
+        self.pillow = importlib.util.find_spec("PIL") is not None
+        self.thumbnail_size = thumbnail_size
+        self.preview_size = preview_size
+        self.preview_bitrate = preview_bitrate
+        self.retention = retention
+        self.on_done = on_done
+        self._pool = None
+        self._tasks: set = set()
+        self._pruner: Optional[asyncio.Task] = None
+
+        metrics = metrics or MetricsRegistry()
+        self.durations = metrics.summary(
+            "gateway_postprocess_seconds",
+            "生成单个预览文件的耗时",
+            ("kind",)
+        )
+        self.failures = metrics.counter(
+            "gateway_postprocess_failures_total",
+            "生成预览失败的次数",
+            ("kind",)
+        )
+        metrics.gauge(
+            "gateway_postprocess_pending",
+            "等待生成预览的任务数",
+            (),
+            lambda: [((), len(self._tasks))]
+        )
+
+    def available(self, kind: str) -> bool:
+        if kind in (PREVIEW_THUMBNAIL, PREVIEW_ANIMATED):
+            return self.pillow
+        return self.ffmpeg is not None
+
+    async def start(self):
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # spawn：不继承事件循环、线程和网络连接
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        if not self.pillow:
+            logger.warning("未安装 Pillow，不生成图片缩略图和动图预览")
+        if self.ffmpeg is None:
+            logger.warning("未找到 ffmpeg，不生成视频封面和预览视频")
+        if self.retention > 0:
+            self._pruner = asyncio.create_task(self._prune_loop())
+
+    async def stop(self):
+        tasks = list(self._tasks)
+        if self._pruner is not None:
+            tasks.append(self._pruner)
+            self._pruner = None
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+            self._pool = None
+
+    def observe(self, job: Job):
+        """任务结束回调：为成功任务的输出生成预览"""
+        if job.status != STATUS_COMPLETED or not job.outputs or self._pool is None:
+            return
+        task = asyncio.create_task(self.process(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def process(self, job: Job):
+        previews: List[Dict[str, Any]] = []
+        for output in job.outputs:
+            kinds = [kind for kind in preview_kinds(output) if self.available(kind)]
+            if not kinds:
+                continue
+            try:
+                source = await self._fetch(job, output)
+            except Exception as e:
+                logger.error(f"下载输出文件失败（{job.prompt_id}）: {e}")
+                continue
+            for kind in kinds:
+                preview = await self._render(job.prompt_id, kind, source)
+                if preview is not None:
+                    previews.append({"kind": kind, "source": output["filename"], **preview})
+        if not previews:
+            return
+        job.previews = previews
+        if self.on_done is not None:
+            self.on_done(job)
+
+    async def _fetch(self, job: Job, output: Dict[str, Any]) -> Path:
+        """原始输出下载到产物目录（已下载过时直接使用）"""
+        path = self.directory / job.prompt_id / PurePosixPath(output["filename"]).name
+        if path.exists():
+            return path
+        data = await self.clients[job.backend].get_view(
+            output["filename"], output.get("subfolder", ""), output.get("type", "output")
+        )
+        await asyncio.get_running_loop().run_in_executor(None, _write_file, path, data)
+        return path
+
+    async def _render(self, prompt_id: str, kind: str, source: Path) -> Optional[Dict[str, Any]]:
+        target = source.with_name(source.name + _SUFFIXES[kind])
+        if kind == PREVIEW_THUMBNAIL:
+            call = (render_thumbnail, str(source), str(target), self.thumbnail_size)
+        elif kind == PREVIEW_ANIMATED:
+            call = (render_animated_preview, str(source), str(target), self.preview_size)
+        elif kind == PREVIEW_POSTER:
+            call = (render_poster, self.ffmpeg, str(source), str(target), self.preview_size)
+        else:
+            call = (render_video_preview, self.ffmpeg, str(source), str(target), self.preview_size,
+                    self.preview_bitrate)
+
+        started = time.perf_counter()
+        try:
+            await asyncio.get_running_loop().run_in_executor(self._pool, *call)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.failures.inc(kind)
+            logger.error(f"生成预览失败（{prompt_id}，{kind}）: {e}")
+            return None
+        self.durations.observe(time.perf_counter() - started, kind)
+        return {
+            "filename": target.name,
+            "size": target.stat().st_size,
+            "url": f"/artifacts/{prompt_id}/{target.name}",
+        }
+
+    async def _prune_loop(self):
+        """定期删除超过保留时间的产物目录"""
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                removed = await loop.run_in_executor(None, self.prune, time.time() - self.retention)
+                if removed:
+                    logger.info(f"已清理 {removed} 个过期的产物目录")
+            except Exception as e:
+                logger.error(f"清理产物目录失败: {e}")
+            await asyncio.sleep(min(self.retention, 3600.0))
+
+    def prune(self, before: float) -> int:
+        removed = 0
+        for path in self.directory.iterdir():
+            if path.is_dir() and path.stat().st_mtime < before:
+                shutil.rmtree(path, ignore_errors=True)
+                removed += 1
+        return removed
+
+
+def _write_file(path: Path, data: bytes):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temporary = path.with_name(path.name + ".part")
+    temporary.write_bytes(data)
+    temporary.replace(path)
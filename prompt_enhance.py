@@ -0,0 +1,161 @@
+"""
+提示词优化
+调用 Moonshot AI（支持视觉输入）扩写图生视频提示词
+"""
+
+import logging
+from functools import partial
+from typing import Any, Dict, Optional
+
+import httpx
+from fastapi import HTTPException
+
+from offload import encode_data_url_payload, json_dumps
+
+logger = logging.getLogger(__name__)
+
+# 提示词优化系统提示词
+PROMPT_ENHANCE_SYSTEM_MESSAGE = """
+你是一个专业的视频创作助手，请根据用户输入的提示词，扩展出更高质量的视频提示词，确保适合生成一个5秒的图生视频：
+
+要求：
+1. 输出结果必须是完整的一段话，控制在500字以内，语言精炼，表达准确，避免冗余。尽量使用简单的词语和句子结构。
+2. 这段话应包含：主体描述、背景描述、运动描述、光线氛围等元素。
+3. 运动描述要符合物理规律，避免非常复杂的物理动作（如球类的弹跳、高空抛物等）。
+4. 运动变化幅度不能过大，要适合5秒短视频。
+5. 基于用户的简单提示词，合理推断和补充细节，使描述更加生动具体。
+
+请直接输出优化后的提示词，不要有其他说明文字。
+"""
+
+
+class MoonshotEnhancer:
+    """Moonshot AI 提示词优化客户端（复用连接池）"""
+
+    def __init__(self, api_key: str, api_url: str, model: str):
+        self.api_key = api_key
+        self.api_url = api_url
+        self.model = model
+        self._client: Optional[httpx.AsyncClient] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.api_key)
+
+    def _get_client(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=120.0, proxies={})
+        return self._client
+
+    async def close(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _build_payload(
+        self,
+        user_prompt: str,
+        image_base64: Optional[str],
+        temperature: float,
+        max_tokens: int
+    ) -> Dict[str, Any]:
+        """构建请求体；有图片时先放图片，再放文本提示词"""
+        if image_base64 is not None:
+            user_content: Any = [
+                {
+                    "type": "image_url",
+                    "image_url": {
+                        "url": f"data:image/jpeg;base64,{image_base64}"
+                    }
+                },
+                {
+                    "type": "text",
+                    "text": user_prompt
+                }
+            ]
+        else:
+            user_content = user_prompt
+
+        return {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": PROMPT_ENHANCE_SYSTEM_MESSAGE
+                },
+                {
+                    "role": "user",
+                    "content": user_content
+                }
+            ],
+            "temperature": temperature,
+            "max_tokens": max_tokens
+        }
+
+    async def enhance(
+        self,
+        user_prompt: str,
+        image_data: Optional[bytes] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 2000
+    ) -> str:
+        """
+        使用 Moonshot AI API 优化提示词（支持视觉输入）
+
+        Args:
+            user_prompt: 用户输入的提示词
+            image_data: 图片二进制数据（可选，支持视觉分析）
+            temperature: 生成温度
+            max_tokens: 最大token数
+
+        Returns:
+            优化后的提示词
+        """
+        if not self.api_key:
+            raise HTTPException(
+                status_code=500,
+                detail="Moonshot API Key 未配置，请在 config.ini 文件中配置 [moonshot] api_key"
+            )
+
+        try:
+            headers = {
+                "Content-Type": "application/json",
+                "Authorization": f"Bearer {self.api_key}"
+            }
+
+            if image_data:
+                logger.info(f"已接收图片数据（{len(image_data)} bytes），正在使用视觉模型分析")
+                # 大图片的 base64 编码和请求体序列化在线程池中完成，不阻塞事件循环
+                body = await encode_data_url_payload(
+                    partial(self._build_payload, user_prompt, temperature=temperature, max_tokens=max_tokens),
+                    image_data
+                )
+            else:
+                body = json_dumps(self._build_payload(user_prompt, None, temperature, max_tokens))
+
+            response = await self._get_client().post(
+                self.api_url,
+                content=body,
+                headers=headers
+            )
+            response.raise_for_status()
+            result = response.json()
+
+            # 提取生成的内容
+            enhanced_prompt = result["choices"][0]["message"]["content"]
+            logger.info(f"提示词优化成功，原始长度: {len(user_prompt)}, 优化后长度: {len(enhanced_prompt)}")
+            if image_data:
+                logger.info("已使用视觉模型分析图片内容")
+            return enhanced_prompt
+
+        except httpx.HTTPError as e:
+            logger.error(f"调用 Moonshot API 失败: {e}")
+            if hasattr(e, 'response') and e.response:
+                logger.error(f"响应内容: {e.response.text}")
+            raise HTTPException(status_code=500, detail=f"调用 Moonshot API 失败: {str(e)}")
+        except KeyError as e:
+            logger.error(f"解析 Moonshot API 响应失败: {e}")
+            raise HTTPException(status_code=500, detail=f"解析 API 响应失败: {str(e)}")
+        except Exception as e:
+            logger.error(f"优化提示词时发生未知错误: {e}")
+            raise HTTPException(status_code=500, detail=f"优化提示词失败: {str(e)}")
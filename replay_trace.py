@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+请求轨迹回放工具
+按 trace_capture.py 录制的到达时间间隔，将请求回放到任意服务（1x 或加速）
+
+用法:
+    python replay_trace.py traces/requests.jsonl --target http://localhost:5014
+    python replay_trace.py traces/requests.jsonl --target http://localhost:8001 --speed 10
+    python replay_trace.py traces/requests.jsonl --target http://localhost:5014 \
+        --blob-dir traces/blobs --fallback-image test.jpg --output replay_result.json
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from trace_capture import TRACE_FORMAT_VERSION, blob_path
+
+# 默认不回放状态轮询：录制时的 prompt_id 在回放目标上不存在
+DEFAULT_EXCLUDE_PREFIXES = ("/api/status/",)
+
+
+def load_trace(
+    path: Path,
+    service: Optional[str] = None,
+    include_prefixes: Optional[List[str]] = None,
+    exclude_prefixes: Optional[List[str]] = None
+) -> List[Dict[str, Any]]:
+    """读取轨迹文件，按到达时间排序并过滤"""
+    records = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                print(f"⚠️  第 {line_no} 行不是合法 JSON，已跳过")
+                continue
+            if record.get("v") != TRACE_FORMAT_VERSION:
+                continue
+            if service and record.get("service") != service:
+                continue
+            endpoint = record.get("endpoint", "")
+            if include_prefixes and not endpoint.startswith(tuple(include_prefixes)):
+                continue
+            if exclude_prefixes and endpoint.startswith(tuple(exclude_prefixes)):
+                continue
+            records.append(record)
+
+    records.sort(key=lambda r: r["ts"])
+    return records
+
+
+class ImageResolver:
+    """根据轨迹中的图片摘要找到回放用的图片内容"""
+
+    def __init__(self, blob_dir: Optional[Path], fallback_image: Optional[Path]):
+        self.blob_dir = blob_dir
+        self.fallback = fallback_image.read_bytes() if fallback_image else None
+        self._cache: Dict[str, bytes] = {}
+        self.missing = 0
+
+    def resolve(self, image_meta: Dict[str, Any]) -> Optional[bytes]:
+        digest = image_meta.get("digest", "")
+        if digest in self._cache:
+            return self._cache[digest]
+
+        data = None
+        if self.blob_dir:
+            path = blob_path(self.blob_dir, digest)
+            if path.exists():
+                data = path.read_bytes()
+        if data is None:
+            self.missing += 1
+            data = self.fallback
+
+        if data is not None:
+            self._cache[digest] = data
+        return data
+
+
+async def send_record(
+    client: httpx.AsyncClient,
+    record: Dict[str, Any],
+    images: ImageResolver,
+    due: float
+) -> Dict[str, Any]:
+    """
+    发送单条回放请求
+
+    due 为该请求按轨迹应当发出的时间（time.monotonic()）：延迟从 due 开始计算，
+    包含调度延迟和在 --max-in-flight 下排队等待的时间，与真实调用方看到的一致
+    """
+    method = record.get("method", "POST")
+    endpoint = record["endpoint"]
+    params = record.get("params") or {}
+    query = record.get("query") or {}
+    image_meta = record.get("image")
+    encoding = record.get("encoding")
+
+    try:
+        if image_meta:
+            image_data = images.resolve(image_meta)
+            if image_data is None:
+                return {"endpoint": endpoint, "status": None, "error": "缺少图片内容", "latency_ms": 0.0}
+            files = {
+                image_meta.get("field", "image"): (
+                    image_meta.get("filename", "replay.jpg"),
+                    image_data,
+                    image_meta.get("content_type", "image/jpeg")
+                )
+            }
+            data = {k: str(v) for k, v in params.items()}
+            response = await client.request(method, endpoint, params=query, data=data, files=files)
+        elif encoding == "json":
+            response = await client.request(method, endpoint, params=query, json=params)
+        elif encoding in ("form", "multipart"):
+            # multipart 无文件字段时（如仅文本的提示词优化）按普通表单发送
+            data = {k: str(v) for k, v in params.items()}
+            response = await client.request(method, endpoint, params=query, data=data)
+        else:
+            response = await client.request(method, endpoint, params=query)
+
+        return {
+            "endpoint": endpoint,
+            "status": response.status_code,
+            "recorded_status": record.get("status"),
+            "latency_ms": (time.monotonic() - due) * 1000,
+        }
+    except httpx.HTTPError as e:
+        return {
+            "endpoint": endpoint,
+            "status": None,
+            "error": str(e),
+            "latency_ms": (time.monotonic() - due) * 1000,
+        }
+
+
+async def replay(
+    records: List[Dict[str, Any]],
+    target: str,
+    speed: float,
+    images: ImageResolver,
+    timeout: float,
+    max_in_flight: int
+) -> Dict[str, Any]:
+    """按原始到达间隔（除以 speed）调度所有请求"""
+    results: List[Dict[str, Any]] = []
+    schedule_lag_ms: List[float] = []
+    semaphore = asyncio.Semaphore(max_in_flight)
+
+    async def run_one(record, client, due):
+        async with semaphore:
+            # 到达 --max-in-flight 上限后请求在客户端排队：这段时间计入延迟，并单独统计
+            client_wait_ms = (time.monotonic() - due) * 1000
+            result = await send_record(client, record, images, due)
+        result["client_wait_ms"] = client_wait_ms
+        results.append(result)
+
+    limits = httpx.Limits(max_connections=max_in_flight, max_keepalive_connections=max_in_flight)
+    async with httpx.AsyncClient(base_url=target, timeout=timeout, proxies={}, limits=limits) as client:
+        t0 = records[0]["ts"]
+        start = time.monotonic()
+        tasks = []
+
+        for record in records:
+            due = start + (record["ts"] - t0) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            schedule_lag_ms.append(max(0.0, time.monotonic() - due) * 1000)
+            tasks.append(asyncio.create_task(run_one(record, client, due)))
+
+        await asyncio.gather(*tasks)
+        wall_time = time.monotonic() - start
+
+    return summarize(results, schedule_lag_ms, wall_time, records, speed)
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return round(ordered[index], 3)
+
+
+def summarize(
+    results: List[Dict[str, Any]],
+    schedule_lag_ms: List[float],
+    wall_time: float,
+    records: List[Dict[str, Any]],
+    speed: float
+) -> Dict[str, Any]:
+    """汇总回放结果"""
+    by_endpoint: Dict[str, Dict[str, Any]] = {}
+    for result in results:
+        stats = by_endpoint.setdefault(
+            result["endpoint"], {"count": 0, "errors": 0, "latencies": [], "client_waits": []}
+        )
+        stats["count"] += 1
+        status = result.get("status")
+        if status is None or status >= 400:
+            stats["errors"] += 1
+        stats["latencies"].append(result["latency_ms"])
+        stats["client_waits"].append(result.get("client_wait_ms", 0.0))
+
+    endpoints = {}
+    for endpoint, stats in by_endpoint.items():
+        latencies = stats["latencies"]
+        endpoints[endpoint] = {
+            "count": stats["count"],
+            "errors": stats["errors"],
+            "p50_ms": percentile(latencies, 50),
+            "p90_ms": percentile(latencies, 90),
+            "p99_ms": percentile(latencies, 99),
+            "client_wait_p99_ms": percentile(stats["client_waits"], 99),
+        }
+
+    trace_span = records[-1]["ts"] - records[0]["ts"] if records else 0.0
+    return {
+        "requests": len(results),
+        "errors": sum(s["errors"] for s in by_endpoint.values()),
+        "speed": speed,
+        "trace_span_s": round(trace_span, 3),
+        "wall_time_s": round(wall_time, 3),
+        "schedule_lag_p99_ms": percentile(schedule_lag_ms, 99),
+        "client_wait_p99_ms": percentile([r.get("client_wait_ms", 0.0) for r in results], 99),
+        "endpoints": endpoints,
+    }
+
+
+def print_summary(summary: Dict[str, Any], missing_images: int):
+    print("\n" + "=" * 60)
+    print(" 回放结果")
+    print("=" * 60)
+    print(f"请求总数: {summary['requests']}，失败: {summary['errors']}")
+    print(f"轨迹时长: {summary['trace_span_s']}s，回放耗时: {summary['wall_time_s']}s（{summary['speed']}x）")
+    print(f"调度延迟 p99: {summary['schedule_lag_p99_ms']} ms")
+    print(f"客户端排队 p99: {summary['client_wait_p99_ms']} ms（包含在延迟中；持续偏高时调大 --max-in-flight）")
+    if missing_images:
+        print(f"⚠️  {missing_images} 张图片未在 blob 目录中找到，已使用替代图片")
+    print()
+    for endpoint, stats in sorted(summary["endpoints"].items()):
+        print(
+            f"  {endpoint:<40} n={stats['count']:<6} err={stats['errors']:<4} "
+            f"p50={stats['p50_ms']}ms p90={stats['p90_ms']}ms p99={stats['p99_ms']}ms "
+            f"排队 p99={stats['client_wait_p99_ms']}ms"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="按录制的到达过程回放请求轨迹")
+    parser.add_argument("trace", type=Path, help="轨迹文件（JSONL）")
+    parser.add_argument("--target", required=True, help="回放目标服务地址，如 http://localhost:5014")
+    parser.add_argument("--speed", type=float, default=1.0, help="回放速度倍数（默认 1x）")
+    parser.add_argument("--service", help="只回放指定服务录制的请求")
+    parser.add_argument("--include", action="append", help="只回放以该前缀开头的端点（可多次指定）")
+    parser.add_argument("--exclude", action="append", help="跳过以该前缀开头的端点（默认跳过 /api/status/）")
+    parser.add_argument("--blob-dir", type=Path, default=os.environ.get("COMFYUI_TRACE_BLOB_DIR"), help="录制时保存的图片目录")
+    parser.add_argument("--fallback-image", type=Path, help="找不到原图时使用的替代图片")
+    parser.add_argument("--limit", type=int, help="最多回放的请求数")
+    parser.add_argument("--timeout", type=float, default=900.0, help="单个请求超时（秒）")
+    parser.add_argument("--max-in-flight", type=int, default=256, help="最大并发请求数")
+    parser.add_argument("--output", type=Path, help="将汇总结果写入 JSON 文件")
+    args = parser.parse_args()
+
+    if args.speed <= 0:
+        parser.error("--speed 必须大于 0")
+
+    exclude = args.exclude if args.exclude is not None else list(DEFAULT_EXCLUDE_PREFIXES)
+    records = load_trace(args.trace, args.service, args.include, exclude)
+    if args.limit:
+        records = records[:args.limit]
+    if not records:
+        print("❌ 轨迹中没有可回放的请求")
+        sys.exit(1)
+
+    print(f"📼 已加载 {len(records)} 条请求，目标: {args.target}，速度: {args.speed}x")
+    images = ImageResolver(args.blob_dir, args.fallback_image)
+    summary = asyncio.run(replay(records, args.target, args.speed, images, args.timeout, args.max_in_flight))
+    print_summary(summary, images.missing)
+
+    if args.output:
+        args.output.write_text(json.dumps(summary, indent=2, ensure_ascii=False), encoding="utf-8")
+        print(f"\n结果已写入: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
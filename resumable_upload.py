@@ -0,0 +1,293 @@
+"""
+可续传的分块上传
+慢速网络下大图片不必一次 POST 完成，失败后从已确认的偏移继续：
+
+    POST /api/uploads                      登记上传：文件名、总大小、可选的整体 sha256 -> upload_id
+    PUT  /api/uploads/{upload_id}          追加一块（请求头 Upload-Offset，可选 Upload-Checksum: sha256 <hex>）
+    GET  /api/uploads/{upload_id}          查询已接收的偏移（断线后从这里继续）
+    POST /api/uploads/{upload_id}/complete 校验大小和整体摘要，上传到 ComfyUI
+
+分块直接追加到磁盘上的文件，状态保存在同目录的 JSON 中：多进程模式下各工作进程共享，网关重启后仍可续传。
+完成后的 upload_id 可用于各图生视频接口（表单字段 upload_id 代替 image）；完成响应中的 image_filename
+也可直接用于 /api/generate
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from pathlib import Path, PurePosixPath
+from typing import IO, Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, Request
+from pydantic import BaseModel, Field
+
+logger = logging.getLogger(__name__)
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+_CHECKSUM = re.compile(r"^sha256 ([0-9a-fA-F]{64})$")
+# 计算整体摘要时每次读取的大小
+_READ_SIZE = 1024 * 1024
+
+
+class UploadInitRequest(BaseModel):
+    """登记分块上传"""
+    filename: str = Field(..., description="原始文件名", min_length=1, max_length=255)
+    size: int = Field(..., description="文件总大小（字节）", gt=0)
+    sha256: Optional[str] = Field(None, description="整体 sha256（十六进制，可选，完成时校验）", pattern="^[0-9a-fA-F]{64}$")
+
+
+class ResumableUploads:
+    """磁盘上的分块上传：<dir>/<upload_id>.part 保存数据，<upload_id>.json 保存状态"""
+
+    def __init__(self, directory: Path, max_size: int = 64 * 1024 * 1024, chunk_size: int = 4 * 1024 * 1024,
+                 ttl: float = 86400.0):
+        self.directory = Path(directory)
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.ttl = ttl
+
+    @classmethod
+    def from_config(cls, config) -> "ResumableUploads":
+        return cls(config.upload_dir, config.upload_max_size, config.upload_chunk_size, config.upload_ttl)
+
+    def _paths(self, upload_id: str):
+        if not _UPLOAD_ID.match(upload_id or ""):
+            raise HTTPException(status_code=404, detail="上传不存在或已过期")
+        return self.directory / f"{upload_id}.part", self.directory / f"{upload_id}.json"
+
+    def _load(self, upload_id: str) -> Dict[str, Any]:
+        _, meta_path = self._paths(upload_id)
+        try:
+            meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail="上传不存在或已过期")
+        if time.time() - meta["updated_at"] > self.ttl:
+            self._remove(upload_id)
+            raise HTTPException(status_code=404, detail="上传不存在或已过期")
+        return meta
+
+    def _save(self, meta: Dict[str, Any]):
+        _, meta_path = self._paths(meta["upload_id"])
+        meta["updated_at"] = time.time()
+        temporary = meta_path.with_name(meta_path.name + ".tmp")
+        temporary.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        temporary.replace(meta_path)
+
+    def _remove(self, upload_id: str):
+        for path in self._paths(upload_id):
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def create(self, tenant: str, filename: str, size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        if size > self.max_size:
+            raise HTTPException(status_code=413, detail=f"文件过大，上限为 {self.max_size} 字节")
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.prune()
+        upload_id = uuid.uuid4().hex
+        data_path, _ = self._paths(upload_id)
+        data_path.touch()
+        meta = {
+            "upload_id": upload_id,
+            "tenant": tenant,
+            "filename": PurePosixPath(filename).name,
+            "size": size,
+            "sha256": sha256.lower() if sha256 else None,
+            "completed": False,
+            "image_filename": None,
+            "created_at": time.time(),
+        }
+        self._save(meta)
+        return self.describe(meta, 0)
+
+    def describe(self, meta: Dict[str, Any], offset: int) -> Dict[str, Any]:
+        return {
+            "upload_id": meta["upload_id"],
+            "filename": meta["filename"],
+            "size": meta["size"],
+            "offset": offset,
+            "chunk_size": self.chunk_size,
+            "completed": meta["completed"],
+            "sha256": meta["sha256"] if meta["completed"] else None,
+            "image_filename": meta["image_filename"],
+        }
+
+    def status(self, tenant: str, upload_id: str) -> Dict[str, Any]:
+        meta = self._owned(tenant, upload_id)
+        if meta["completed"]:
+            return self.describe(meta, meta["size"])
+        data_path, _ = self._paths(upload_id)
+        return self.describe(meta, data_path.stat().st_size)
+
+    def _owned(self, tenant: str, upload_id: str) -> Dict[str, Any]:
+        meta = self._load(upload_id)
+        if meta["tenant"] != tenant:
+            raise HTTPException(status_code=404, detail="上传不存在或已过期")
+        return meta
+
+    def append(self, tenant: str, upload_id: str, offset: int, data: bytes, checksum: Optional[str]) -> Dict[str, Any]:
+        """在 offset 处追加一块；offset 必须等于已接收的大小（重复发送已确认的块时返回 409 和当前偏移）"""
+        meta = self._owned(tenant, upload_id)
+        if meta["completed"]:
+            raise HTTPException(status_code=409, detail="上传已完成")
+        if checksum is not None:
+            match = _CHECKSUM.match(checksum.strip())
+            if match is None:
+                raise HTTPException(status_code=400, detail="Upload-Checksum 格式应为: sha256 <十六进制摘要>")
+            if hashlib.sha256(data).hexdigest() != match.group(1).lower():
+                raise HTTPException(status_code=422, detail="分块摘要不匹配，请重新发送该分块")
+
+        data_path, _ = self._paths(upload_id)
+        with open(data_path, "r+b") as f:
+            # 同一上传的并发请求可能落到不同的工作进程
+            fcntl.flock(f, fcntl.LOCK_EX)
+            current = f.seek(0, os.SEEK_END)
+            if offset != current:
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"偏移不一致，已接收 {current} 字节",
+                    headers={"Upload-Offset": str(current)}
+                )
+            if current + len(data) > meta["size"]:
+                raise HTTPException(status_code=413, detail="超出登记的文件大小")
+            f.write(data)
+            f.flush()
+            offset = current + len(data)
+        self._save(meta)
+        return self.describe(meta, offset)
+
+    def lock(self, tenant: str, upload_id: str) -> Optional[IO[bytes]]:
+        """
+        获取与追加分块相同的文件锁（阻塞，在线程池中调用），关闭返回的文件时释放
+
+        完成上传时持有到标记完成为止：并发的完成请求（可能落到不同的工作进程）只上传一次。
+        本地数据已删除（上传已完成）时返回 None
+        """
+        self._owned(tenant, upload_id)
+        data_path, _ = self._paths(upload_id)
+        try:
+            f = open(data_path, "rb")
+        except FileNotFoundError:
+            return None
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return f
+
+    def finish(self, tenant: str, upload_id: str) -> Dict[str, Any]:
+        """校验大小和整体摘要，返回状态（含 path）；摘要不匹配时丢弃已接收的数据"""
+        meta = self._owned(tenant, upload_id)
+        if meta["completed"]:
+            return meta
+        data_path, _ = self._paths(upload_id)
+        received = data_path.stat().st_size
+        if received != meta["size"]:
+            raise HTTPException(
+                status_code=409,
+                detail=f"上传未完成，已接收 {received} / {meta['size']} 字节",
+                headers={"Upload-Offset": str(received)}
+            )
+        digest = hashlib.sha256()
+        with open(data_path, "rb") as f:
+            for block in iter(lambda: f.read(_READ_SIZE), b""):
+                digest.update(block)
+        sha256 = digest.hexdigest()
+        if meta["sha256"] is not None and meta["sha256"] != sha256:
+            self._remove(upload_id)
+            raise HTTPException(status_code=422, detail="文件摘要不匹配，请重新上传")
+        meta["sha256"] = sha256
+        return {**meta, "path": str(data_path)}
+
+    def mark_completed(self, upload_id: str, sha256: str, image_filename: str) -> Dict[str, Any]:
+        """已上传到 ComfyUI：记录文件名并删除本地数据"""
+        meta = self._load(upload_id)
+        meta.update(completed=True, sha256=sha256, image_filename=image_filename)
+        self._save(meta)
+        data_path, _ = self._paths(upload_id)
+        data_path.unlink(missing_ok=True)
+        return self.describe(meta, meta["size"])
+
+    def resolve(self, tenant: str, upload_id: str) -> Dict[str, Any]:
+        """已完成的上传（用于生成接口）"""
+        meta = self._owned(tenant, upload_id)
+        if not meta["completed"]:
+            raise HTTPException(status_code=409, detail=f"上传 {upload_id} 尚未完成")
+        return meta
+
+    def prune(self, now: Optional[float] = None) -> int:
+        """删除超过 ttl 未更新的上传"""
+        now = now or time.time()
+        removed = 0
+        for meta_path in self.directory.glob("*.json"):
+            try:
+                if now - meta_path.stat().st_mtime > self.ttl:
+                    self._remove(meta_path.stem)
+                    removed += 1
+            except (FileNotFoundError, HTTPException):
+                continue
+        return removed
+
+
+def build_upload_router(gateway) -> APIRouter:
+    """分块上传接口（文件操作在线程池中执行）"""
+    router = APIRouter()
+    uploads: ResumableUploads = gateway.resumable_uploads
+
+    async def run(func, *args):
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    @router.post("/api/uploads")
+    async def create_upload(body: UploadInitRequest, request: Request):
+        """登记分块上传，返回 upload_id 和建议的分块大小"""
+        tenant = await gateway.identify(request)
+        return await run(uploads.create, tenant, body.filename, body.size, body.sha256)
+
+    @router.get("/api/uploads/{upload_id}")
+    async def get_upload(upload_id: str, request: Request):
+        """已接收的偏移：断线后从该偏移继续上传"""
+        return await run(uploads.status, await gateway.identify(request), upload_id)
+
+    @router.put("/api/uploads/{upload_id}")
+    async def append_chunk(upload_id: str, request: Request):
+        """追加一块（请求体为原始字节，请求头 Upload-Offset 为该块的起始偏移）"""
+        tenant = await gateway.identify(request)
+        try:
+            offset = int(request.headers["Upload-Offset"])
+        except (KeyError, ValueError):
+            raise HTTPException(status_code=400, detail="缺少或无效的 Upload-Offset 请求头")
+        try:
+            length = int(request.headers.get("Content-Length", 0))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="无效的 Content-Length 请求头")
+        if length > uploads.chunk_size:
+            raise HTTPException(status_code=413, detail=f"分块过大，上限为 {uploads.chunk_size} 字节")
+        data = await request.body()
+        if len(data) > uploads.chunk_size:
+            raise HTTPException(status_code=413, detail=f"分块过大，上限为 {uploads.chunk_size} 字节")
+        return await run(uploads.append, tenant, upload_id, offset, data, request.headers.get("Upload-Checksum"))
+
+    @router.post("/api/uploads/{upload_id}/complete")
+    async def complete_upload(upload_id: str, request: Request):
+        """校验并上传到 ComfyUI，返回可用于生成接口的 upload_id 和 image_filename"""
+        tenant = await gateway.identify(request)
+        lock = await run(uploads.lock, tenant, upload_id)
+        try:
+            # 等到锁时其他请求可能已经完成了上传
+            meta = await run(uploads.finish, tenant, upload_id)
+            if meta["completed"]:
+                return uploads.describe(meta, meta["size"])
+            content = await run(Path(meta["path"]).read_bytes)
+            with gateway.tracer.span("upload", size=len(content), resumable=True):
+                image_filename = await gateway.upload_image(content, meta["filename"])
+            logger.info(f"分块上传完成: {upload_id} -> {image_filename}")
+            return await run(uploads.mark_completed, upload_id, meta["sha256"], image_filename)
+        finally:
+            if lock is not None:
+                lock.close()
+
+    return router
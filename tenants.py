@@ -0,0 +1,382 @@
+"""
+租户：API Key 识别、提交速率限制、调度权重和用量统计
+
+租户在 config.ini 中以 [tenant:<名称>] 配置：
+
+    [tenant:acme]
+    api_key = sk-acme-xxxx
+    # 每秒可提交的任务数（令牌桶补充速率），0 表示不限制
+    rate = 0.5
+    # 令牌桶容量（允许的突发提交数）
+    burst = 10
+    # 公平调度权重，GPU 时间按权重分配
+    weight = 2
+
+注释须单独成行：配置文件不支持行尾注释（会成为取值的一部分）。
+
+每次请求的识别和限流都是 O(1)：按 API Key 查字典，令牌桶惰性补充。
+用量先累加在内存中，由后台任务定期批量写入 SQLite。
+"""
+
+import asyncio
+import configparser
+import logging
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from fastapi import Request
+
+from job_tracker import DEFAULT_TENANT, Job, STATUS_COMPLETED
+from metrics import MetricsRegistry
+
+logger = logging.getLogger(__name__)
+
+API_KEY_HEADER = "X-API-Key"
+TENANT_SECTION_PREFIX = "tenant:"
+
+
+class TenantError(Exception):
+    """租户识别失败或超出速率限制"""
+
+    def __init__(self, message: str, status_code: int, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """令牌桶（惰性补充）"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def take(self, now: Optional[float] = None) -> float:
+        """取一个令牌：成功返回 0，否则返回需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+
+class Tenant:
+    """单个租户"""
+
+    __slots__ = ("name", "weight", "bucket")
+
+    def __init__(self, name: str, rate: float = 0.0, burst: float = 1.0, weight: float = 1.0):
+        self.name = name
+        self.weight = weight if weight > 0 else 1.0
+        self.bucket = TokenBucket(rate, burst)
+
+
+class Usage:
+    """租户用量计数"""
+
+    __slots__ = ("submitted", "rate_limited", "completed", "failed", "gpu_seconds")
+
+    FIELDS = ("submitted", "rate_limited", "completed", "failed", "gpu_seconds")
+
+    def __init__(self):
+        self.submitted = 0
+        self.rate_limited = 0
+        self.completed = 0
+        self.failed = 0
+        self.gpu_seconds = 0.0
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "submitted": self.submitted,
+            "rate_limited": self.rate_limited,
+            "completed": self.completed,
+            "failed": self.failed,
+            "gpu_seconds": round(self.gpu_seconds, 1),
+        }
+
+
+class UsageStore:
+    """租户用量的 SQLite 存储（按租户、日期累加）"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._initialized = False
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(self.path), timeout=10)
+        if not self._initialized:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS tenant_usage (
+                    tenant TEXT NOT NULL,
+                    day TEXT NOT NULL,
+                    submitted INTEGER NOT NULL DEFAULT 0,
+                    rate_limited INTEGER NOT NULL DEFAULT 0,
+                    completed INTEGER NOT NULL DEFAULT 0,
+                    failed INTEGER NOT NULL DEFAULT 0,
+                    gpu_seconds REAL NOT NULL DEFAULT 0,
+                    PRIMARY KEY (tenant, day)
+                )
+                """
+            )
+            self._initialized = True
+        return conn
+
+    def write(self, batch: Dict[Tuple[str, str], Usage]):
+        """一次事务写入一批增量（在线程池中调用）"""
+        rows = [
+            (tenant, day, u.submitted, u.rate_limited, u.completed, u.failed, u.gpu_seconds)
+            for (tenant, day), u in batch.items()
+        ]
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    """
+                    INSERT INTO tenant_usage (tenant, day, submitted, rate_limited, completed, failed, gpu_seconds)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (tenant, day) DO UPDATE SET
+                        submitted = submitted + excluded.submitted,
+                        rate_limited = rate_limited + excluded.rate_limited,
+                        completed = completed + excluded.completed,
+                        failed = failed + excluded.failed,
+                        gpu_seconds = gpu_seconds + excluded.gpu_seconds
+                    """,
+                    rows
+                )
+        finally:
+            conn.close()
+
+    def read(self, tenant: str, days: int = 30) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "SELECT day, submitted, rate_limited, completed, failed, gpu_seconds "
+                "FROM tenant_usage WHERE tenant = ? ORDER BY day DESC LIMIT ?",
+                (tenant, days)
+            )
+            return [dict(zip(("day",) + Usage.FIELDS, row)) for row in cursor.fetchall()]
+        finally:
+            conn.close()
+
+
+def _day(timestamp: float) -> str:
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+
+def request_api_key(request: Request) -> Optional[str]:
+    """请求中的 API Key（X-API-Key 或 Authorization: Bearer）"""
+    api_key = request.headers.get(API_KEY_HEADER)
+    if not api_key:
+        authorization = request.headers.get("Authorization", "")
+        if authorization[:7].lower() == "bearer ":
+            api_key = authorization[7:].strip()
+    return api_key or None
+
+
+class TenantRegistry:
+    """租户注册表"""
+
+    def __init__(
+        self,
+        tenants: List[Tuple[Tenant, List[str]]],
+        require_api_key: bool = False,
+        default_rate: float = 0.0,
+        default_burst: float = 10.0,
+        store: Optional[UsageStore] = None,
+        flush_interval: float = 10.0,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        self.require_api_key = require_api_key
+        self.tenants: Dict[str, Tenant] = {}
+        self._by_key: Dict[str, Tenant] = {}
+        for tenant, api_keys in tenants:
+            self.tenants[tenant.name] = tenant
+            for api_key in api_keys:
+                self._by_key[api_key] = tenant
+        # 未携带 API Key 的调用方（require_api_key = false 时）
+        self.anonymous = self.tenants.setdefault(
+            DEFAULT_TENANT, Tenant(DEFAULT_TENANT, rate=default_rate, burst=default_burst)
+        )
+
+        self.store = store
+        self.flush_interval = flush_interval
+        self.usage: Dict[str, Usage] = {}
+        # 尚未写入 SQLite 的增量：(租户, 日期) -> Usage
+        self._pending: Dict[Tuple[str, str], Usage] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        metrics = metrics or MetricsRegistry()
+        self._submitted = metrics.counter("gateway_tenant_submissions_total", "租户提交的任务数", ("tenant",))
+        self._rate_limited = metrics.counter("gateway_tenant_rate_limited_total", "租户被限流的请求数", ("tenant",))
+        self._gpu_seconds = metrics.counter("gateway_tenant_gpu_seconds_total", "租户任务占用的 GPU 时间（秒）", ("tenant",))
+
+    @classmethod
+    def from_config(cls, config, metrics: Optional[MetricsRegistry] = None) -> "TenantRegistry":
+        """从 config.ini 的 [tenant:<名称>] 小节加载租户"""
+        tenants = load_tenants(config.parser)
+        store = UsageStore(config.usage_db) if config.usage_db else None
+        registry = cls(
+            tenants,
+            require_api_key=config.require_api_key,
+            default_rate=config.default_rate,
+            default_burst=config.default_burst,
+            store=store,
+            flush_interval=config.usage_flush_interval,
+            metrics=metrics
+        )
+        if tenants:
+            logger.info(f"已加载 {len(tenants)} 个租户: {', '.join(t.name for t, _ in tenants)}")
+        elif config.require_api_key:
+            logger.warning("require_api_key = true 但未配置任何租户，所有提交都会被拒绝")
+        return registry
+
+    # ------------------------------------------------------------------
+    # 生命周期
+    # ------------------------------------------------------------------
+
+    async def start(self):
+        if self.store is not None and self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    # ------------------------------------------------------------------
+    # 识别与限流
+    # ------------------------------------------------------------------
+
+    def identify(self, request: Request) -> Tenant:
+        """根据 X-API-Key 或 Authorization: Bearer 识别租户"""
+        return self.identify_key(request_api_key(request))
+
+    def identify_key(self, api_key: Optional[str]) -> Tenant:
+        if not api_key:
+            if self.require_api_key:
+                raise TenantError(f"缺少 API Key（请求头 {API_KEY_HEADER}）", status_code=401)
+            return self.anonymous
+
+        tenant = self._by_key.get(api_key)
+        if tenant is None:
+            raise TenantError("API Key 无效", status_code=401)
+        return tenant
+
+    def authorize(self, request: Request) -> Tenant:
+        """识别租户并消耗一次提交配额"""
+        return self.authorize_key(request_api_key(request))
+
+    def authorize_key(self, api_key: Optional[str]) -> Tenant:
+        tenant = self.identify_key(api_key)
+        wait = tenant.bucket.take()
+        if wait > 0:
+            self._record(tenant.name, "rate_limited", 1)
+            self._rate_limited.inc(tenant.name)
+            raise TenantError(
+                f"提交过于频繁，请 {wait:.1f} 秒后重试",
+                status_code=429,
+                retry_after=wait
+            )
+        return tenant
+
+    def weight(self, name: str) -> float:
+        tenant = self.tenants.get(name)
+        return tenant.weight if tenant is not None else 1.0
+
+    # ------------------------------------------------------------------
+    # 用量统计
+    # ------------------------------------------------------------------
+
+    def _record(self, tenant: str, field: str, amount: float, timestamp: Optional[float] = None):
+        usage = self.usage.get(tenant)
+        if usage is None:
+            usage = self.usage[tenant] = Usage()
+        setattr(usage, field, getattr(usage, field) + amount)
+
+        if self.store is not None:
+            key = (tenant, _day(timestamp or time.time()))
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = Usage()
+            setattr(pending, field, getattr(pending, field) + amount)
+
+    def record_submitted(self, job: Job):
+        self._record(job.tenant, "submitted", 1, job.created_at)
+        self._submitted.inc(job.tenant)
+
+    def record_finished(self, job: Job):
+        """任务结束回调"""
+        if job.status == STATUS_COMPLETED:
+            self._record(job.tenant, "completed", 1, job.finished_at)
+        else:
+            self._record(job.tenant, "failed", 1, job.finished_at)
+        if job.started_at is not None and job.finished_at is not None:
+            seconds = max(job.finished_at - job.started_at, 0.0)
+            self._record(job.tenant, "gpu_seconds", seconds, job.finished_at)
+            self._gpu_seconds.inc(job.tenant, amount=seconds)
+
+    def usage_of(self, tenant: str) -> Dict[str, Any]:
+        usage = self.usage.get(tenant)
+        return (usage or Usage()).to_dict()
+
+    async def history(self, tenant: str, days: int = 30) -> List[Dict[str, Any]]:
+        """已写入 SQLite 的按日用量（不含尚未刷新的部分）"""
+        if self.store is None:
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.store.read, tenant, days)
+
+    async def flush(self):
+        """把内存中的增量批量写入 SQLite"""
+        if self.store is None or not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(None, self.store.write, batch)
+        except Exception as e:
+            logger.error(f"写入租户用量失败: {e}")
+            # 写入失败时并回内存，下次重试
+            for key, usage in batch.items():
+                pending = self._pending.setdefault(key, Usage())
+                for field in Usage.FIELDS:
+                    setattr(pending, field, getattr(pending, field) + getattr(usage, field))
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+
+def load_tenants(parser: configparser.ConfigParser) -> List[Tuple[Tenant, List[str]]]:
+    """解析 [tenant:<名称>] 小节，api_key 可以用逗号分隔多个"""
+    tenants = []
+    for section in parser.sections():
+        if not section.startswith(TENANT_SECTION_PREFIX):
+            continue
+        name = section[len(TENANT_SECTION_PREFIX):].strip()
+        api_keys = [key.strip() for key in parser.get(section, 'api_key', fallback='').split(',') if key.strip()]
+        if not name or not api_keys:
+            logger.warning(f"忽略未配置 api_key 的租户: [{section}]")
+            continue
+        tenant = Tenant(
+            name,
+            rate=parser.getfloat(section, 'rate', fallback=0.0),
+            burst=parser.getfloat(section, 'burst', fallback=10.0),
+            weight=parser.getfloat(section, 'weight', fallback=1.0)
+        )
+        tenants.append((tenant, api_keys))
+    return tenants
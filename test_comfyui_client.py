@@ -0,0 +1,84 @@
+"""
+熔断器半开探测名额测试（不需要 ComfyUI）
+
+运行: python -m pytest test_comfyui_client.py
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from comfyui_client import BREAKER_CLOSED, BREAKER_HALF_OPEN, CircuitBreaker, ComfyUIClient
+
+PRIMARY = "http://primary:8188"
+REPLICA = "http://replica:8188"
+
+
+def half_open_client(handler, **kwargs) -> ComfyUIClient:
+    """熔断后立即允许探测的客户端（下一个请求占用唯一的探测名额）"""
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.0)
+    breaker.record_failure()
+    client = ComfyUIClient(PRIMARY, breaker=breaker, read_retries=0, **kwargs)
+    client._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return client
+
+
+def test_cancelled_hedged_primary_releases_probe():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        if request.url.host == "primary":
+            await asyncio.sleep(5)
+        return httpx.Response(200, json={"queue_running": [], "queue_pending": []})
+
+    async def run():
+        client = half_open_client(handler, replica_urls=[REPLICA], hedge_delay=0.05)
+        await client.get_queue()
+        await asyncio.sleep(0.01)
+        # 主请求被取消：仍是半开状态，但探测名额已归还
+        assert client.breaker.state == BREAKER_HALF_OPEN
+        assert client.available()
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_client_error_releases_probe_without_closing():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(404)
+
+    async def run():
+        client = half_open_client(handler)
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.get_history("missing")
+        assert client.breaker.state == BREAKER_HALF_OPEN
+        assert client.available()
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_unexpected_error_releases_probe():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        raise RuntimeError("boom")
+
+    async def run():
+        client = half_open_client(handler)
+        with pytest.raises(RuntimeError):
+            await client.get_queue()
+        assert client.available()
+        await client.close()
+
+    asyncio.run(run())
+
+
+def test_successful_probe_closes_breaker():
+    async def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={})
+
+    async def run():
+        client = half_open_client(handler)
+        await client.get_queue()
+        assert client.breaker.state == BREAKER_CLOSED
+        await client.close()
+
+    asyncio.run(run())
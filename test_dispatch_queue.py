@@ -0,0 +1,194 @@
+"""
+本地调度队列测试（不需要 ComfyUI）
+
+运行: python -m pytest test_dispatch_queue.py
+"""
+
+import asyncio
+import itertools
+import random
+from typing import Dict, List, Optional
+
+from comfyui_client import CircuitOpenError
+from dispatch_queue import DispatchQueue
+from job_tracker import PRIORITY_ASYNC, PRIORITY_BATCH, PRIORITY_INTERACTIVE, STATUS_PENDING, Job
+
+BACKEND = "default"
+_ids = itertools.count()
+
+
+class FakeBreaker:
+    def retry_in(self) -> float:
+        return 0.0
+
+
+class FakeClient:
+    """按顺序返回预设结果的后端：异常则抛出，否则视为提交成功"""
+
+    def __init__(self, results: Optional[List[Optional[Exception]]] = None):
+        self.name = BACKEND
+        self.breaker = FakeBreaker()
+        self.results = list(results or [])
+        self.submitted: List[str] = []
+
+    def available(self) -> bool:
+        return True
+
+    async def submit(self, workflow, client_id, prompt_id=None, timeout=30.0) -> str:
+        if self.results:
+            result = self.results.pop(0)
+            if result is not None:
+                raise result
+        self.submitted.append(prompt_id)
+        return prompt_id
+
+
+class FakeTracker:
+    client_id = "test"
+    tracer = None
+
+    def __init__(self):
+        self.listeners = []
+
+    def add_listener(self, callback):
+        self.listeners.append(callback)
+
+    def mark_submitted(self, job: Job, remote_id: str):
+        job.remote_id = remote_id
+        job.status = STATUS_PENDING
+
+    def mark_failed(self, job: Job, error: str):
+        job.error = error
+
+
+def make_queue(client: Optional[FakeClient] = None, **kwargs) -> DispatchQueue:
+    return DispatchQueue({BACKEND: client or FakeClient()}, FakeTracker(), **kwargs)
+
+
+def make_job(tenant: str = "a", priority: str = PRIORITY_ASYNC, cost: float = 10.0, created_at: float = 0.0) -> Job:
+    job = Job(prompt_id=f"{tenant}-{next(_ids)}", template="t", backend=BACKEND, params={}, tenant=tenant, priority=priority)
+    job.cost = cost
+    job.created_at = created_at
+    return job
+
+
+def drain(queue: DispatchQueue) -> List[Job]:
+    """按实际出队顺序取出全部任务"""
+    order = []
+    while queue.depth(BACKEND):
+        order.append(queue._pop(BACKEND)[0])
+    return order
+
+
+def lane_state(queue: DispatchQueue) -> Dict[str, tuple]:
+    return {name: (lane.start, lane.finish, len(lane.heap)) for name, lane in queue._lanes[BACKEND].items()}
+
+
+def test_requeue_restores_lane_charge():
+    queue = make_queue()
+    for index in range(3):
+        queue.put(make_job("a", created_at=index), {})
+        queue.put(make_job("b", created_at=index), {})
+    before = lane_state(queue)
+    expected = [job.prompt_id for job in queue.queued_jobs(BACKEND)]
+
+    job, workflow, start = queue._pop(BACKEND)
+    queue._requeue(job, workflow, start)
+
+    assert lane_state(queue) == before
+    assert [job.prompt_id for job in drain(queue)] == expected
+
+
+def test_circuit_open_requeue_is_charged_and_timed_once():
+    async def run():
+        client = FakeClient([CircuitOpenError("熔断中")])
+        queue = make_queue(client, max_inflight=1)
+        job = make_job("a")
+        queue.put(job, {})
+        await queue.start()
+        for _ in range(20):
+            await asyncio.sleep(0)
+        await queue.stop()
+
+        assert client.submitted == [job.prompt_id]
+        assert queue.queue_wait.stats(PRIORITY_ASYNC)["count"] == 1
+        # 只计入一次份额：虚拟时间从 0 前进到 cost
+        lane = queue._lanes[BACKEND]["a"]
+        assert (lane.start, lane.finish) == (0.0, job.cost)
+
+    asyncio.run(run())
+
+
+def test_batch_job_runs_after_priority_offset():
+    queue = make_queue()
+    batch = make_job("a", PRIORITY_BATCH, created_at=0.0)
+    queue.put(batch, {})
+    # 交互任务持续到达：入队时间超过 batch 任务的“入队时间 + 类别偏移”后，batch 任务排在前面
+    interactive = [make_job("a", PRIORITY_INTERACTIVE, created_at=50.0 + 100 * index) for index in range(20)]
+    for job in interactive:
+        queue.put(job, {})
+
+    order = drain(queue)
+    offset = queue.priority_offsets[PRIORITY_BATCH]
+    assert order.index(batch) == sum(1 for job in interactive if job.created_at < offset)
+
+
+def test_shortest_job_first_within_class():
+    queue = make_queue(shortest_job_first=True)
+    jobs = [make_job("a", cost=cost, created_at=0.0) for cost in (300.0, 30.0, 120.0)]
+    for job in jobs:
+        queue.put(job, {})
+
+    assert [job.cost for job in drain(queue)] == [30.0, 120.0, 300.0]
+
+    # 未开启时按入队顺序
+    queue = make_queue()
+    for job in jobs:
+        queue.put(job, {})
+    assert drain(queue) == jobs
+
+
+def test_queued_jobs_matches_pop_order():
+    weights = {"a": 2.0, "b": 1.0, "c": 0.5}
+    queue = make_queue(shortest_job_first=True, weight_of=weights.__getitem__)
+    rng = random.Random(7)
+    priorities = (PRIORITY_INTERACTIVE, PRIORITY_ASYNC, PRIORITY_BATCH)
+    for index in range(60):
+        job = make_job(rng.choice("abc"), rng.choice(priorities), rng.uniform(10.0, 600.0), created_at=index * 5.0)
+        queue.put(job, {})
+    # 部分任务出队后再预估：租户的虚拟时间已不相同
+    for _ in range(7):
+        queue._pop(BACKEND)
+
+    expected = queue.queued_jobs(BACKEND)
+    assert drain(queue) == expected
+
+
+def gpu_share(jobs: List[Job]) -> Dict[str, float]:
+    totals: Dict[str, float] = {}
+    for job in jobs:
+        totals[job.tenant] = totals.get(job.tenant, 0.0) + job.cost
+    return totals
+
+
+def test_weighted_share_by_gpu_time():
+    weights = {"a": 2.0, "b": 1.0}
+    queue = make_queue(weight_of=weights.__getitem__)
+    for index in range(30):
+        queue.put(make_job("a", cost=10.0, created_at=index), {})
+        queue.put(make_job("b", cost=10.0, created_at=index), {})
+
+    # 两个租户都有任务排队时，权重 2 的租户分到 2/3 的 GPU 时间
+    assert gpu_share(drain(queue)[:30]) == {"a": 200.0, "b": 100.0}
+
+
+def test_share_counts_gpu_time_not_jobs():
+    queue = make_queue()
+    for index in range(30):
+        queue.put(make_job("a", cost=40.0, created_at=index), {})
+        queue.put(make_job("b", cost=10.0, created_at=index), {})
+
+    # 权重相同：GPU 时间相同，短任务的租户出队的任务数多 4 倍
+    first = drain(queue)[:25]
+    assert [job.tenant for job in first].count("b") == 4 * [job.tenant for job in first].count("a")
+    assert gpu_share(first) == {"a": 200.0, "b": 200.0}
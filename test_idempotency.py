@@ -0,0 +1,43 @@
+"""
+幂等键存储测试（不需要 ComfyUI）
+
+运行: python -m pytest test_idempotency.py
+"""
+
+import asyncio
+
+from idempotency import IdempotencyStore
+
+
+def test_full_store_keeps_inflight_keys():
+    """容量已满时淘汰完成的键，进行中的键保留，重试等待第一次提交的结果"""
+
+    async def run():
+        store = IdempotencyStore(max_keys=2)
+        assert await store.claim("t", "inflight", "fp") is None
+        for key in ("a", "b", "c"):
+            assert await store.claim("t", key, key) is None
+            await store.complete("t", key, f"prompt-{key}")
+
+        assert len(store) == 2
+        assert await store.claim("t", "c", "c") == "prompt-c"
+
+        retry = asyncio.ensure_future(store.claim("t", "inflight", "fp"))
+        await asyncio.sleep(0)
+        assert not retry.done()
+        await store.complete("t", "inflight", "prompt-inflight")
+        assert await retry == "prompt-inflight"
+
+    asyncio.run(run())
+
+
+def test_expired_keys_are_pruned():
+    async def run():
+        store = IdempotencyStore(ttl=0.0)
+        assert await store.claim("t", "a", "a") is None
+        await store.complete("t", "a", "prompt-a")
+        await asyncio.sleep(0.01)
+        assert await store.claim("t", "b", "b") is None
+        assert len(store) == 1
+
+    asyncio.run(run())
@@ -0,0 +1,78 @@
+"""
+任务历史查询测试（不需要 ComfyUI）
+
+运行: python -m pytest test_job_store.py
+"""
+
+from job_store import JobStore
+from job_tracker import STATUS_QUEUED, STATUS_RUNNING, Job
+
+
+def make_job(index: int) -> Job:
+    job = Job(prompt_id=f"p{index}", template="wan22_i2v", backend="default", params={}, tenant="acme")
+    job.status = STATUS_QUEUED
+    job.created_at = 1700000000.0 + index
+    return job
+
+
+def list_all(store: JobStore, status: str, page_size: int):
+    """按网关 list_jobs 的方式逐页读取（多取一条判断是否还有下一页）"""
+    pages = []
+    before = None
+    while True:
+        records = store.query(tenant="acme", status=status, before=before, limit=page_size + 1)
+        page = records[:page_size]
+        pages.append([record["prompt_id"] for record in page])
+        if len(records) <= page_size:
+            return pages
+        before = (page[-1]["created_at"], page[-1]["prompt_id"])
+
+
+def test_buffered_status_change_does_not_end_listing(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    store.open()
+    jobs = [make_job(index) for index in range(5)]
+    for job in jobs:
+        store.put(job)
+    # close 会写入全部状态；之后的状态变更留在内存中尚未写入
+    store.close()
+
+    jobs[3].status = STATUS_RUNNING
+    store.put(jobs[3])
+
+    assert list_all(store, STATUS_QUEUED, 2) == [["p4", "p2"], ["p1", "p0"]]
+    assert list_all(store, STATUS_RUNNING, 2) == [["p3"]]
+
+
+def test_buffered_new_jobs_are_listed(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    store.open()
+    store.close()
+    for index in range(3):
+        store.put(make_job(index))
+
+    assert list_all(store, STATUS_QUEUED, 2) == [["p2", "p1"], ["p0"]]
+
+
+def test_released_details_are_kept(tmp_path):
+    store = JobStore(tmp_path / "jobs.db")
+    store.open()
+    job = make_job(0)
+    job.params = {"prompt": "猫"}
+    job.node_timings = {"57": 1.5}
+    store.put(job)
+    # 任务结束后跟踪器释放参数和节点耗时，之后的更新（如后处理预览）不覆盖已记录的值
+    job.params = None
+    job.node_timings = None
+    job.previews = [{"kind": "thumbnail"}]
+    store.put(job)
+    store.close()
+    store.open()
+    job.previews = []
+    store.put(job)
+    store.close()
+
+    record = store.get("p0")
+    assert record["params"] == {"prompt": "猫"}
+    assert record["node_timings"] == {"57": 1.5}
+    assert record["previews"] == []
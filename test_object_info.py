@@ -0,0 +1,57 @@
+"""
+本地工作流校验测试（不需要 ComfyUI）
+
+运行: python -m pytest test_object_info.py
+"""
+
+from object_info import BackendSchema
+
+OBJECT_INFO = {
+    "LoadImage": {
+        "input": {"required": {"image": [["cat.png", "dog.png"], {"image_upload": True}]}},
+        "output": ["IMAGE", "MASK"],
+    },
+    # 新版本 ComfyUI 的枚举格式，且没有 image_upload 标记：按节点类型识别
+    "LoadImageMask": {
+        "input": {"required": {
+            "image": ["COMBO", {"options": ["cat.png"]}],
+            "channel": [["alpha", "red", "green", "blue"]],
+        }},
+        "output": ["MASK"],
+    },
+    "KSamplerSelect": {
+        "input": {"required": {"sampler_name": [["euler", "dpmpp_2m"]]}},
+        "output": ["SAMPLER"],
+    },
+}
+
+
+def test_uploaded_filename_not_in_cached_options():
+    """获取节点定义之后上传的图片不应被拒绝"""
+    schema = BackendSchema(OBJECT_INFO)
+    workflow = {
+        "1": {"class_type": "LoadImage", "inputs": {"image": "up_5f1c2a9e.jpg"}},
+        "2": {"class_type": "LoadImageMask", "inputs": {"image": "up_5f1c2a9e.jpg", "channel": "alpha"}},
+    }
+    assert schema.validate(workflow, {("1", "image"): "image_filename"}) == []
+
+
+def test_upload_input_still_requires_string():
+    schema = BackendSchema(OBJECT_INFO)
+    workflow = {"1": {"class_type": "LoadImage", "inputs": {"image": 42}}}
+    errors = schema.validate(workflow, {("1", "image"): "image_filename"})
+    assert len(errors) == 1 and errors[0].startswith("参数 image_filename")
+
+
+def test_other_inputs_of_upload_nodes_still_checked():
+    schema = BackendSchema(OBJECT_INFO)
+    workflow = {"2": {"class_type": "LoadImageMask", "inputs": {"image": "x.png", "channel": "bogus"}}}
+    errors = schema.validate(workflow, {("2", "channel"): "channel"})
+    assert len(errors) == 1 and "不在可选范围内" in errors[0]
+
+
+def test_other_enums_still_checked():
+    schema = BackendSchema(OBJECT_INFO)
+    workflow = {"1": {"class_type": "KSamplerSelect", "inputs": {"sampler_name": "nope"}}}
+    errors = schema.validate(workflow, {("1", "sampler_name"): "sampler"})
+    assert len(errors) == 1 and "不在可选范围内" in errors[0]
@@ -0,0 +1,116 @@
+"""
+输出后处理测试（不需要 ComfyUI 和 GPU）
+用合成的图片和视频生成预览；缺少 Pillow 或 ffmpeg 时跳过对应的测试
+
+运行: python -m pytest test_postprocess.py
+指定 ffmpeg: FFMPEG=/path/to/ffmpeg python -m pytest test_postprocess.py
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from postprocess import (
+    PREVIEW_ANIMATED,
+    PREVIEW_POSTER,
+    PREVIEW_THUMBNAIL,
+    PREVIEW_VIDEO,
+    preview_kinds,
+    render_animated_preview,
+    render_poster,
+    render_thumbnail,
+    render_video_preview,
+)
+from workflow_registry import IMAGE2VIDEO, QWEN_IMAGE, WAN22_I2V
+
+FFMPEG = shutil.which(os.environ.get("FFMPEG", "ffmpeg"))
+requires_ffmpeg = pytest.mark.skipif(FFMPEG is None, reason="未安装 ffmpeg")
+
+
+def history_outputs(template, files):
+    """按模板的输出节点构造 ComfyUI 历史记录中的 outputs：{class_type: (key, 输出条目)}"""
+    outputs = {}
+    for node_id, specs in template.output_map.nodes.items():
+        for spec in specs:
+            if spec.class_type in files and files[spec.class_type][0] == spec.key:
+                outputs.setdefault(node_id, {})[spec.key] = [files[spec.class_type][1]]
+    return outputs
+
+
+def extracted_kinds(template, files):
+    outputs = template.extract_outputs(history_outputs(template, files), lambda *args: "")
+    return {output["filename"]: preview_kinds(output) for output in outputs}
+
+
+def test_preview_kinds_for_template_outputs():
+    assert extracted_kinds(QWEN_IMAGE, {
+        "SaveImage": ("images", {"filename": "qwen_00001_.png", "subfolder": "", "type": "output"}),
+    }) == {"qwen_00001_.png": (PREVIEW_THUMBNAIL,)}
+
+    assert extracted_kinds(IMAGE2VIDEO, {
+        "SaveAnimatedWEBP": ("images", {"filename": "i2v_00001_.webp", "subfolder": "", "type": "output"}),
+        "SaveWEBM": ("images", {"filename": "i2v_00001_.webm", "subfolder": "", "type": "output"}),
+    }) == {
+        "i2v_00001_.webp": (PREVIEW_ANIMATED,),
+        "i2v_00001_.webm": (PREVIEW_POSTER, PREVIEW_VIDEO),
+    }
+
+    assert extracted_kinds(WAN22_I2V, {
+        "VHS_VideoCombine": ("gifs", {
+            "filename": "wan22_00001.mp4", "subfolder": "video", "type": "output", "format": "video/h264-mp4"
+        }),
+    }) == {"wan22_00001.mp4": (PREVIEW_POSTER, PREVIEW_VIDEO)}
+
+
+def test_render_thumbnail(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    source = tmp_path / "source.png"
+    Image.new("RGBA", (1024, 512), (200, 30, 30, 128)).save(source)
+
+    target = render_thumbnail(str(source), str(tmp_path / "source.png.thumb.jpg"), 320)
+    with Image.open(target) as thumbnail:
+        assert thumbnail.format == "JPEG"
+        assert thumbnail.size == (320, 160)
+
+
+def test_render_animated_preview(tmp_path):
+    Image = pytest.importorskip("PIL.Image")
+    source = tmp_path / "source.webp"
+    # 各帧颜色不同、时长不同（相同的帧会被编码器合并）
+    frames = [Image.new("RGB", (640, 640), (index * 20 % 256, index * 7 % 256, 0)) for index in range(100)]
+    durations = [40 + index % 3 * 10 for index in range(100)]
+    frames[0].save(source, "WEBP", save_all=True, append_images=frames[1:], duration=durations, loop=0, lossless=True)
+
+    target = render_animated_preview(str(source), str(tmp_path / "source.webp.preview.webp"), 160, max_frames=48)
+    with Image.open(target) as preview:
+        assert preview.size == (160, 160)
+        assert 1 < preview.n_frames <= 48
+        total = 0
+        for index in range(preview.n_frames):
+            preview.seek(index)
+            preview.load()
+            total += preview.info["duration"]
+    # 抽帧后总时长不变
+    assert total == sum(durations)
+
+
+@requires_ffmpeg
+def test_render_video_previews(tmp_path):
+    source = tmp_path / "source.mp4"
+    subprocess.run(
+        [FFMPEG, "-hide_banner", "-loglevel", "error", "-f", "lavfi", "-i", "testsrc=size=640x360:rate=16:duration=2",
+         "-pix_fmt", "yuv420p", str(source)],
+        check=True, capture_output=True
+    )
+
+    poster = render_poster(FFMPEG, str(source), str(tmp_path / "source.mp4.poster.jpg"), 320)
+    with open(poster, "rb") as f:
+        assert f.read(2) == b"\xff\xd8"
+
+    preview = render_video_preview(FFMPEG, str(source), str(tmp_path / "source.mp4.preview.mp4"), 320, "100k")
+    with open(preview, "rb") as f:
+        data = f.read()
+    # faststart：moov 在 mdat 之前，可以边下边播
+    assert 0 <= data.find(b"moov") < data.find(b"mdat")
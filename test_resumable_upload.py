@@ -0,0 +1,162 @@
+"""
+分块上传测试（不需要 ComfyUI）
+直接调用 ResumableUploads，并通过 ASGI 调用上传接口（上传到 ComfyUI 由假的网关代替）
+
+运行: python -m pytest test_resumable_upload.py
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from resumable_upload import ResumableUploads, build_upload_router
+from tracing import Tracer
+
+TENANT = "acme"
+DATA = os.urandom(10)
+
+
+def checksum(data: bytes) -> str:
+    return f"sha256 {hashlib.sha256(data).hexdigest()}"
+
+
+def status_of(call) -> HTTPException:
+    with pytest.raises(HTTPException) as excinfo:
+        call()
+    return excinfo.value
+
+
+def test_append_rejects_offset_conflicts(tmp_path):
+    uploads = ResumableUploads(tmp_path)
+    upload_id = uploads.create(TENANT, "cat.jpg", len(DATA))["upload_id"]
+
+    assert uploads.append(TENANT, upload_id, 0, DATA[:4], None)["offset"] == 4
+    # 重复发送已确认的块、跳过未发送的块：返回 409 和已接收的偏移
+    for offset in (0, 6):
+        error = status_of(lambda: uploads.append(TENANT, upload_id, offset, DATA[4:6], None))
+        assert (error.status_code, error.headers) == (409, {"Upload-Offset": "4"})
+    assert uploads.status(TENANT, upload_id)["offset"] == 4
+
+    assert status_of(lambda: uploads.append(TENANT, upload_id, 4, DATA[4:] + b"x", None)).status_code == 413
+    assert uploads.append(TENANT, upload_id, 4, DATA[4:], None)["offset"] == len(DATA)
+    # 其他租户看不到该上传
+    assert status_of(lambda: uploads.status("other", upload_id)).status_code == 404
+
+
+def test_append_verifies_chunk_checksum(tmp_path):
+    uploads = ResumableUploads(tmp_path)
+    upload_id = uploads.create(TENANT, "cat.jpg", len(DATA))["upload_id"]
+
+    assert status_of(lambda: uploads.append(TENANT, upload_id, 0, DATA[:4], "md5 abc")).status_code == 400
+    assert status_of(lambda: uploads.append(TENANT, upload_id, 0, DATA[:4], checksum(DATA[4:8]))).status_code == 422
+    # 摘要不匹配的块不写入
+    assert uploads.status(TENANT, upload_id)["offset"] == 0
+    # 十六进制摘要不区分大小写
+    upper = f"sha256 {hashlib.sha256(DATA[:4]).hexdigest().upper()}"
+    assert uploads.append(TENANT, upload_id, 0, DATA[:4], upper)["offset"] == 4
+
+
+def test_expired_uploads_are_removed(tmp_path):
+    uploads = ResumableUploads(tmp_path, ttl=60.0)
+    upload_id = uploads.create(TENANT, "cat.jpg", len(DATA))["upload_id"]
+    meta_path = tmp_path / f"{upload_id}.json"
+    meta = json.loads(meta_path.read_text(encoding="utf-8"))
+    meta["updated_at"] = time.time() - 120
+    meta_path.write_text(json.dumps(meta), encoding="utf-8")
+
+    assert status_of(lambda: uploads.status(TENANT, upload_id)).status_code == 404
+    assert list(tmp_path.iterdir()) == []
+
+    # 没有人再访问的上传由 prune 按文件修改时间清理
+    upload_id = uploads.create(TENANT, "cat.jpg", len(DATA))["upload_id"]
+    assert uploads.prune(now=time.time() + 30) == 0
+    assert uploads.prune(now=time.time() + 120) == 1
+    assert not (tmp_path / f"{upload_id}.part").exists()
+
+
+def test_finish_checks_size_and_digest(tmp_path):
+    uploads = ResumableUploads(tmp_path)
+    upload_id = uploads.create(TENANT, "cat.jpg", len(DATA), "0" * 64)["upload_id"]
+    uploads.append(TENANT, upload_id, 0, DATA[:4], None)
+
+    error = status_of(lambda: uploads.finish(TENANT, upload_id))
+    assert (error.status_code, error.headers) == (409, {"Upload-Offset": "4"})
+
+    uploads.append(TENANT, upload_id, 4, DATA[4:], None)
+    assert status_of(lambda: uploads.finish(TENANT, upload_id)).status_code == 422
+    # 摘要不匹配时丢弃已接收的数据
+    assert status_of(lambda: uploads.status(TENANT, upload_id)).status_code == 404
+
+    upload_id = uploads.create(TENANT, "cat.jpg", len(DATA), hashlib.sha256(DATA).hexdigest())["upload_id"]
+    uploads.append(TENANT, upload_id, 0, DATA, None)
+    meta = uploads.finish(TENANT, upload_id)
+    assert meta["sha256"] == hashlib.sha256(DATA).hexdigest()
+    assert status_of(lambda: uploads.resolve(TENANT, upload_id)).status_code == 409
+
+    completed = uploads.mark_completed(upload_id, meta["sha256"], "cat_1.jpg")
+    assert (completed["completed"], completed["offset"], completed["image_filename"]) == (True, len(DATA), "cat_1.jpg")
+    assert uploads.resolve(TENANT, upload_id)["image_filename"] == "cat_1.jpg"
+    assert not (tmp_path / f"{upload_id}.part").exists()
+    assert status_of(lambda: uploads.append(TENANT, upload_id, len(DATA), b"x", None)).status_code == 409
+
+
+class FakeGateway:
+    """上传接口用到的网关方法：上传到 ComfyUI 时等待一会儿，记录上传次数"""
+
+    def __init__(self, directory):
+        self.resumable_uploads = ResumableUploads(directory)
+        self.tracer = Tracer()
+        self.uploaded = []
+
+    async def identify(self, request) -> str:
+        return TENANT
+
+    async def upload_image(self, content: bytes, filename: str) -> str:
+        await asyncio.sleep(0.1)
+        self.uploaded.append(content)
+        return f"{len(self.uploaded)}_{filename}"
+
+
+def run_with_client(tmp_path, test):
+    gateway = FakeGateway(tmp_path)
+    app = FastAPI()
+    app.include_router(build_upload_router(gateway))
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://gateway") as client:
+            await test(client)
+
+    asyncio.run(run())
+    return gateway
+
+
+def test_malformed_content_length_is_rejected(tmp_path):
+    async def test(client):
+        upload_id = (await client.post("/api/uploads", json={"filename": "cat.jpg", "size": len(DATA)})).json()["upload_id"]
+        response = await client.put(
+            f"/api/uploads/{upload_id}", content=DATA, headers={"Upload-Offset": "0", "Content-Length": "ten"}
+        )
+        assert response.status_code == 400
+
+    run_with_client(tmp_path, test)
+
+
+def test_concurrent_completes_upload_once(tmp_path):
+    async def test(client):
+        upload_id = (await client.post("/api/uploads", json={"filename": "cat.jpg", "size": len(DATA)})).json()["upload_id"]
+        response = await client.put(f"/api/uploads/{upload_id}", content=DATA, headers={"Upload-Offset": "0"})
+        assert response.json()["offset"] == len(DATA)
+
+        responses = await asyncio.gather(*(client.post(f"/api/uploads/{upload_id}/complete") for _ in range(3)))
+        assert [response.status_code for response in responses] == [200, 200, 200]
+        assert {response.json()["image_filename"] for response in responses} == {"1_cat.jpg"}
+
+    gateway = run_with_client(tmp_path, test)
+    assert gateway.uploaded == [DATA]
@@ -0,0 +1,38 @@
+"""
+租户限流测试（不需要 ComfyUI）
+
+运行: python -m pytest test_tenants.py
+"""
+
+import pytest
+
+from tenants import TokenBucket
+
+
+def test_token_bucket_allows_burst_then_waits():
+    bucket = TokenBucket(rate=0.5, capacity=3)
+    bucket.updated = 0.0
+
+    assert [bucket.take(now=0.0) for _ in range(3)] == [0.0, 0.0, 0.0]
+    # 令牌用完：每秒补充 0.5 个，需要等 2 秒
+    assert bucket.take(now=0.0) == pytest.approx(2.0)
+    assert bucket.take(now=1.0) == pytest.approx(1.0)
+
+
+def test_token_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(rate=2.0, capacity=3)
+    bucket.updated = 0.0
+    for _ in range(3):
+        bucket.take(now=0.0)
+
+    assert bucket.take(now=0.5) == 0.0
+    assert bucket.take(now=0.5) == pytest.approx(0.5)
+    # 空闲很久也只攒下 capacity 个令牌
+    assert [bucket.take(now=100.0) for _ in range(4)] == [0.0, 0.0, 0.0, pytest.approx(0.5)]
+
+
+def test_token_bucket_without_rate_is_unlimited():
+    bucket = TokenBucket(rate=0.0, capacity=1)
+    assert all(bucket.take(now=0.0) == 0.0 for _ in range(100))
+    # burst 小于 1 时至少允许一个请求
+    assert TokenBucket(rate=1.0, capacity=0).take() == 0.0
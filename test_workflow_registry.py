@@ -0,0 +1,106 @@
+"""
+工作流参数绑定测试（不需要 ComfyUI）
+绑定表生成的工作流与各服务原来手写的 prepare_workflow 完全一致
+
+运行: python -m pytest test_workflow_registry.py
+"""
+
+import copy
+import json
+from typing import Any, Callable, Dict
+
+import pytest
+
+from workflow_registry import IMAGE2VIDEO, QWEN_IMAGE, WAN22_I2V, WorkflowTemplate
+
+# 以下为各服务原来的 prepare_workflow（种子由调用方给出）
+
+
+def qwen_image_workflow(workflow: Dict[str, Any], request) -> Dict[str, Any]:
+    workflow["6"]["inputs"]["text"] = request.prompt
+    workflow["3"]["inputs"]["seed"] = request.seed
+    workflow["3"]["inputs"]["steps"] = request.steps
+    workflow["3"]["inputs"]["cfg"] = request.cfg
+    workflow["3"]["inputs"]["sampler_name"] = request.sampler_name
+    workflow["3"]["inputs"]["scheduler"] = request.scheduler
+    workflow["58"]["inputs"]["width"] = request.width
+    workflow["58"]["inputs"]["height"] = request.height
+    return workflow
+
+
+def image2video_workflow(workflow: Dict[str, Any], request) -> Dict[str, Any]:
+    workflow["6"]["inputs"]["text"] = request.prompt
+    workflow["52"]["inputs"]["image"] = request.image_filename
+    workflow["50"]["inputs"]["width"] = request.width
+    workflow["50"]["inputs"]["height"] = request.height
+    workflow["50"]["inputs"]["length"] = request.length
+    workflow["57"]["inputs"]["steps"] = request.steps
+    workflow["57"]["inputs"]["cfg"] = request.cfg
+    workflow["57"]["inputs"]["noise_seed"] = request.noise_seed
+    workflow["58"]["inputs"]["steps"] = request.steps
+    workflow["58"]["inputs"]["cfg"] = request.cfg
+    workflow["28"]["inputs"]["fps"] = request.fps
+    workflow["47"]["inputs"]["fps"] = float(request.fps)
+    return workflow
+
+
+def wan22_i2v_workflow(workflow: Dict[str, Any], request) -> Dict[str, Any]:
+    workflow["6"]["inputs"]["text"] = request.prompt
+    workflow["62"]["inputs"]["image"] = request.image_filename
+    workflow["77"]["inputs"]["width"] = request.width
+    workflow["77"]["inputs"]["height"] = request.height
+    workflow["63"]["inputs"]["length"] = request.length
+    for node_id in ("57", "58"):
+        workflow[node_id]["inputs"]["steps"] = request.steps
+        workflow[node_id]["inputs"]["cfg"] = request.cfg
+        workflow[node_id]["inputs"]["noise_seed"] = request.noise_seed
+    workflow["76"]["inputs"]["frame_rate"] = request.fps
+    return workflow
+
+
+CASES = [
+    (QWEN_IMAGE, qwen_image_workflow, {
+        "prompt": "雪山下的湖泊", "seed": 42, "steps": 30, "cfg": 4.0, "width": 1024, "height": 768,
+        "sampler_name": "dpmpp_2m", "scheduler": "karras",
+    }),
+    (IMAGE2VIDEO, image2video_workflow, {
+        "image_filename": "cat.jpg", "prompt": "猫在草地上奔跑", "width": 640, "height": 832, "length": 49,
+        "steps": 20, "cfg": 5.0, "noise_seed": 1234, "fps": 24,
+    }),
+    (WAN22_I2V, wan22_i2v_workflow, {
+        "image_filename": "dog.png", "prompt": "狗在海边", "width": 960, "height": 544, "length": 65,
+        "steps": 6, "cfg": 1.5, "noise_seed": 987654321, "fps": 20,
+    }),
+]
+
+
+@pytest.mark.parametrize("template, baseline, fields", CASES, ids=[case[0].name for case in CASES])
+def test_binding_table_matches_baseline(template: WorkflowTemplate, baseline: Callable, fields: Dict[str, Any]):
+    original = copy.deepcopy(template.load())
+    request = template.request_model(**fields)
+
+    workflow = template.prepare(template.resolve_params(request))
+
+    assert workflow == baseline(copy.deepcopy(original), request)
+    # 与原来一样序列化（float / int 不变）
+    assert json.dumps(workflow, sort_keys=True) == json.dumps(baseline(copy.deepcopy(original), request), sort_keys=True)
+    # 未绑定的节点与模板共享，模板本身不被修改
+    assert template.load() == original
+
+
+def test_seed_bindings():
+    original = IMAGE2VIDEO.load()
+    params = IMAGE2VIDEO.resolve_params(IMAGE2VIDEO.request_model(image_filename="cat.jpg", prompt="猫"))
+    workflow = IMAGE2VIDEO.prepare(params)
+    # i2v 只有第一阶段采样器使用请求的种子，第二阶段保持模板中的值
+    assert workflow["57"]["inputs"]["noise_seed"] == params["noise_seed"]
+    assert workflow["58"]["inputs"]["noise_seed"] == original["58"]["inputs"]["noise_seed"]
+    # 节点 47 - SaveWEBM 的帧率是浮点数，节点 28 - SaveAnimatedWEBP 是整数
+    assert type(workflow["47"]["inputs"]["fps"]) is float
+    assert type(workflow["28"]["inputs"]["fps"]) is int
+
+    params = WAN22_I2V.resolve_params(WAN22_I2V.request_model(image_filename="dog.png", prompt="狗"))
+    workflow = WAN22_I2V.prepare(params)
+    # wan22 两阶段采样器共用同一个（自动生成的）种子
+    assert params["noise_seed"]
+    assert workflow["57"]["inputs"]["noise_seed"] == workflow["58"]["inputs"]["noise_seed"] == params["noise_seed"]
@@ -0,0 +1,321 @@
+"""
+请求轨迹录制
+将线上请求（端点、参数、图片摘要、到达时间）以 JSONL 格式追加到轨迹文件，
+供 replay_trace.py 按原始到达过程回放
+
+轨迹格式（每行一个 JSON 对象）:
+    {
+        "v": 1,                       # 格式版本
+        "service": "wan22_i2v",       # 录制该请求的服务
+        "ts": 1760000000.123,         # 到达时间（Unix 时间戳，秒）
+        "method": "POST",
+        "endpoint": "/api/upload_and_generate",
+        "query": {"timeout": "600"},  # 查询参数
+        "encoding": "multipart",      # 请求体编码：json / form / multipart / null
+        "params": {"prompt": "..."},  # JSON 请求体或表单中的非文件字段
+        "image": {                    # 上传图片（无图片时为 null）
+            "field": "image",
+            "filename": "a.jpg",
+            "content_type": "image/jpeg",
+            "size": 123456,
+            "digest": "sha256:..."
+        },
+        "truncated": false,           # 请求体超过上限时为 true（此时不含 params/image）
+        "status": 200,                # 响应状态码
+        "latency_ms": 35.2            # 服务端处理耗时
+    }
+
+事件循环上只做请求体分块的引用收集和一次入队操作，
+请求体解析、图片摘要计算和文件写入都在后台线程完成。
+"""
+
+import hashlib
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import asynccontextmanager
+from email.parser import BytesParser
+from email.policy import HTTP
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl
+
+logger = logging.getLogger(__name__)
+
+TRACE_FORMAT_VERSION = 1
+
+# 设置该环境变量即启用录制，值为轨迹文件路径
+TRACE_FILE_ENV = "COMFYUI_TRACE_FILE"
+# 可选：保存上传图片原文件的目录（按摘要去重存储，回放时使用）
+TRACE_BLOB_DIR_ENV = "COMFYUI_TRACE_BLOB_DIR"
+
+# 只录制 API 请求，文档、健康检查等不录制
+DEFAULT_PATH_PREFIXES = ("/api/",)
+# 超过该大小的请求体不再缓存，只记录元数据
+DEFAULT_MAX_BODY_BYTES = 32 * 1024 * 1024
+
+
+def image_digest(data: bytes) -> str:
+    """计算图片摘要（轨迹和回放共用同一种格式）"""
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def blob_path(blob_dir: Path, digest: str) -> Path:
+    """根据摘要定位图片原文件"""
+    return Path(blob_dir) / digest.split(":", 1)[-1]
+
+
+def _parse_multipart(content_type: str, body: bytes) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]], Optional[bytes]]:
+    """解析 multipart/form-data 请求体，返回 (表单字段, 图片元数据, 图片内容)"""
+    message = BytesParser(policy=HTTP).parsebytes(
+        b"Content-Type: " + content_type.encode("latin-1") + b"\r\n\r\n" + body
+    )
+    params: Dict[str, Any] = {}
+    image_meta = None
+    image_data = None
+
+    for part in message.iter_parts():
+        name = part.get_param("name", header="content-disposition")
+        filename = part.get_filename()
+        payload = part.get_payload(decode=True) or b""
+
+        if filename is None:
+            params[name] = payload.decode("utf-8", errors="replace")
+        elif image_meta is None:
+            image_meta = {
+                "field": name,
+                "filename": filename,
+                "content_type": part.get_content_type(),
+                "size": len(payload),
+                "digest": image_digest(payload),
+            }
+            image_data = payload
+
+    return params, image_meta, image_data
+
+
+class _RawCapture:
+    """事件循环上收集到的原始请求信息，交给后台线程处理"""
+
+    __slots__ = (
+        "ts", "method", "path", "query_string", "content_type",
+        "chunks", "truncated", "status", "latency_ms",
+    )
+
+    def __init__(self, ts: float, method: str, path: str, query_string: bytes, content_type: str):
+        self.ts = ts
+        self.method = method
+        self.path = path
+        self.query_string = query_string
+        self.content_type = content_type
+        self.chunks: List[bytes] = []
+        self.truncated = False
+        self.status = 0
+        self.latency_ms = 0.0
+
+
+class TraceWriter:
+    """后台轨迹写入线程"""
+
+    def __init__(
+        self,
+        path: Path,
+        service: str,
+        blob_dir: Optional[Path] = None,
+        max_pending: int = 10000,
+        flush_interval: float = 1.0
+    ):
+        self.path = Path(path)
+        self.service = service
+        self.blob_dir = Path(blob_dir) if blob_dir else None
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._queue: "queue.Queue[Optional[_RawCapture]]" = queue.Queue(maxsize=max_pending)
+        self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+        self._started = False
+
+    def start(self):
+        if self._started:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.blob_dir:
+            self.blob_dir.mkdir(parents=True, exist_ok=True)
+        self._thread.start()
+        self._started = True
+        logger.info(f"请求轨迹录制已启用: {self.path}")
+
+    def submit(self, capture: _RawCapture):
+        """入队（非阻塞），队列满时丢弃并计数，不影响请求处理"""
+        try:
+            self._queue.put_nowait(capture)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self, timeout: float = 5.0):
+        if not self._started:
+            return
+        self._queue.put(None)
+        self._thread.join(timeout)
+        if self.dropped:
+            logger.warning(f"轨迹队列已满，共丢弃 {self.dropped} 条记录")
+
+    def _build_record(self, capture: _RawCapture) -> Dict[str, Any]:
+        params: Dict[str, Any] = {}
+        image_meta = None
+        encoding = None
+        body = b"".join(capture.chunks)
+        content_type = capture.content_type
+
+        if body and not capture.truncated:
+            try:
+                if content_type.startswith("application/json"):
+                    encoding = "json"
+                    params = json.loads(body)
+                elif content_type.startswith("multipart/form-data"):
+                    encoding = "multipart"
+                    params, image_meta, image_data = _parse_multipart(content_type, body)
+                    if image_meta and self.blob_dir:
+                        target = blob_path(self.blob_dir, image_meta["digest"])
+                        if not target.exists():
+                            target.write_bytes(image_data)
+                elif content_type.startswith("application/x-www-form-urlencoded"):
+                    encoding = "form"
+                    params = dict(parse_qsl(body.decode("utf-8", errors="replace")))
+            except Exception as e:
+                logger.debug(f"解析请求体失败（{capture.path}）: {e}")
+
+        return {
+            "v": TRACE_FORMAT_VERSION,
+            "service": self.service,
+            "ts": round(capture.ts, 6),
+            "method": capture.method,
+            "endpoint": capture.path,
+            "query": dict(parse_qsl(capture.query_string.decode("latin-1"))),
+            "encoding": encoding,
+            "params": params,
+            "image": image_meta,
+            "truncated": capture.truncated,
+            "status": capture.status,
+            "latency_ms": round(capture.latency_ms, 3),
+        }
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            last_flush = time.monotonic()
+            while True:
+                try:
+                    capture = self._queue.get(timeout=self.flush_interval)
+                except queue.Empty:
+                    capture = False
+
+                if capture is None:
+                    break
+                if capture:
+                    try:
+                        record = self._build_record(capture)
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    except Exception as e:
+                        logger.error(f"写入轨迹记录失败: {e}")
+
+                now = time.monotonic()
+                if now - last_flush >= self.flush_interval:
+                    f.flush()
+                    last_flush = now
+            f.flush()
+
+
+class TraceCaptureMiddleware:
+    """
+    ASGI 轨迹录制中间件
+
+    透传请求体的同时保留分块引用，响应结束后将原始信息交给 TraceWriter
+    """
+
+    def __init__(
+        self,
+        app,
+        writer: TraceWriter,
+        path_prefixes: Tuple[str, ...] = DEFAULT_PATH_PREFIXES,
+        max_body_bytes: int = DEFAULT_MAX_BODY_BYTES
+    ):
+        self.app = app
+        self.writer = writer
+        self.path_prefixes = path_prefixes
+        self.max_body_bytes = max_body_bytes
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        content_type = ""
+        for key, value in scope.get("headers", []):
+            if key == b"content-type":
+                content_type = value.decode("latin-1")
+                break
+
+        capture = _RawCapture(
+            time.time(), scope["method"], scope["path"], scope.get("query_string", b""), content_type
+        )
+        start = time.perf_counter()
+        body_size = 0
+
+        async def receive_wrapper():
+            nonlocal body_size
+            message = await receive()
+            if message["type"] == "http.request" and not capture.truncated:
+                chunk = message.get("body", b"")
+                body_size += len(chunk)
+                if body_size > self.max_body_bytes:
+                    capture.truncated = True
+                    capture.chunks = []
+                elif chunk:
+                    capture.chunks.append(chunk)
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                capture.status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            capture.latency_ms = (time.perf_counter() - start) * 1000
+            self.writer.submit(capture)
+
+
+def install_trace_capture(app, service: str) -> Optional[TraceWriter]:
+    """
+    按环境变量为 FastAPI 应用安装轨迹录制中间件
+
+    未设置 COMFYUI_TRACE_FILE 时不做任何事情
+    """
+    trace_file = os.environ.get(TRACE_FILE_ENV)
+    if not trace_file:
+        return None
+
+    writer = TraceWriter(
+        path=Path(trace_file),
+        service=service,
+        blob_dir=os.environ.get(TRACE_BLOB_DIR_ENV) or None
+    )
+    app.add_middleware(TraceCaptureMiddleware, writer=writer)
+
+    # 包裹应用已有的 lifespan：应用改用 lifespan 后，startup / shutdown 事件处理器不会再被调用
+    previous = app.router.lifespan_context
+
+    @asynccontextmanager
+    async def lifespan(app):
+        writer.start()
+        try:
+            async with previous(app) as state:
+                yield state
+        finally:
+            writer.close()
+
+    app.router.lifespan_context = lifespan
+    return writer
@@ -0,0 +1,457 @@
+"""
+分布式追踪
+OpenTelemetry 风格的 span（不依赖 opentelemetry SDK），覆盖一次生成请求的各个阶段：
+
+    POST /wan22/api/upload_and_generate_sync      HTTP 请求（根 span）
+    ├── upload                                    上传图片到 ComfyUI
+    ├── submit                                    校验、准入、放入本地队列
+    └── job                                       任务从登记到结束
+        ├── queue.local                           网关本地排队
+        ├── comfyui.submit                        POST /prompt
+        ├── comfyui.queue                         ComfyUI 队列中等待
+        ├── execute                               执行
+        │   └── node 12 KSampler ...              每个节点一个 span（来自 WebSocket executing 事件）
+        └── fetch_outputs                         读取 /history 中的输出
+
+导出格式与 OTLP/HTTP JSON（/v1/traces 的请求体）相同：写入本地文件（每批一行），或直接发送到 collector。
+sample_rate 为 0 时 span() 返回共享的空 span，不生成 ID、不记录时间
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from offload import json_dumps
+
+logger = logging.getLogger(__name__)
+
+TRACEPARENT_HEADER = b"traceparent"
+SCOPE_NAME = "comfyui-flows-gateway"
+
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+def _new_id(nbytes: int) -> str:
+    return os.urandom(nbytes).hex()
+
+
+class Span:
+    """一个已采样的 span"""
+
+    __slots__ = ("tracer", "trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error")
+
+    sampled = True
+
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: Optional[str],
+        attributes: Optional[Dict[str, Any]] = None,
+        start: Optional[float] = None
+    ):
+        self.tracer = tracer
+        self.trace_id = trace_id
+        self.span_id = _new_id(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = int((start if start is not None else time.time()) * 1e9)
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_error(self, error: Any):
+        self.error = str(error) or type(error).__name__
+
+    def end(self, end: Optional[float] = None):
+        if self.end_ns is not None:
+            return
+        self.end_ns = int((end if end is not None else time.time()) * 1e9)
+        self.tracer.export(self)
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attribute(key, value) for key, value in self.attributes.items() if value is not None],
+            "status": {"code": 2, "message": self.error} if self.error is not None else {"code": 1},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NoopSpan:
+    """未采样时使用的空 span"""
+
+    __slots__ = ()
+
+    sampled = False
+    traceparent = None
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_error(self, error: Any):
+        pass
+
+    def end(self, end: Optional[float] = None):
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class _RemoteParent:
+    """来自其它进程（traceparent 请求头或进程间请求）的父 span"""
+
+    __slots__ = ("trace_id", "span_id")
+
+    sampled = True
+
+    def __init__(self, trace_id: str, span_id: str):
+        self.trace_id = trace_id
+        self.span_id = span_id
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+
+def parse_traceparent(value: Optional[str]) -> Optional[_RemoteParent]:
+    """解析 W3C traceparent（只接受已采样的上下文）"""
+    if not value:
+        return None
+    parts = value.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = int(parts[3], 16) & 1
+    except ValueError:
+        return None
+    return _RemoteParent(parts[1], parts[2]) if sampled else None
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+class SpanExporter:
+    """
+    批量导出：span 结束时放入缓冲区，后台线程每 flush_interval 秒导出一次
+
+    path 不为空时追加写入本地文件（每批一行 OTLP JSON），endpoint 不为空时 POST 到 collector
+    """
+
+    def __init__(
+        self,
+        service: str,
+        path: Optional[Path] = None,
+        endpoint: Optional[str] = None,
+        flush_interval: float = 1.0,
+        max_buffer: int = 10000
+    ):
+        self.service = service
+        self.path = Path(path) if path else None
+        self.endpoint = endpoint or None
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.dropped = 0
+        self._buffer: List[Span] = []
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._http: Optional[httpx.Client] = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.endpoint is not None:
+            self._http = httpx.Client(timeout=10.0, proxies={})
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._export_loop, name="span-exporter", daemon=True)
+        self._thread.start()
+
+    def close(self):
+        """停止后台线程并导出剩余的 span（阻塞，在线程池中调用）"""
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+        self.flush()
+        if self._http is not None:
+            self._http.close()
+            self._http = None
+
+    def add(self, span: Span):
+        with self._lock:
+            if len(self._buffer) >= self.max_buffer:
+                self.dropped += 1
+                return
+            self._buffer.append(span)
+
+    def _export_loop(self):
+        while not self._stopped.wait(self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            spans, self._buffer = self._buffer, []
+        if not spans:
+            return
+        payload = json_dumps({
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    _otlp_attribute("service.name", self.service),
+                    _otlp_attribute("process.pid", os.getpid()),
+                ]},
+                "scopeSpans": [{"scope": {"name": SCOPE_NAME}, "spans": [span.to_otlp() for span in spans]}],
+            }]
+        })
+        try:
+            if self.path is not None:
+                # 每批一次 write，多进程追加同一文件时行不会交错
+                with open(self.path, "ab") as f:
+                    f.write(payload + b"\n")
+            if self._http is not None:
+                self._http.post(self.endpoint, content=payload, headers={"Content-Type": "application/json"})
+        except (OSError, httpx.HTTPError) as e:
+            logger.error(f"导出追踪数据失败: {e}")
+
+
+class Tracer:
+    """span 的创建与采样（采样在根 span 决定，子 span 跟随父 span）"""
+
+    def __init__(self, exporter: Optional[SpanExporter] = None, sample_rate: float = 0.0):
+        self.exporter = exporter
+        self.sample_rate = min(max(sample_rate, 0.0), 1.0)
+        self.enabled = exporter is not None and self.sample_rate > 0
+
+    @classmethod
+    def from_config(cls, config, service: str = "gateway") -> "Tracer":
+        if config.trace_sample_rate <= 0 or not (config.trace_file or config.trace_endpoint):
+            return cls()
+        exporter = SpanExporter(service, path=config.trace_file, endpoint=config.trace_endpoint)
+        return cls(exporter, config.trace_sample_rate)
+
+    def start(self):
+        if self.exporter is not None:
+            self.exporter.start()
+
+    async def stop(self):
+        if self.exporter is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self.exporter.close)
+
+    def export(self, span: Span):
+        if self.exporter is not None:
+            self.exporter.add(span)
+
+    @staticmethod
+    def current() -> Any:
+        return _current.get()
+
+    def start_span(
+        self,
+        name: str,
+        parent: Any = None,
+        attributes: Optional[Dict[str, Any]] = None,
+        start: Optional[float] = None,
+        root: bool = False
+    ) -> Any:
+        """
+        创建 span；parent 为空时使用当前上下文中的 span
+
+        没有父 span 时只有 root=True（请求入口）才按 sample_rate 采样，其它位置不会凭空产生新的 trace
+        """
+        if not self.enabled:
+            return NOOP_SPAN
+        if parent is None:
+            parent = _current.get()
+        if parent is None:
+            if not root or random.random() >= self.sample_rate:
+                return NOOP_SPAN
+            return Span(self, name, _new_id(16), None, attributes, start)
+        if not parent.sampled:
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, attributes, start)
+
+    def record(self, name: str, parent: Any, start: float, end: float, attributes: Optional[Dict[str, Any]] = None):
+        """记录一个已经结束的阶段（如本地排队时间）"""
+        if parent is not None and parent.sampled:
+            Span(self, name, parent.trace_id, parent.span_id, attributes, start).end(end)
+
+    def span(self, name: str, parent: Any = None, **attributes) -> Any:
+        """with tracer.span("upload", template=...) as span: ...（进入时设为当前 span）"""
+        if not self.enabled:
+            return NOOP_SPAN
+        return _SpanScope(self, name, parent, attributes)
+
+
+class _SpanScope:
+    __slots__ = ("tracer", "name", "parent", "attributes", "span", "token")
+
+    def __init__(self, tracer: Tracer, name: str, parent: Any, attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.span: Any = NOOP_SPAN
+        self.token = None
+
+    def __enter__(self) -> Any:
+        self.span = self.tracer.start_span(self.name, self.parent, self.attributes)
+        if self.span.sampled:
+            self.token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.token is not None:
+            _current.reset(self.token)
+        if exc is not None and _is_error(exc):
+            self.span.record_error(exc)
+        self.span.end()
+        return False
+
+
+def _is_error(exc: BaseException) -> bool:
+    # 4xx 是调用方的问题，不标记为错误
+    status_code = getattr(exc, "status_code", None)
+    return not isinstance(exc, asyncio.CancelledError) and (status_code is None or status_code >= 500)
+
+
+def use_parent(parent: Any) -> Optional[contextvars.Token]:
+    """把其它进程传来的父 span 设为当前上下文（返回值交给 reset_parent）"""
+    return _current.set(parent) if parent is not None else None
+
+
+def reset_parent(token: Optional[contextvars.Token]):
+    if token is not None:
+        _current.reset(token)
+
+
+class JobTrace:
+    """一个任务在后台各阶段的 span（任务结束时全部结束）"""
+
+    __slots__ = ("job", "execute", "node", "node_id")
+
+    def __init__(self, job: Span):
+        self.job = job
+        self.execute: Any = None
+        self.node: Any = None
+        self.node_id: Optional[str] = None
+
+    def start_node(self, tracer: Tracer, node_id: str, class_type: Optional[str]):
+        self.end_node()
+        parent = self.execute or self.job
+        label = f"node {node_id} {class_type}" if class_type else f"node {node_id}"
+        self.node = tracer.start_span(label, parent, {"comfyui.node_id": node_id, "comfyui.class_type": class_type})
+        self.node_id = node_id
+
+    def end_node(self, cached: bool = False):
+        if self.node is not None:
+            if cached:
+                self.node.set_attribute("comfyui.cached", True)
+            self.node.end()
+            self.node = None
+            self.node_id = None
+
+    def finish(self, status: str, error: Optional[str] = None):
+        self.end_node()
+        for span in (self.execute, self.job):
+            if span is None:
+                continue
+            if error is not None:
+                span.record_error(error)
+            span.set_attribute("job.status", status)
+            span.end()
+
+
+class TracingMiddleware:
+    """ASGI 中间件：每个 HTTP 请求一个根 span，沿用请求头中的 traceparent"""
+
+    def __init__(self, app, tracer: Tracer):
+        self.app = app
+        self.tracer = tracer
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        parent = parse_traceparent(_header(scope, TRACEPARENT_HEADER))
+        span = self.tracer.start_span(
+            f"{scope['method']} {scope['path']}",
+            parent,
+            {"http.method": scope["method"], "http.target": scope["path"]},
+            root=True
+        )
+        if not span.sampled:
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                span.set_attribute("http.status_code", message["status"])
+                if message["status"] >= 500:
+                    span.record_error(f"HTTP {message['status']}")
+            await send(message)
+
+        token = _current.set(span)
+        try:
+            await self.app(scope, receive, send_with_status)
+        except Exception as e:
+            span.record_error(e)
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+
+
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers") or ():
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def install_tracing(app, tracer: Tracer):
+    """为 FastAPI 应用安装追踪中间件（未启用时不安装，请求路径上没有任何开销）"""
+    if tracer.enabled:
+        app.add_middleware(TracingMiddleware, tracer=tracer)
@@ -0,0 +1,69 @@
+"""
+上传图片缓存
+按内容摘要记录已上传到各后端的图片，重复上传同一张图片时直接复用文件名
+"""
+
+import asyncio
+import logging
+from collections import OrderedDict
+from pathlib import PurePosixPath
+from typing import Dict, Tuple
+
+from comfyui_client import ComfyUIClient
+from offload import sha256_hexdigest
+
+logger = logging.getLogger(__name__)
+
+
+class UploadCache:
+    """(后端, 图片摘要) -> ComfyUI 文件名 的 LRU 缓存"""
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        # 同一图片的并发上传只执行一次
+        self._inflight: Dict[Tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def content_filename(digest: str, filename: str) -> str:
+        """以内容摘要命名上传文件，相同图片在 ComfyUI 上只保存一份"""
+        suffix = PurePosixPath(filename or "").suffix.lower() or ".jpg"
+        return f"{digest[:24]}{suffix}"
+
+    async def upload(self, client: ComfyUIClient, file_content: bytes, filename: str) -> str:
+        # 大图片的摘要在线程池中计算（hashlib 处理大数据时释放 GIL）
+        digest = await sha256_hexdigest(file_content)
+        key = (client.name, digest)
+
+        cached = self._entries.get(key)
+        if cached is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            logger.info(f"图片已在 ComfyUI 上，跳过上传: {cached}")
+            return cached
+
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            self.hits += 1
+            return await asyncio.shield(inflight)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            uploaded = await client.upload_image(file_content, self.content_filename(digest, filename))
+            logger.info(f"图片上传成功: {uploaded}")
+            self._entries[key] = uploaded
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            future.set_result(uploaded)
+            return uploaded
+        except BaseException as e:
+            future.set_exception(e)
+            # 避免无人等待时出现 "exception was never retrieved" 警告
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
@@ -0,0 +1,538 @@
+"""
+多进程部署
+主进程独占 ComfyUI WebSocket、任务跟踪器、调度队列和任务历史；多个 HTTP 工作进程共享监听端口，
+通过本地 Unix 套接字把鉴权、提交、状态查询和同步等待转发给主进程，
+因此请求落到任意工作进程，状态查询和同步接口的结果都一致
+
+协议：每行一个 JSON 消息
+- 请求: {"id": 1, "op": "get_status", "args": {...}}
+- 响应: {"id": 1, "result": ...} 或 {"id": 1, "error": {"status_code": 404, "detail": "...", "headers": null}}
+同一连接上的请求并发处理，按 id 匹配响应
+"""
+
+import asyncio
+import itertools
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from fastapi import HTTPException, Request
+from pydantic import BaseModel
+
+from comfyui_client import ComfyUIClient
+from drain import DrainGate
+from gateway import (
+    DEFAULT_BACKEND,
+    Gateway,
+    _SharedSignalServer,
+    create_gateway_app,
+    create_server,
+    create_service_app,
+    resolve_priority,
+)
+from gateway_config import GatewayConfig
+from job_tracker import DEFAULT_TENANT, PRIORITY_ASYNC
+from loop_monitor import LoopMonitor, sample_stacks
+from offload import default_pool as offload_pool
+from postprocess import artifact_file
+from prompt_enhance import MoonshotEnhancer
+from resumable_upload import ResumableUploads
+from tenants import request_api_key
+from tracing import Tracer, parse_traceparent, reset_parent, use_parent
+from upload_cache import UploadCache
+from workflow_registry import WorkflowRegistry, build_default_registry
+
+logger = logging.getLogger(__name__)
+
+# 单条消息上限（批量状态查询和任务列表的响应可能较大）
+MAX_MESSAGE_BYTES = 64 * 1024 * 1024
+# 工作进程异常退出后重新启动前的等待时间（秒）
+RESPAWN_DELAY = 1.0
+
+
+def _encode(message: Dict[str, Any]) -> bytes:
+    return (json.dumps(message, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+class IpcServer:
+    """主进程：接收工作进程的请求并调用 Gateway"""
+
+    def __init__(self, gateway: Gateway, path: Path):
+        self.gateway = gateway
+        self.path = Path(path)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._tasks: set = set()
+        self.ops: Dict[str, Callable[..., Awaitable[Any]]] = {
+            "authorize": self._authorize,
+            "identify": self._identify,
+            "submit": self._submit,
+            "wait": gateway.wait_result,
+            "get_status": gateway.get_status,
+            "batch_status": gateway.batch_status,
+            "list_jobs": gateway.list_jobs,
+            "usage": gateway.usage,
+            "queue_summary": gateway.queue_summary,
+            "node_timings": gateway.template_node_timings,
+            "idempotency_claim": gateway.idempotency.claim,
+            "idempotency_complete": gateway.idempotency.complete,
+            "idempotency_release": gateway.idempotency.release,
+            "health": gateway.health,
+            "readiness": gateway.readiness,
+            "metrics": gateway.render_metrics,
+        }
+
+    async def start(self):
+        if self.path.exists():
+            self.path.unlink()
+        self._server = await asyncio.start_unix_server(self._handle, path=str(self.path), limit=MAX_MESSAGE_BYTES)
+        os.chmod(self.path, 0o600)
+        logger.info(f"进程间通信已启动: {self.path}")
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.path.exists():
+            self.path.unlink()
+
+    async def _authorize(self, api_key: Optional[str]) -> str:
+        return self.gateway.authorize_key(api_key)
+
+    async def _identify(self, api_key: Optional[str]) -> str:
+        return self.gateway.identify_key(api_key)
+
+    async def _submit(
+        self,
+        template: str,
+        params: Dict[str, Any],
+        tenant: str,
+        priority: str,
+        traceparent: Optional[str] = None
+    ) -> str:
+        request = self.gateway.registry.get(template).request_model.model_validate(params)
+        # 任务的 span 挂在工作进程中 HTTP 请求的 span 下
+        token = use_parent(parse_traceparent(traceparent))
+        try:
+            return await self.gateway.submit(template, request, tenant=tenant, priority=priority)
+        finally:
+            reset_parent(token)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # 工作进程断开时取消它尚未完成的请求（如同步等待）
+        tasks: set = set()
+        lock = asyncio.Lock()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                task = asyncio.create_task(self._dispatch(json.loads(line), writer, lock))
+                for group in (tasks, self._tasks):
+                    group.add(task)
+                    task.add_done_callback(group.discard)
+        except (ConnectionError, ValueError) as e:
+            logger.warning(f"工作进程连接异常: {e}")
+        finally:
+            for task in list(tasks):
+                task.cancel()
+            writer.close()
+
+    async def _dispatch(self, message: Dict[str, Any], writer: asyncio.StreamWriter, lock: asyncio.Lock):
+        op = message.get("op")
+        try:
+            handler = self.ops.get(op)
+            if handler is None:
+                raise HTTPException(status_code=400, detail=f"未知的进程间请求: {op}")
+            reply = {"id": message["id"], "result": await handler(**(message.get("args") or {}))}
+        except HTTPException as e:
+            reply = {
+                "id": message["id"],
+                "error": {"status_code": e.status_code, "detail": e.detail, "headers": e.headers}
+            }
+        except Exception as e:
+            logger.error(f"处理工作进程请求 {op} 失败: {e}")
+            reply = {"id": message["id"], "error": {"status_code": 500, "detail": str(e), "headers": None}}
+
+        async with lock:
+            try:
+                writer.write(_encode(reply))
+                await writer.drain()
+            except ConnectionError:
+                pass
+
+
+class IpcClient:
+    """工作进程：与主进程之间的单个长连接，多个请求复用，断开后下次请求时重连"""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._ids = itertools.count(1)
+        self._lock: Optional[asyncio.Lock] = None
+
+    async def start(self):
+        self._lock = asyncio.Lock()
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            await asyncio.gather(self._reader_task, return_exceptions=True)
+            self._reader_task = None
+
+    @staticmethod
+    def unavailable(reason: Any) -> HTTPException:
+        return HTTPException(
+            status_code=503,
+            detail=f"网关主进程不可用: {reason}",
+            headers={"Retry-After": "5"}
+        )
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_unix_connection(str(self.path), limit=MAX_MESSAGE_BYTES)
+        self._writer = writer
+        self._reader_task = asyncio.create_task(self._read_loop(reader))
+
+    async def _read_loop(self, reader: asyncio.StreamReader):
+        error: Exception = ConnectionResetError("连接已断开")
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                reply = json.loads(line)
+                future = self._pending.get(reply["id"])
+                if future is not None and not future.done():
+                    future.set_result(reply)
+        except (ConnectionError, ValueError) as e:
+            error = ConnectionResetError(str(e))
+        finally:
+            self._writer = None
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(error)
+
+    async def call(self, op: str, **args) -> Any:
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            async with self._lock:
+                if self._writer is None:
+                    await self._connect()
+                self._writer.write(_encode({"id": request_id, "op": op, "args": args}))
+                await self._writer.drain()
+            reply = await future
+        except (ConnectionError, OSError) as e:
+            logger.error(f"请求网关主进程失败（{op}）: {e}")
+            raise self.unavailable(e)
+        finally:
+            self._pending.pop(request_id, None)
+
+        error = reply.get("error")
+        if error is not None:
+            raise HTTPException(**error)
+        return reply["result"]
+
+
+class RemoteIdempotency:
+    """工作进程中的幂等键存储：转发给主进程（重试的请求可能落到其它工作进程）"""
+
+    def __init__(self, ipc: IpcClient):
+        self.ipc = ipc
+
+    async def claim(self, tenant: str, key: str, fingerprint: str) -> Optional[str]:
+        return await self.ipc.call("idempotency_claim", tenant=tenant, key=key, fingerprint=fingerprint)
+
+    async def complete(self, tenant: str, key: str, prompt_id: str):
+        await self.ipc.call("idempotency_complete", tenant=tenant, key=key, prompt_id=prompt_id)
+
+    async def release(self, tenant: str, key: str):
+        await self.ipc.call("idempotency_release", tenant=tenant, key=key)
+
+
+class WorkerGateway:
+    """
+    工作进程中的网关：接口与 Gateway 相同，供 create_gateway_app / create_service_app 使用
+
+    任务相关的操作都转发给主进程；图片上传和提示词优化不涉及任务状态，在工作进程内直接完成
+    """
+
+    def __init__(self, config: GatewayConfig, registry: Optional[WorkflowRegistry] = None):
+        self.config = config
+        self.registry = registry or build_default_registry()
+        self.ipc = IpcClient(config.ipc_socket)
+        self.client = ComfyUIClient(config.comfyui_base_url, name=DEFAULT_BACKEND, ws_url=config.comfyui_ws_url)
+        self.uploads = UploadCache()
+        self.resumable_uploads = ResumableUploads.from_config(config)
+        self.idempotency = RemoteIdempotency(self.ipc)
+        self.tracer = Tracer.from_config(config, service="gateway-worker")
+        self.enhancer = MoonshotEnhancer(
+            config.moonshot_api_key,
+            config.moonshot_api_url,
+            config.moonshot_model
+        )
+        # 工作进程的事件循环各自监控，只记录慢回调日志（/metrics 导出的是主进程的指标）
+        self.loop_monitor = LoopMonitor(slow_threshold=config.slow_callback_threshold)
+        # 本进程的同步等待计数：收到 SIGTERM 后等这些请求拿到结果再退出
+        self.drain_gate = DrainGate(name=f"工作进程 {os.getpid()} ")
+
+    async def start(self):
+        self.drain_gate.open()
+        self.tracer.start()
+        await self.loop_monitor.start()
+        await self.ipc.start()
+
+    async def stop(self):
+        await self.ipc.close()
+        await self.loop_monitor.stop()
+        await self.client.close()
+        await self.enhancer.close()
+        await self.tracer.stop()
+        offload_pool.shutdown()
+
+    @property
+    def draining(self) -> bool:
+        return self.drain_gate.draining
+
+    async def drain(self, timeout: float):
+        await self.drain_gate.drain(timeout)
+
+    async def authorize(self, request: Request) -> str:
+        self.drain_gate.check_accepting()
+        return await self.ipc.call("authorize", api_key=request_api_key(request))
+
+    async def identify(self, request: Request) -> str:
+        return await self.ipc.call("identify", api_key=request_api_key(request))
+
+    def resolve_priority(self, request: Request, default: str = PRIORITY_ASYNC) -> str:
+        return resolve_priority(request, default)
+
+    async def submit(
+        self,
+        template_name: str,
+        request: BaseModel,
+        tenant: str = DEFAULT_TENANT,
+        priority: str = PRIORITY_ASYNC
+    ) -> str:
+        self.drain_gate.check_accepting()
+        return await self.ipc.call(
+            "submit",
+            template=template_name,
+            params=request.model_dump(mode="json"),
+            tenant=tenant,
+            priority=priority,
+            traceparent=Tracer.current().traceparent if Tracer.current() is not None else None
+        )
+
+    async def wait_result(self, prompt_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        return await self.drain_gate.guard(self.ipc.call("wait", prompt_id=prompt_id, timeout=timeout), prompt_id)
+
+    async def upload_image(self, file_content: bytes, filename: str) -> str:
+        """上传图片到 ComfyUI（文件名由内容摘要决定，各进程上传同一图片得到相同的文件名）"""
+        try:
+            return await self.uploads.upload(self.client, file_content, filename)
+        except httpx.HTTPError as e:
+            logger.error(f"上传图片失败: {e}")
+            raise HTTPException(status_code=500, detail=f"上传图片失败: {str(e)}")
+
+    async def get_status(self, prompt_id: str, template_name: Optional[str] = None) -> Dict[str, Any]:
+        return await self.ipc.call("get_status", prompt_id=prompt_id, template_name=template_name)
+
+    async def batch_status(self, prompt_ids: List[str]) -> List[Dict[str, Any]]:
+        return await self.ipc.call("batch_status", prompt_ids=prompt_ids)
+
+    async def list_jobs(self, tenant: str, **filters) -> Dict[str, Any]:
+        return await self.ipc.call("list_jobs", tenant=tenant, **filters)
+
+    async def usage(self, tenant: str, days: int = 30) -> Dict[str, Any]:
+        return await self.ipc.call("usage", tenant=tenant, days=days)
+
+    async def queue_summary(self) -> Dict[str, Any]:
+        return await self.ipc.call("queue_summary")
+
+    async def template_node_timings(self, template: str) -> Dict[str, Any]:
+        return await self.ipc.call("node_timings", template=template)
+
+    async def health(self) -> Dict[str, Any]:
+        return await self.ipc.call("health")
+
+    async def readiness(self) -> Dict[str, Any]:
+        if self.draining:
+            return {"ready": False, "backends": {}}
+        try:
+            return await self.ipc.call("readiness")
+        except HTTPException:
+            return {"ready": False, "backends": {}}
+
+    async def render_metrics(self) -> str:
+        return await self.ipc.call("metrics")
+
+    async def artifact(self, prompt_id: str, name: str) -> Path:
+        """产物目录由主进程写入，工作进程直接读取"""
+        return artifact_file(self.config.postprocess_dir, prompt_id, name)
+
+    async def profile(self, seconds: float) -> str:
+        """采样的是处理该请求的工作进程"""
+        if not self.config.debug_profile:
+            raise HTTPException(status_code=404, detail="未启用采样分析（[gateway] debug_profile）")
+        return await asyncio.get_running_loop().run_in_executor(None, sample_stacks, seconds)
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    """在主进程中绑定监听端口，由工作进程继承后共同 accept"""
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _worker_main(config: GatewayConfig, listeners: List[Tuple[Optional[str], socket.socket]]):
+    """工作进程入口（spawn 启动）"""
+    try:
+        asyncio.run(_serve_worker(config, listeners))
+    except KeyboardInterrupt:
+        pass
+
+
+async def _serve_worker(config: GatewayConfig, listeners: List[Tuple[Optional[str], socket.socket]]):
+    gateway = WorkerGateway(config)
+    servers = []
+    for template_name, sock in listeners:
+        if template_name is None:
+            app = create_gateway_app(gateway, manage_lifecycle=False)
+        else:
+            app = create_service_app(template_name, gateway, manage_lifecycle=False)
+        servers.append((create_server(app), sock))
+    _SharedSignalServer([server for server, _ in servers], gateway).install()
+
+    await gateway.start()
+    try:
+        await asyncio.gather(*(server.serve(sockets=[sock]) for server, sock in servers))
+    finally:
+        await gateway.stop()
+
+
+class WorkerPool:
+    """主进程：启动工作进程，异常退出时重新启动"""
+
+    def __init__(self, config: GatewayConfig, listeners: List[Tuple[Optional[str], socket.socket]]):
+        self.config = config
+        self.listeners = listeners
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * config.workers
+        self._context = multiprocessing.get_context("spawn")
+
+    def _spawn(self, index: int):
+        process = self._context.Process(
+            target=_worker_main,
+            args=(self.config, self.listeners),
+            name=f"gateway-worker-{index}"
+        )
+        process.start()
+        self.processes[index] = process
+        logger.info(f"工作进程 {index} 已启动 (pid {process.pid})")
+
+    def start(self):
+        for index in range(len(self.processes)):
+            self._spawn(index)
+
+    def respawn(self):
+        for index, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                logger.warning(f"工作进程 {index} (pid {process.pid}) 异常退出，退出码 {process.exitcode}，重新启动")
+                self._spawn(index)
+
+    def signal(self, sig: int):
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                os.kill(process.pid, sig)
+
+    def join(self, timeout: float):
+        """等待工作进程退出，超时后强制结束"""
+        deadline = time.monotonic() + timeout
+        for process in self.processes:
+            if process is not None:
+                process.join(max(deadline - time.monotonic(), 0))
+        for process in self.processes:
+            if process is not None and process.is_alive():
+                logger.warning(f"工作进程 pid {process.pid} 未按时退出，强制结束")
+                process.kill()
+                process.join()
+
+
+async def serve_workers(config: GatewayConfig):
+    """
+    多进程模式
+
+    主进程绑定端口并运行 Gateway，工作进程处理 HTTP 请求。收到 SIGTERM 后：
+    主进程拒绝新任务 → 通知工作进程排空（等待同步请求拿到结果）→ 工作进程全部退出后停止网关
+    """
+    gateway = Gateway(config)
+    listeners: List[Tuple[Optional[str], socket.socket]] = [(None, bind_socket(config.host, config.port))]
+    if config.serve_legacy_ports:
+        for template in gateway.registry:
+            if template.legacy_port:
+                listeners.append((template.name, bind_socket(config.host, template.legacy_port)))
+
+    ipc = IpcServer(gateway, config.ipc_socket)
+    pool = WorkerPool(config, listeners)
+    loop = asyncio.get_running_loop()
+    stopping = asyncio.Event()
+
+    def handle_exit(sig: int):
+        if stopping.is_set():
+            if sig == signal.SIGINT:
+                logger.warning("再次收到退出信号，立即停止工作进程")
+                pool.signal(signal.SIGKILL)
+            return
+        logger.info(f"收到退出信号，通知 {config.workers} 个工作进程排空")
+        stopping.set()
+
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, handle_exit, sig)
+
+    # 工作进程的解释器启动和模块导入与主进程启动网关同时进行；
+    # 主进程就绪前工作进程收到的请求返回 503（进程间通信尚不可用）
+    pool.start()
+    try:
+        try:
+            await gateway.start()
+        except BaseException:
+            # 模板或配置错误：结束已启动的工作进程
+            pool.signal(signal.SIGTERM)
+            await loop.run_in_executor(None, pool.join, 10)
+            raise
+        await ipc.start()
+        while not stopping.is_set():
+            try:
+                await asyncio.wait_for(stopping.wait(), RESPAWN_DELAY)
+            except asyncio.TimeoutError:
+                pool.respawn()
+
+        gateway.begin_drain()
+        pool.signal(signal.SIGTERM)
+        # 工作进程排空期间主进程继续处理它们的状态查询和同步等待
+        await loop.run_in_executor(None, pool.join, config.drain_timeout + 10)
+    finally:
+        await ipc.stop()
+        await gateway.stop()
+        for _, sock in listeners:
+            sock.close()
@@ -0,0 +1,464 @@
+"""
+工作流模板注册表
+每个模板以声明方式描述：请求参数到节点输入的绑定、输出提取规则和兼容路由信息
+"""
+
+import json
+import logging
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple, Type
+
+from pydantic import BaseModel
+
+from api_models import ImageGenerationRequest, VideoGenerationRequest, Wan22VideoGenerationRequest
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent
+
+
+class Binding(NamedTuple):
+    """请求字段 -> (节点, 输入名, 转换函数)"""
+    field: str
+    node_id: str
+    input_name: str
+    transform: Optional[Callable[[Any], Any]] = None
+
+
+class OutputSpec(NamedTuple):
+    """输出提取规则：读取 class_type 类型节点输出中的 key 列表，并标注格式"""
+    key: str
+    format: Optional[str] = None
+    # 从输出条目中读取格式的字段名，读取不到时使用 format
+    format_field: Optional[str] = None
+    # 产生该输出的节点类型（SaveImage、VHS_VideoCombine 等）
+    class_type: Optional[str] = None
+
+
+class OutputFile(NamedTuple):
+    """一个输出文件"""
+    filename: str
+    subfolder: str
+    type: str
+    format: Optional[str]
+
+    def describe(self, view_url: Callable[..., str]) -> Dict[str, Any]:
+        """状态响应中的输出描述"""
+        descriptor: Dict[str, Any] = {"filename": self.filename, "subfolder": self.subfolder, "type": self.type}
+        if self.format is not None:
+            descriptor["format"] = self.format
+        descriptor["url"] = view_url(self.filename, self.subfolder, self.type)
+        return descriptor
+
+
+class OutputMap:
+    """
+    预编译的输出节点表
+
+    加载模板时按 class_type 找出输出节点（如节点 76 - SaveImage、节点 28 - SaveAnimatedWEBP、
+    节点 47 - SaveWEBM），提取输出时只读取这些节点；输出节点都没有结果时（如工作流被改动过）
+    退回到按 key 遍历全部节点
+    """
+
+    def __init__(self, workflow: Dict[str, Any], specs: List[OutputSpec]):
+        self.specs = specs
+        nodes: Dict[str, Tuple[OutputSpec, ...]] = {}
+        for node_id, node in workflow.items():
+            matched = tuple(spec for spec in specs if spec.class_type == node.get("class_type"))
+            if matched:
+                nodes[node_id] = matched
+        missing = {spec.class_type for spec in specs if spec.class_type is not None} - {
+            workflow[node_id].get("class_type") for node_id in nodes
+        }
+        if missing:
+            raise ValueError(f"工作流中没有输出节点: {', '.join(sorted(missing))}")
+        self.nodes = nodes
+        # 退回遍历全部节点时每个 key 只按第一条规则提取
+        fallback: Dict[str, OutputSpec] = {}
+        for spec in specs:
+            fallback.setdefault(spec.key, spec)
+        self.fallback = tuple(fallback.values())
+
+    def extract(self, outputs: Dict[str, Any]) -> List[OutputFile]:
+        files: List[OutputFile] = []
+        for node_id, specs in self.nodes.items():
+            node_output = outputs.get(node_id)
+            if node_output:
+                _collect(files, node_output, specs)
+        if not files and outputs:
+            for node_output in outputs.values():
+                _collect(files, node_output, self.fallback)
+        return files
+
+
+def _collect(files: List[OutputFile], node_output: Dict[str, Any], specs: Tuple[OutputSpec, ...]):
+    for spec in specs:
+        for item in node_output.get(spec.key) or ():
+            fmt = item.get(spec.format_field, spec.format) if spec.format_field else spec.format
+            files.append(OutputFile(item.get("filename"), item.get("subfolder", ""), item.get("type", "output"), fmt))
+
+
+def fan_out(
+    field: str,
+    node_ids: Tuple[str, ...],
+    input_name: str,
+    transform: Optional[Callable[[Any], Any]] = None
+) -> List[Binding]:
+    """同一个请求字段写入多个节点（如两阶段采样器共用的 steps / cfg / 种子）"""
+    return [Binding(field, node_id, input_name, transform) for node_id in node_ids]
+
+
+class BindingTable:
+    """
+    预编译的参数绑定表
+
+    加载模板时校验每个绑定（节点存在、输入存在且不是节点连接、请求字段存在），
+    并按字段分组。准备工作流时只复制被绑定节点的 inputs，其余节点与模板共享，
+    一次遍历写入全部参数；同一字段（如种子）只计算一次再分发到所有目标节点。
+    """
+
+    def __init__(
+        self,
+        workflow: Dict[str, Any],
+        bindings: List[Binding],
+        request_model: Optional[Type[BaseModel]] = None
+    ):
+        self.workflow = workflow
+        errors = []
+        slots: Dict[str, int] = {}
+        groups: Dict[Tuple[str, Optional[Callable[[Any], Any]]], List[Tuple[int, str]]] = {}
+        seen = set()
+
+        for binding in bindings:
+            where = f"{binding.field} -> {binding.node_id}.{binding.input_name}"
+            node = workflow.get(binding.node_id)
+            if node is None:
+                errors.append(f"{where}: 节点不存在")
+                continue
+            inputs = node.get("inputs", {})
+            if binding.input_name not in inputs:
+                errors.append(f"{where}: 节点 {node.get('class_type')} 没有该输入")
+                continue
+            if isinstance(inputs[binding.input_name], list):
+                errors.append(f"{where}: 该输入是节点连接，不能绑定参数")
+                continue
+            if request_model is not None and binding.field not in request_model.model_fields:
+                errors.append(f"{where}: 请求模型 {request_model.__name__} 没有该字段")
+                continue
+            if (binding.node_id, binding.input_name) in seen:
+                errors.append(f"{where}: 重复绑定")
+                continue
+            seen.add((binding.node_id, binding.input_name))
+
+            slot = slots.setdefault(binding.node_id, len(slots))
+            groups.setdefault((binding.field, binding.transform), []).append((slot, binding.input_name))
+
+        if errors:
+            raise ValueError("工作流参数绑定校验失败:\n  " + "\n  ".join(errors))
+
+        self.node_ids: Tuple[str, ...] = tuple(slots)
+        self.entries = tuple(
+            (field, transform, tuple(targets))
+            for (field, transform), targets in groups.items()
+        )
+        self.target_count = len(seen)
+        # (节点, 输入名) -> 请求字段名，校验失败时用于定位用户参数
+        self.labels: Dict[Tuple[str, str], str] = {
+            (binding.node_id, binding.input_name): binding.field for binding in bindings
+        }
+
+    def apply(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """生成本次请求的工作流（未绑定节点与模板共享，调用方不得修改）"""
+        workflow = self.workflow
+        overlay = dict(workflow)
+        slots = []
+        for node_id in self.node_ids:
+            node = dict(workflow[node_id])
+            inputs = dict(node["inputs"])
+            node["inputs"] = inputs
+            overlay[node_id] = node
+            slots.append(inputs)
+
+        for field, transform, targets in self.entries:
+            value = params[field]
+            if transform is not None:
+                value = transform(value)
+            for slot, input_name in targets:
+                slots[slot][input_name] = value
+
+        return overlay
+
+
+def random_seed() -> int:
+    """未指定种子时生成随机种子"""
+    return int(time.time() * 1000000) % (2**32)
+
+
+class WorkflowTemplate:
+    """工作流模板"""
+
+    def __init__(
+        self,
+        name: str,
+        title: str,
+        template_path: Path,
+        request_model: Type[BaseModel],
+        bindings: List[Binding],
+        outputs: List[OutputSpec],
+        kind: str,
+        result_key: str,
+        seed_field: Optional[str] = None,
+        legacy_prefix: str = "",
+        legacy_port: Optional[int] = None,
+        form_defaults: Optional[Dict[str, Any]] = None,
+        sync_timeout: int = 300,
+        messages: Optional[Dict[str, str]] = None,
+        service_info: Optional[Dict[str, Any]] = None,
+        extra_routes: Optional[List[str]] = None,
+        cost_prior: float = 60.0
+    ):
+        self.name = name
+        self.title = title
+        self.template_path = Path(template_path)
+        self.request_model = request_model
+        self.bindings = bindings
+        self.outputs = outputs
+        # text2image: JSON 请求；image2video: 需要上传图片
+        self.kind = kind
+        # 状态响应中输出列表的字段名（images / videos）
+        self.result_key = result_key
+        self.seed_field = seed_field
+        self.legacy_prefix = legacy_prefix
+        self.legacy_port = legacy_port
+        self.form_defaults = form_defaults or {}
+        self.sync_timeout = sync_timeout
+        self.messages = messages or {}
+        self.service_info = service_info or {}
+        self.extra_routes = extra_routes or []
+        # 默认参数下的预估执行时间（秒），积累实际耗时数据前使用
+        self.cost_prior = cost_prior
+        self._workflow: Optional[Dict[str, Any]] = None
+        self._table: Optional[BindingTable] = None
+        self._output_map: Optional[OutputMap] = None
+
+    def load(self) -> Dict[str, Any]:
+        """加载工作流模板（只在首次使用时读取文件）"""
+        if self._workflow is None:
+            try:
+                with open(self.template_path, 'r', encoding='utf-8') as f:
+                    self._workflow = json.load(f)
+            except Exception as e:
+                logger.error(f"加载工作流模板失败: {e}")
+                raise RuntimeError(f"无法加载工作流模板: {e}")
+        return self._workflow
+
+    def resolve_params(self, request: BaseModel) -> Dict[str, Any]:
+        """请求模型 -> 参数字典，并补全随机种子"""
+        params = request.model_dump()
+        if self.seed_field and not params.get(self.seed_field):
+            params[self.seed_field] = random_seed()
+        return params
+
+    def default_params(self) -> Dict[str, Any]:
+        """请求模型中有默认值的参数"""
+        return {
+            name: field.default
+            for name, field in self.request_model.model_fields.items()
+            if not field.is_required()
+        }
+
+    def workload(self, params: Dict[str, Any]) -> Tuple[int, int]:
+        """任务工作量：(宽×高×帧数, 步数)，图片按 1 帧计算"""
+        pixels = int(params.get("width") or 0) * int(params.get("height") or 0) * int(params.get("length") or 1)
+        return pixels, int(params.get("steps") or 1)
+
+    @property
+    def binding_table(self) -> "BindingTable":
+        if self._table is None:
+            self._table = BindingTable(self.load(), self.bindings, self.request_model)
+        return self._table
+
+    @property
+    def output_map(self) -> "OutputMap":
+        if self._output_map is None:
+            self._output_map = OutputMap(self.load(), self.outputs)
+        return self._output_map
+
+    def compile(self):
+        """加载模板并编译绑定表和输出节点表（启动时调用，配置错误立即暴露）"""
+        table = self.binding_table
+        output_nodes = ", ".join(self.output_map.nodes)
+        logger.info(
+            f"模板 {self.name} 已编译: {len(table.node_ids)} 个节点, {table.target_count} 个绑定, "
+            f"输出节点 {output_nodes}"
+        )
+
+    def prepare(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """根据请求参数准备工作流"""
+        return self.binding_table.apply(params)
+
+    def extract_outputs(self, outputs: Dict[str, Any], view_url: Callable[..., str]) -> List[Dict[str, Any]]:
+        """从 ComfyUI 历史记录的 outputs 中提取输出文件信息（每个任务只调用一次，结果保存在任务中）"""
+        return [output.describe(view_url) for output in self.output_map.extract(outputs)]
+
+
+class WorkflowRegistry:
+    """模板注册表"""
+
+    def __init__(self):
+        self._templates: Dict[str, WorkflowTemplate] = {}
+
+    def register(self, template: WorkflowTemplate) -> WorkflowTemplate:
+        if template.name in self._templates:
+            raise ValueError(f"模板已注册: {template.name}")
+        self._templates[template.name] = template
+        return template
+
+    def get(self, name: str) -> WorkflowTemplate:
+        try:
+            return self._templates[name]
+        except KeyError:
+            raise KeyError(f"未知的工作流模板: {name}")
+
+    def names(self) -> List[str]:
+        return list(self._templates)
+
+    def __iter__(self):
+        return iter(self._templates.values())
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._templates
+
+
+QWEN_IMAGE = WorkflowTemplate(
+    name="qwen_image",
+    title="ComfyUI Qwen Image API",
+    template_path=BASE_DIR / "L3_Qwen_Image.json",
+    request_model=ImageGenerationRequest,
+    kind="text2image",
+    result_key="images",
+    seed_field="seed",
+    bindings=[
+        # 提示词（节点 6）
+        Binding("prompt", "6", "text"),
+        # 采样参数（节点 3 - KSampler）
+        Binding("seed", "3", "seed"),
+        Binding("steps", "3", "steps"),
+        Binding("cfg", "3", "cfg"),
+        Binding("sampler_name", "3", "sampler_name"),
+        Binding("scheduler", "3", "scheduler"),
+        # 图片尺寸（节点 58 - EmptySD3LatentImage）
+        Binding("width", "58", "width"),
+        Binding("height", "58", "height"),
+    ],
+    # 节点 76 - SaveImage
+    outputs=[OutputSpec("images", class_type="SaveImage")],
+    legacy_prefix="/qwen",
+    legacy_port=8000,
+    sync_timeout=300,
+    cost_prior=40.0,
+    messages={
+        "submitted": "图片生成任务已提交，请使用 prompt_id 查询生成状态",
+        "completed": "图片生成完成",
+        "failed": "图片生成失败",
+        "timeout": "图片生成超时",
+        "error": "生成图片失败",
+    },
+)
+
+IMAGE2VIDEO = WorkflowTemplate(
+    name="image2video",
+    title="ComfyUI Image to Video API",
+    template_path=BASE_DIR / "workflows" / "Image_2_Video_KSampler_Advanced.json",
+    request_model=VideoGenerationRequest,
+    kind="image2video",
+    result_key="videos",
+    seed_field="noise_seed",
+    bindings=[
+        # 正向提示词（节点 6）
+        Binding("prompt", "6", "text"),
+        # 图片文件名（节点 52 - LoadImage）
+        Binding("image_filename", "52", "image"),
+        # 视频参数（节点 50 - WanImageToVideo）
+        Binding("width", "50", "width"),
+        Binding("height", "50", "height"),
+        Binding("length", "50", "length"),
+        # 两阶段采样器（节点 57 / 58 - KSamplerAdvanced），只有第一阶段加噪需要种子
+        *fan_out("steps", ("57", "58"), "steps"),
+        *fan_out("cfg", ("57", "58"), "cfg"),
+        Binding("noise_seed", "57", "noise_seed"),
+        # 输出帧率（节点 28 - SaveAnimatedWEBP，节点 47 - SaveWEBM）
+        Binding("fps", "28", "fps"),
+        Binding("fps", "47", "fps", float),
+    ],
+    # 节点 28 - SaveAnimatedWEBP，节点 47 - SaveWEBM（不同版本的 ComfyUI 写在 images 或 gifs 中）
+    outputs=[
+        OutputSpec("images", format="webp", class_type="SaveAnimatedWEBP"),
+        OutputSpec("images", format="webm", class_type="SaveWEBM"),
+        OutputSpec("gifs", format="webm", class_type="SaveWEBM"),
+    ],
+    legacy_prefix="/i2v",
+    legacy_port=8001,
+    form_defaults={"width": 768, "height": 768, "length": 81, "steps": 20, "cfg": 3.5, "fps": 16},
+    sync_timeout=600,
+    cost_prior=240.0,
+    messages={
+        "submitted": "图生视频任务已提交，请使用 prompt_id 查询生成状态",
+        "completed": "视频生成完成",
+        "failed": "视频生成失败",
+        "timeout": "视频生成超时",
+        "error": "生成视频失败",
+    },
+)
+
+WAN22_I2V = WorkflowTemplate(
+    name="wan22_i2v",
+    title="ComfyUI Wan2.2 I2V 14B API",
+    template_path=BASE_DIR / "workflows" / "wan2.2_i2v_14b_4.json",
+    request_model=Wan22VideoGenerationRequest,
+    kind="image2video",
+    result_key="videos",
+    seed_field="noise_seed",
+    bindings=[
+        # 正向提示词（节点 6）
+        Binding("prompt", "6", "text"),
+        # 图片文件名（节点 62 - LoadImage）
+        Binding("image_filename", "62", "image"),
+        # 图片调整尺寸（节点 77 - ImageResizeKJv2）
+        Binding("width", "77", "width"),
+        Binding("height", "77", "height"),
+        # 视频长度（节点 63 - WanImageToVideo）
+        Binding("length", "63", "length"),
+        # 两阶段采样器共用同一个种子（节点 57 / 58 - KSamplerAdvanced）
+        *fan_out("steps", ("57", "58"), "steps"),
+        *fan_out("cfg", ("57", "58"), "cfg"),
+        *fan_out("noise_seed", ("57", "58"), "noise_seed"),
+        # 输出帧率（节点 76 - VHS_VideoCombine）
+        Binding("fps", "76", "frame_rate"),
+    ],
+    # 节点 76 - VHS_VideoCombine
+    outputs=[OutputSpec("gifs", format="mp4", format_field="format", class_type="VHS_VideoCombine")],
+    legacy_prefix="/wan22",
+    legacy_port=5014,
+    form_defaults={"width": 1280, "height": 720, "length": 81, "steps": 4, "cfg": 1.0, "fps": 16},
+    sync_timeout=600,
+    cost_prior=90.0,
+    messages={
+        "submitted": "Wan2.2 图生视频任务已提交，请使用 prompt_id 查询生成状态",
+        "completed": "视频生成完成",
+        "failed": "视频生成失败",
+        "timeout": "视频生成超时",
+        "error": "生成视频失败",
+    },
+    service_info={"model": "Wan2.2-I2V-A14B-4steps"},
+    extra_routes=["enhance_prompt"],
+)
+
+
+def build_default_registry() -> WorkflowRegistry:
+    """内置模板：Qwen Image、KSampler-Advanced I2V、Wan2.2 4-step"""
+    registry = WorkflowRegistry()
+    for template in (QWEN_IMAGE, IMAGE2VIDEO, WAN22_I2V):
+        registry.register(template)
+    return registry